@@ -20,21 +20,52 @@ app.autodiscover_tasks()
 
 # 定期タスクの設定
 app.conf.beat_schedule = {
-    # 6時間ごとにファイルスキャンを実行
+    # 6時間ごとにファイルスキャンを実行（差分モード）
     'periodic-file-scan': {
         'task': 'videos.tasks.periodic_scan_task',
         'schedule': crontab(minute=0, hour='*/6'),  # 0:00, 6:00, 12:00, 18:00に実行
     },
+    # 毎日午前2時30分にフルスキャン（差分モードで拾えない上書き変更などの整合性チェック）
+    'daily-full-scan': {
+        'task': 'videos.tasks.periodic_scan_task',
+        'schedule': crontab(hour=2, minute=30),
+        'kwargs': {'full': True},
+    },
     # 毎日午前3時に古いスキャン履歴を削除
     'cleanup-scan-history': {
         'task': 'videos.tasks.cleanup_old_scan_history',
         'schedule': crontab(hour=3, minute=0),
     },
+    # 毎日午前5時に旧方式の指紋を少しずつ再計算
+    'upgrade-fingerprints': {
+        'task': 'videos.tasks.upgrade_fingerprints',
+        'schedule': crontab(hour=5, minute=0),
+    },
+    # 毎日午前5時30分に既存ファイルのストーリーボードを少しずつ生成
+    'generate-missing-storyboards': {
+        'task': 'videos.tasks.generate_missing_storyboards',
+        'schedule': crontab(hour=5, minute=30),
+    },
+    # 3時間ごとにマルチビュー用の軽量プロキシを最近再生されたファイルから生成
+    'generate-proxies': {
+        'task': 'videos.tasks.generate_proxies',
+        'schedule': crontab(minute=45, hour='*/3'),
+    },
+    # 毎日午前1時に MP4 の faststart 判定を埋め、FASTSTART_FIX 設定時は moov を先頭へ移す
+    'fix-faststart': {
+        'task': 'videos.tasks.fix_faststart',
+        'schedule': crontab(hour=1, minute=0),
+    },
     # 毎日午前4時に欠けているサムネイルを生成
     'generate-missing-thumbnails': {
         'task': 'videos.tasks.generate_missing_thumbnails',
         'schedule': crontab(hour=4, minute=0),
     },
+    # 毎日午前3時15分にライブラリの集計値（件数・合計サイズ・合計時間）を数え直す
+    'rebuild-library-counters': {
+        'task': 'videos.tasks.rebuild_library_counters',
+        'schedule': crontab(hour=3, minute=15),
+    },
 }
 
 @app.task(bind=True)
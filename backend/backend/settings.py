@@ -130,6 +130,42 @@ REST_FRAMEWORK = {
     ],
 }
 
+# ファイル一覧（カーソルページネーション）の page_size の上限
+FILE_LIST_MAX_PAGE_SIZE = 500
+
+# ファイル一覧のレスポンスキャッシュ（カタログの世代番号 + 正規化したクエリがキー。ETag / 304 も返す）
+# 世代番号は DB（cache_generations）にあるので、locmem でも別プロセスの書き込みはすぐ反映される。
+# プロセス間でキャッシュの中身も共有したい場合は共有できるものにする
+#   ファイル: "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": <ディレクトリ>
+#   Redis:    "django.core.cache.backends.redis.RedisCache", "LOCATION": "redis://127.0.0.1:6379"
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "file_list": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "file-list",
+        "OPTIONS": {"MAX_ENTRIES": 2000},
+    },
+}
+FILE_LIST_CACHE_ENABLED = True
+FILE_LIST_CACHE_ALIAS = "file_list"
+FILE_LIST_CACHE_TIMEOUT = 300
+# フォルダツリー（同じキャッシュに置く。フォルダ・所属の変更で無効になる）
+FOLDER_TREE_CACHE_TIMEOUT = 600
+
+# ファイル検索。未設定なら MySQL は FULLTEXT（ngram パーサ）、それ以外は部分一致
+# SEARCH_NGRAM_SIZE は MySQL の ngram_token_size に合わせる（これより短い語は部分一致で絞る）
+SEARCH_BACKEND = None
+SEARCH_NGRAM_SIZE = 2
+
+# タグ絞り込み（AND / OR / NOT）のメモリ上のビットマップ索引
+# 別プロセス（Celery のスキャン等）の変更を取り込むため TAG_INDEX_MAX_AGE 秒ごとに作り直す
+# 該当が TAG_INDEX_MAX_IDS 件を超えるときは id リストを渡さずサブクエリで絞る
+TAG_INDEX_ENABLED = True
+TAG_INDEX_MAX_AGE = 300
+TAG_INDEX_MAX_IDS = 20000
+
 # CORS settings
 CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOW_CREDENTIALS = True
@@ -144,10 +180,90 @@ CELERY_TIMEZONE = TIME_ZONE
 
 # File scan settings
 FILE_SCAN_INTERVAL = 6 * 60 * 60  # 6 hours in seconds
+# 定期スキャンは差分モード（スナップショット比較）で行い、この間隔ごとにフルスキャンする
+FULL_SCAN_INTERVAL = 24 * 60 * 60  # 24 hours in seconds
+SCAN_INCREMENTAL = True
+# 差分スキャン用のスナップショット保存先
+SCAN_SNAPSHOT_PATH = os.path.join(BASE_DIR.parent, "cache", "scan_snapshot.json")
+# 取り込みパイプライン（ハッシュ計算 -> ffprobe/サムネイル -> DB 一括書き込み）
+SCAN_HASH_WORKERS = 4  # I/O 待ち主体なのでコア数と無関係に少数並列
+SCAN_MEDIA_WORKERS = os.cpu_count() or 2  # ffprobe/サムネイル生成のプロセスプールの大きさ
+SCAN_QUEUE_SIZE = 64  # 各ステージ間キューの上限（背圧）
+SCAN_WALK_BATCH = 200  # 走査中に見つけた変更をこの件数ごとに取り込みへ回す
+SCAN_DB_BATCH_SIZE = 200  # bulk_create / bulk_update 1 回あたりの件数
+# ファイル監視（watchdog）。有効時は新規ファイルを数秒で取り込み、定期スキャンは
+# FULL_SCAN_INTERVAL ごとの整合性チェックのみになる
+FILE_WATCH_ENABLED = True
+FILE_WATCH_DEBOUNCE = 5.0  # 秒。サイズがこの時間変化しなくなったらコピー完了とみなす
+FILE_WATCH_POLLING = False  # NAS（SMB/NFS）などネイティブ通知が届かない場合は True
+# 変更ファイルがこれより多い場合は既存レコードを全件先読みする（少なければ IN 句で該当分のみ）
+SCAN_PRELOAD_THRESHOLD = 2000
+
+# ファイル指紋（md5_hash）: 先頭・等間隔・末尾から FINGERPRINT_SAMPLES 個のブロックを読む
+FINGERPRINT_SAMPLES = 9
+FINGERPRINT_BLOCK_SIZE = 64 * 1024
+
+# 重複検出（サイズ -> 指紋 -> 全体ハッシュ）
+DEDUP_HASH_WORKERS = 4  # 指紋の再計算・全体ハッシュを並列計算するスレッド数
 
 # FFmpeg settings
 FFMPEG_BINARY = "ffmpeg"  # Assumes ffmpeg is in PATH
 
+# 取り込み時に生成する派生ファイル（1 回のデコードから split で同時生成）
+#   "thumbnail"（単枚 WebP） / "preview"（アニメーション GIF） / "storyboard"（シーク用スプライト）
+INGEST_ARTIFACTS = ("thumbnail", "storyboard")
+# サムネイルの位置: "representative" は長さの THUMBNAIL_POSITIONS（割合）付近のキーフレーム、
+# "first" は従来どおり先頭フレーム
+THUMBNAIL_MODE = "representative"
+THUMBNAIL_POSITIONS = (0.1, 0.5, 0.3)  # 優先順
+THUMBNAIL_SCORE_CANDIDATES = True  # 候補を採点して暗転・単色画面を避ける（派生ファイルと同じ ffmpeg 実行内で採点用の縮小フレームも出す）
+# ストーリーボード: STORYBOARD_INTERVAL 秒ごとのフレームを COLUMNS x ROWS 枚ずつ 1 シートに並べる
+STORYBOARD_INTERVAL = 10
+STORYBOARD_COLUMNS = 5
+STORYBOARD_ROWS = 5
+STORYBOARD_TILE_WIDTH = 160
+
+# 動画配信（/api/files/<id>/stream/）
+STREAM_CHUNK_SIZE = 512 * 1024  # ASGI で非同期に読み出す 1 チャンクのバイト数
+STREAM_MAX_RANGES = 16  # multipart/byteranges で個別に返すレンジ数の上限
+# リバースプロキシへの配信委譲: "" (Django が直接送る) / "x-accel-redirect" (nginx) / "x-sendfile" (Apache, lighttpd)
+MEDIA_OFFLOAD = ""
+# x-accel-redirect 用。nginx 側で MEDIA_ROOT を alias した internal location
+MEDIA_OFFLOAD_ACCEL_PREFIX = "/protected-media/"
+
+# MKV / AVI / WMV / FLV の fragmented MP4 への詰め替え（/api/files/<id>/remux/）
+REMUX_EXTS = (".mkv", ".avi", ".wmv", ".flv")
+REMUX_VIDEO_CODECS = ("h264", "vp9", "av1")  # コピーでブラウザ再生できる映像コーデック
+REMUX_AUDIO_CODECS = ("aac", "mp3", "opus", "flac")
+REMUX_TRANSCODE_AUDIO = True  # 音声だけ非対応（WMA など）なら音声のみ AAC に変換する
+# MEDIA_ROOT 配下に置くので MEDIA_OFFLOAD（nginx の internal location）からもそのまま配信できる
+REMUX_CACHE_DIR = os.path.join(MEDIA_ROOT, "remux")
+REMUX_CACHE_MAX_BYTES = 20 * 1024 ** 3  # 超えたら最終アクセスの古いものから削除
+
+# HLS（/api/files/<id>/hls/master.m3u8）。セグメントは初回要求時に CPU の ffmpeg で生成
+HLS_SEGMENT_SECONDS = 6
+HLS_LADDER = ((1080, 5_000_000), (720, 2_800_000), (480, 1_400_000), (360, 800_000))  # (高さ, 映像 bps)
+HLS_X264_PRESET = "veryfast"
+HLS_MAX_TRANSCODES = None  # 同時に走らせる変換数（None なら CPU コア数の半分）
+HLS_CACHE_DIR = os.path.join(MEDIA_ROOT, "hls")
+HLS_CACHE_MAX_BYTES = 10 * 1024 ** 3
+
+# マルチビュー用の軽量プロキシ（/api/files/<id>/stream/?quality=proxy）。generate_proxies タスクで生成
+PROXY_HEIGHT = 360
+PROXY_CRF = 28
+PROXY_MAX_BITRATE = "600k"
+PROXY_BUFSIZE = "1200k"
+PROXY_X264_PRESET = "veryfast"
+PROXY_THREADS = 2  # バックグラウンド生成が再生を邪魔しないよう控えめに
+PROXY_CACHE_DIR = os.path.join(MEDIA_ROOT, "proxy")
+PROXY_CACHE_MAX_BYTES = 5 * 1024 ** 3  # 一杯なら最近再生されたファイルを優先して入れ替える
+
+# moov が末尾にある MP4 の faststart 化（fix_faststart タスク、ストリームコピーのみ）
+# "" = 判定・記録のみ / "cache" = faststart 版を別に作って配信時に差し替え / "rewrite" = 元ファイルを置き換え
+FASTSTART_FIX = ""
+FASTSTART_CACHE_DIR = os.path.join(MEDIA_ROOT, "faststart")
+FASTSTART_CACHE_MAX_BYTES = 50 * 1024 ** 3
+
 # Logging configuration
 LOGGING = {
     "version": 1,
@@ -5,6 +5,8 @@ Django admin configuration for videos app.
 from django.contrib import admin
 from django.utils.html import format_html
 from .models import File, Folder, Tag, Group, ScanHistory
+from .tagfilter import file_index
+from . import counters, listcache
 
 
 @admin.register(File)
@@ -13,11 +15,11 @@ class FileAdmin(admin.ModelAdmin):
     list_filter = ['delete_flag', 'duplicate_flag', 'created_at', 'folders']
     search_fields = ['file_name', 'md5_hash']
     filter_horizontal = ['folders', 'tags']
-    readonly_fields = ['file_path', 'md5_hash', 'file_size', 'video_duration', 'width', 'height', 'fps', 'codec', 'bitrate', 'created_at', 'updated_at']
+    readonly_fields = ['file_path', 'md5_hash', 'content_hash', 'file_size', 'video_duration', 'width', 'height', 'fps', 'codec', 'bitrate', 'created_at', 'updated_at']
     
     fieldsets = (
         ('基本情報', {
-            'fields': ('file_name', 'file_path', 'file_size', 'md5_hash')
+            'fields': ('file_name', 'file_path', 'file_size', 'md5_hash', 'content_hash')
         }),
         ('動画情報', {
             'fields': ('video_duration', 'width', 'height', 'fps', 'codec', 'bitrate')
@@ -67,19 +69,31 @@ class FileAdmin(admin.ModelAdmin):
     
     def mark_as_deleted(self, request, queryset):
         """選択したファイルに削除フラグを設定"""
-        updated = queryset.update(delete_flag=True)
+        ids = list(queryset.values_list('id', flat=True))
+        with counters.tracking(ids):
+            updated = queryset.update(delete_flag=True)
+        file_index.update_flags(ids, deleted=True)
+        listcache.bump()
         self.message_user(request, f"{updated}個のファイルに削除フラグを設定しました。")
     mark_as_deleted.short_description = "削除フラグを設定"
     
     def restore_files(self, request, queryset):
         """選択したファイルの削除フラグを解除"""
-        updated = queryset.update(delete_flag=False)
+        ids = list(queryset.values_list('id', flat=True))
+        with counters.tracking(ids):
+            updated = queryset.update(delete_flag=False)
+        file_index.update_flags(ids, deleted=False)
+        listcache.bump()
         self.message_user(request, f"{updated}個のファイルの削除フラグを解除しました。")
     restore_files.short_description = "削除フラグを解除"
     
     def mark_as_duplicate(self, request, queryset):
         """選択したファイルに重複フラグを設定"""
-        updated = queryset.update(duplicate_flag=True)
+        ids = list(queryset.values_list('id', flat=True))
+        with counters.tracking(ids):
+            updated = queryset.update(duplicate_flag=True)
+        file_index.update_flags(ids, duplicate=True)
+        listcache.bump()
         self.message_user(request, f"{updated}個のファイルに重複フラグを設定しました。")
     mark_as_duplicate.short_description = "重複フラグを設定"
 
@@ -133,9 +147,9 @@ class GroupAdmin(admin.ModelAdmin):
 
 @admin.register(ScanHistory)
 class ScanHistoryAdmin(admin.ModelAdmin):
-    list_display = ['started_at', 'status_display', 'files_scanned', 'files_added', 'duplicates_found', 'duration_display']
-    list_filter = ['status', 'started_at']
-    readonly_fields = ['started_at', 'completed_at', 'status', 'files_scanned', 'files_added', 'files_updated', 'duplicates_found', 'errors']
+    list_display = ['started_at', 'status_display', 'scan_mode', 'files_scanned', 'files_added', 'snapshot_hits', 'duplicates_found', 'duration_display']
+    list_filter = ['status', 'scan_mode', 'started_at']
+    readonly_fields = ['started_at', 'completed_at', 'status', 'scan_mode', 'files_scanned', 'files_added', 'files_updated', 'duplicates_found', 'files_vanished', 'dirs_skipped', 'snapshot_hits', 'errors']
     
     def status_display(self, obj):
         """ステータスを色付きで表示"""
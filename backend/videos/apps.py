@@ -145,6 +145,13 @@ class VideosConfig(AppConfig):
     # - DB が未準備なら post_migrate で開始するよう接続
     # ------------------------------------------------------------------
     def ready(self):
+        # 検索用テキスト・タグ索引・一覧とフォルダツリーのキャッシュ・ライブラリ集計の更新（シグナル受信）はどのプロセスでも必要
+        from . import search  # noqa: F401
+        from . import tagfilter  # noqa: F401
+        from . import listcache  # noqa: F401
+        from . import foldertree  # noqa: F401
+        from . import counters  # noqa: F401
+
         # 開発サーバのリロード子プロセスでは実行しない（重複防止）
         if os.environ.get('RUN_MAIN') != 'true':
             return
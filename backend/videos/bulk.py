@@ -0,0 +1,174 @@
+# backend/videos/bulk.py
+"""
+Set-based bulk flag / tag / folder mutations.
+
+一括操作の対象（File の QuerySet。id 指定でも一覧と同じ filter でもよい）は id のサブクエリにして
+UPDATE / 中間テーブルへの INSERT ... SELECT / DELETE にそのまま渡す。対象の id を Python に
+読み出して IN (...) に並べ直すことはしない（ライブラリが大きいと IN のリストに上限がなくなる）。
+
+  - フラグ: UPDATE 1 回。対象件数は UPDATE の行数
+  - タグ・フォルダの追加: INSERT ... SELECT（未登録の組だけ。並行して追加された組は無視）
+  - タグ・フォルダの削除: DELETE 1 回
+  - タグの usage_count は同じトランザクションで中間テーブルから数え直す（並行して同じ組が
+    追加され INSERT が無視された場合も、件数がずれない）
+
+UPDATE / INSERT ... SELECT / DELETE は m2m_changed などのシグナルを送らないので、シグナルで
+更新している派生データ（検索用テキスト・タグ索引・一覧とフォルダツリーのキャッシュ・
+ライブラリ集計）はここで明示的に更新する。ライブラリ集計の差分は、変更で対象の条件が
+変わっても求められるよう、変更する前に集計しておく。
+"""
+
+from django.db import connection, transaction
+from django.db.models import Count, OuterRef, Subquery, TextField, Value
+from django.db.models.constants import OnConflict
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce, Concat
+
+from . import counters, foldertree, listcache, search
+from .models import File, Tag
+from .tagfilter import file_index
+
+_INDEX_FLAGS = {"delete_flag": "deleted", "duplicate_flag": "duplicate"}
+
+
+def target(files):
+    """
+    対象のファイルを id のサブクエリにする。MySQL は更新するテーブルをサブクエリで参照できないので、
+    Django の削除と同じく派生テーブルにして先に実体化させる。
+    """
+    ids = files.order_by().values("pk")
+    if connection.features.update_can_self_select:
+        return ids
+    sql, params = ids.query.sql_with_params()
+    return RawSQL(f"SELECT * FROM ({sql}) AS bulk_target", params)
+
+
+def _index_ids(files) -> list:
+    """タグ索引を差分更新するための id（索引が作られていなければ読まない。索引自体が全 id を持つ）"""
+    if not file_index.loaded:
+        return []
+    return list(files.values_list("pk", flat=True))
+
+
+def _insert_missing(through, column: str, values, ids) -> int:
+    """
+    対象のファイル × values（タグ / フォルダの id）のうち未登録の組を INSERT ... SELECT で追加し、
+    追加した件数を返す
+    """
+    qn = connection.ops.quote_name
+    other = through._meta.get_field(column.removesuffix("_id")).related_model
+    files_sql, files_params = File.objects.filter(pk__in=ids).values("pk").query.sql_with_params()
+    table = qn(through._meta.db_table)
+    placeholders = ", ".join(["%s"] * len(values))
+    fields = [through._meta.get_field("file"), through._meta.get_field(column.removesuffix("_id"))]
+    sql = (
+        f"{connection.ops.insert_statement(on_conflict=OnConflict.IGNORE)} {table} "
+        f"({qn('file_id')}, {qn(column)}) "
+        f"SELECT f.{qn('id')}, o.{qn('id')} FROM {qn(File._meta.db_table)} f, {qn(other._meta.db_table)} o "
+        f"WHERE f.{qn('id')} IN ({files_sql}) AND o.{qn('id')} IN ({placeholders}) "
+        f"AND NOT EXISTS (SELECT 1 FROM {table} x "
+        f"WHERE x.{qn('file_id')} = f.{qn('id')} AND x.{qn(column)} = o.{qn('id')}) "
+        f"{connection.ops.on_conflict_suffix_sql(fields, OnConflict.IGNORE, None, None)}"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [*files_params, *values])
+        return cursor.rowcount
+
+
+def _recount_usage(tag_ids) -> None:
+    usage = (
+        File.tags.through.objects.filter(tag_id=OuterRef("pk"))
+        .order_by()
+        .values("tag_id")
+        .annotate(n=Count("*"))
+        .values("n")
+    )
+    Tag.objects.filter(id__in=tag_ids).update(usage_count=Coalesce(Subquery(usage), 0))
+
+
+def set_flag(files, field: str, value: bool) -> int:
+    """delete_flag / duplicate_flag を UPDATE 1 回で変え、対象の件数を返す"""
+    ids = target(files)
+    with transaction.atomic():
+        changing = File.objects.filter(pk__in=ids).exclude(**{field: value})
+        index_ids = _index_ids(changing)
+        counters.add(counters.flag_delta(changing, field, value))
+        affected = File.objects.filter(pk__in=ids).update(**{field: value})
+        listcache.bump()
+    file_index.update_flags(index_ids, **{_INDEX_FLAGS[field]: value})
+    return affected
+
+
+def add_tags(files, tag_ids) -> int:
+    """対象のファイル × tag_ids のうち未登録の組を追加し、追加した件数を返す"""
+    ids = target(files)
+    tags = list(Tag.objects.filter(id__in=tag_ids).values_list("id", "tag_name"))
+    if not tags:
+        return 0
+    through = File.tags.through
+    index_ids = {}
+    with transaction.atomic():
+        for tag_id, tag_name in tags:
+            missing = File.objects.filter(pk__in=ids).exclude(
+                pk__in=through.objects.filter(tag_id=tag_id).values("file_id")
+            )
+            index_ids[tag_id] = _index_ids(missing)
+            # 検索用テキストの末尾にタグ名を足す（search.build_search_text と同じ正規化。行は読まない）
+            missing.update(
+                search_text=Concat("search_text", Value(f" {search.normalize(tag_name)}"), output_field=TextField())
+            )
+        added = _insert_missing(through, "tag_id", list(index_ids), ids)
+        _recount_usage(list(index_ids))
+        listcache.bump()
+    for tag_id, file_ids in index_ids.items():
+        file_index.set_tag(tag_id, file_ids, True)
+    return added
+
+
+def remove_tags(files, tag_ids) -> int:
+    """対象のファイル × tag_ids の組を削除し、削除した件数を返す"""
+    tag_ids = list(tag_ids)
+    pairs = File.tags.through.objects.filter(file_id__in=target(files), tag_id__in=tag_ids)
+    with transaction.atomic():
+        # 検索用テキストは Python で作り直すので、タグを外すファイルの id だけは読む
+        file_ids = set(pairs.values_list("file_id", flat=True))
+        removed = pairs.delete()[0]
+        _recount_usage(tag_ids)
+        search.refresh(file_ids)
+        listcache.bump()
+    for tag_id in tag_ids:
+        file_index.set_tag(tag_id, file_ids, False)
+    return removed
+
+
+def add_to_folder(files, folder_id: int) -> int:
+    """対象のファイルをフォルダに追加し、追加した件数を返す"""
+    ids = target(files)
+    with transaction.atomic():
+        # フォルダ未所属だったものは未所属でなくなる
+        leaving = File.objects.filter(pk__in=ids).exclude(counters.in_folder())
+        index_ids = _index_ids(leaving)
+        counters.add({"no_folder_count": -leaving.filter(delete_flag=False).count()})
+        added = _insert_missing(File.folders.through, "folder_id", [folder_id], ids)
+        listcache.bump()
+        foldertree.invalidate()
+    file_index.refresh_folders(index_ids)
+    return added
+
+
+def remove_from_folder(files, folder_id: int) -> int:
+    """対象のファイルをフォルダから外し、外した件数を返す"""
+    through = File.folders.through.objects
+    pairs = through.filter(file_id__in=target(files), folder_id=folder_id)
+    with transaction.atomic():
+        # ほかのフォルダに属していないものはフォルダ未所属になる
+        entering = File.objects.filter(pk__in=pairs.values("file_id")).exclude(
+            pk__in=through.exclude(folder_id=folder_id).values("file_id")
+        )
+        index_ids = _index_ids(entering)
+        counters.add({"no_folder_count": entering.filter(delete_flag=False).count()})
+        removed = pairs.delete()[0]
+        listcache.bump()
+        foldertree.invalidate()
+    file_index.refresh_folders(index_ids)
+    return removed
@@ -0,0 +1,121 @@
+# backend/videos/cache.py
+"""
+On-disk derived-media caches (remux / HLS segments / proxies).
+
+  - source_key(): 元ファイルから派生したキャッシュのキー（サイズ・mtime が変われば別キーになり、
+                 古いものは参照されなくなって LRU で消える）
+  - touch():     LRU 用に atime だけを更新（mtime は ETag に使うので変えない）
+  - entries():   キャッシュファイルの一覧（atime の古い順）
+  - evict_lru(): ディレクトリ配下の合計サイズが上限を超えたら atime の古い順に削除
+  - SingleFlight: 同じキーの生成を 1 回にまとめる（同時リクエストは完了を待って結果を共有）
+"""
+
+import os
+import time
+import logging
+import threading
+
+logger = logging.getLogger("videos")
+
+
+def source_key(file_id: int, st: os.stat_result) -> str:
+    return f"{file_id}-{st.st_size:x}-{st.st_mtime_ns:x}"
+
+
+def touch(path: str) -> None:
+    try:
+        st = os.stat(path)
+        os.utime(path, ns=(time.time_ns(), st.st_mtime_ns))
+    except OSError:
+        pass
+
+
+def entries(directory: str, suffixes: tuple = (".mp4",)) -> list[tuple[int, int, str]]:
+    """
+    directory 配下（サブディレクトリを含む）の suffixes のファイルを
+    (atime_ns, size, path) で atime の古い順に返す。生成途中の .part は含まない。
+    """
+    result = []
+    for root, _, names in os.walk(directory):
+        for name in names:
+            if not name.endswith(suffixes):
+                continue
+            path = os.path.join(root, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            result.append((st.st_atime_ns, st.st_size, path))
+    return sorted(result)
+
+
+def remove(directory: str, path: str) -> bool:
+    """キャッシュファイルを削除し、空になった親ディレクトリも片付ける"""
+    try:
+        os.remove(path)
+    except OSError as e:
+        # 配信中で消せない（Windows）場合は次回に回す
+        logger.warning(f"Could not evict cache file {path}: {e}")
+        return False
+    parent = os.path.dirname(path)
+    while parent != directory and parent.startswith(directory):
+        try:
+            os.rmdir(parent)
+        except OSError:
+            break
+        parent = os.path.dirname(parent)
+    return True
+
+
+def evict_lru(directory: str, max_bytes: int, suffixes: tuple = (".mp4",)) -> int:
+    """
+    directory 配下の suffixes のファイルを対象に、合計が max_bytes 以下になるまで
+    atime の古い順に削除する。削除数を返す。
+    """
+    cached = entries(directory, suffixes)
+    total = sum(size for _, size, _ in cached)
+    removed = 0
+    for _, size, path in cached:
+        if total <= max_bytes:
+            break
+        if not remove(directory, path):
+            continue
+        total -= size
+        removed += 1
+    if removed:
+        logger.info(f"Evicted {removed} cached files from {directory}")
+    return removed
+
+
+class SingleFlight:
+    """
+    キーごとに生成処理を 1 回だけ実行する。
+    実行中の同じキーへの呼び出しは完了を待ち、同じ結果（例外を含む）を受け取る。
+    プロセス内でのみ有効（別プロセス間の重複はアトミックな置き換えで無害にしておく）。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: dict = {}
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = {"event": threading.Event(), "result": None, "error": None}
+        if not leader:
+            call["event"].wait()
+            if call["error"] is not None:
+                raise call["error"]
+            return call["result"]
+        try:
+            call["result"] = fn()
+            return call["result"]
+        except Exception as e:
+            call["error"] = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call["event"].set()
@@ -0,0 +1,212 @@
+# backend/videos/counters.py
+"""
+Maintained library counters for the sidebar / summary endpoint.
+
+全ファイル・フォルダ未所属・削除・重複の件数と、合計サイズ・合計時間を LibraryCounters の
+1 行に持ち、/api/summary/ はその 1 行を読むだけにする（一覧ごとの COUNT(*) や
+folders__isnull の結合を毎回実行しない）。
+
+更新は差分で行い、書き込みと同じトランザクションで F() 式により加算する。
+
+  - フラグ・サイズの更新（queryset.update() / bulk_update）は tracking(ids) で囲む。
+    対象ファイルの集計を前後で取り、その差を足す
+  - File.save() は作成なら record_created()、それ以外は集計対象の列が読み込み時から
+    変わっている場合だけ tracking() を自分で行う
+  - スキャンの bulk_create は record_created() で作成した行をそのまま数える
+  - フォルダ所属の付け外し・ファイル削除・フォルダ削除はシグナルで反映する
+
+rebuild() で DB から数え直せる（移行時・日次の整合性回復用）。
+"""
+
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models import Count, Exists, F, OuterRef, Q, Sum
+from django.db.models.signals import m2m_changed, post_delete, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import File, Folder, LibraryCounters
+
+FIELDS = (
+    "file_count",
+    "no_folder_count",
+    "deleted_count",
+    "duplicate_count",
+    "total_bytes",
+    "total_duration",
+)
+# この列が変わる保存だけ集計の差分を取る
+COUNTED_FIELDS = {"delete_flag", "duplicate_flag", "file_size", "video_duration"}
+
+_ROW_ID = 1
+
+
+def in_folder():
+    return Exists(File.folders.through.objects.filter(file_id=OuterRef("pk")))
+
+
+def totals(queryset) -> dict:
+    """queryset のファイルの集計（1 クエリ）"""
+    active = Q(delete_flag=False)
+    result = queryset.order_by().aggregate(
+        file_count=Count("id", filter=active),
+        no_folder_count=Count("id", filter=active & ~Q(in_folder())),
+        deleted_count=Count("id", filter=Q(delete_flag=True)),
+        duplicate_count=Count("id", filter=Q(duplicate_flag=True)),
+        total_bytes=Sum("file_size", filter=active),
+        total_duration=Sum("video_duration", filter=active),
+    )
+    return {name: result[name] or 0 for name in FIELDS}
+
+
+def flag_delta(queryset, field: str, value: bool) -> dict:
+    """
+    queryset のファイル（field がまだ value でないもの）の field を value にしたときの集計の差。
+    UPDATE の後では同じ条件で対象を引き直せない（条件にフラグが入っている）ので、変える前に 1 クエリで求める
+    """
+    result = queryset.order_by().aggregate(
+        n=Count("id"),
+        no_folder=Count("id", filter=~Q(in_folder())),
+        total_bytes=Sum("file_size"),
+        total_duration=Sum("video_duration"),
+    )
+    n = result["n"]
+    if field == "duplicate_flag":
+        return {"duplicate_count": n if value else -n}
+    # delete_flag: 削除すると（削除除く）の集計から外れ、戻すと加わる
+    sign = -1 if value else 1
+    return {
+        "file_count": sign * n,
+        "no_folder_count": sign * result["no_folder"],
+        "deleted_count": -sign * n,
+        "total_bytes": sign * (result["total_bytes"] or 0),
+        "total_duration": sign * (result["total_duration"] or 0),
+    }
+
+
+def _totals_of(ids) -> dict:
+    ids = list(ids)
+    result = dict.fromkeys(FIELDS, 0)
+    for i in range(0, len(ids), 1000):
+        for name, value in totals(File.objects.filter(id__in=ids[i:i + 1000])).items():
+            result[name] += value
+    return result
+
+
+def add(delta: dict) -> None:
+    """差分を加算する（行が無ければ数え直して作る）"""
+    delta = {name: value for name, value in delta.items() if value}
+    if not delta:
+        return
+    updated = LibraryCounters.objects.filter(pk=_ROW_ID).update(
+        **{name: F(name) + value for name, value in delta.items()}, updated_at=timezone.now()
+    )
+    if not updated:
+        rebuild()
+
+
+@contextmanager
+def tracking(ids):
+    """
+    ids のファイルを変更する処理を囲み、前後の集計の差を同じトランザクションで反映する
+        with counters.tracking(ids):
+            File.objects.filter(id__in=ids).update(delete_flag=True)
+    """
+    ids = list(ids)
+    with transaction.atomic():
+        before = _totals_of(ids)
+        yield
+        after = _totals_of(ids)
+        add({name: after[name] - before[name] for name in FIELDS})
+
+
+def record_created(files) -> None:
+    """新しく作ったファイル（フォルダ未所属）を数える。クエリは加算の 1 回だけ"""
+    delta = dict.fromkeys(FIELDS, 0)
+    for f in files:
+        if f.duplicate_flag:
+            delta["duplicate_count"] += 1
+        if f.delete_flag:
+            delta["deleted_count"] += 1
+            continue
+        delta["file_count"] += 1
+        delta["no_folder_count"] += 1
+        delta["total_bytes"] += f.file_size or 0
+        delta["total_duration"] += f.video_duration or 0
+    add(delta)
+
+
+def rebuild() -> dict:
+    """DB から数え直す"""
+    with transaction.atomic():
+        values = totals(File.objects.all())
+        LibraryCounters.objects.update_or_create(
+            pk=_ROW_ID, defaults={**values, "rebuilt_at": timezone.now()}
+        )
+    return values
+
+
+def summary() -> dict:
+    row = LibraryCounters.objects.filter(pk=_ROW_ID).values(*FIELDS, "updated_at").first()
+    if row is None:
+        rebuild()
+        row = LibraryCounters.objects.filter(pk=_ROW_ID).values(*FIELDS, "updated_at").first()
+    return row
+
+
+# ------------------------------------------------------------------
+# シグナルで反映する変更
+# ------------------------------------------------------------------
+def _without_folder(file_ids) -> int:
+    return File.objects.filter(id__in=file_ids, delete_flag=False).exclude(in_folder()).count()
+
+
+@receiver(m2m_changed, sender=File.folders.through)
+def _folders_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """フォルダ所属の付け外しで変わるのは「フォルダ未所属」の件数だけ"""
+    if action in ("pre_add", "pre_remove", "pre_clear"):
+        if not reverse:
+            file_ids = [instance.pk]
+        elif action == "pre_clear":
+            file_ids = list(instance.files.values_list("id", flat=True))
+        else:
+            file_ids = list(pk_set or ())
+        # 付ける前に未所属だったもの / 外す前に所属していたもの
+        candidates = File.objects.filter(id__in=file_ids, delete_flag=False)
+        if action == "pre_add":
+            candidates = candidates.exclude(in_folder())
+        else:
+            candidates = candidates.filter(in_folder())
+        instance._counter_file_ids = list(candidates.values_list("id", flat=True))
+    elif action in ("post_add", "post_remove", "post_clear"):
+        file_ids = getattr(instance, "_counter_file_ids", [])
+        instance._counter_file_ids = []
+        if not file_ids:
+            return
+        if action == "post_add":
+            add({"no_folder_count": -(len(file_ids) - _without_folder(file_ids))})
+        else:
+            add({"no_folder_count": _without_folder(file_ids)})
+
+
+@receiver(pre_delete, sender=File)
+def _file_deleting(sender, instance, **kwargs):
+    instance._counter_totals = _totals_of([instance.pk])
+
+
+@receiver(post_delete, sender=File)
+def _file_deleted(sender, instance, **kwargs):
+    before = getattr(instance, "_counter_totals", None)
+    if before:
+        add({name: -value for name, value in before.items()})
+
+
+@receiver(post_delete, sender=Folder)
+def _folder_deleted(sender, instance, **kwargs):
+    # 所属の行は CASCADE で消える（m2m_changed は送られない）。サブフォルダもまとめて
+    # 消えるので対象を追わず、未所属の件数だけ数え直す（フォルダ削除はまれ）
+    LibraryCounters.objects.filter(pk=_ROW_ID).update(
+        no_folder_count=File.objects.filter(delete_flag=False).exclude(in_folder()).count(),
+        updated_at=timezone.now(),
+    )
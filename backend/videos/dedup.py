@@ -0,0 +1,182 @@
+# backend/videos/dedup.py
+"""
+Staged duplicate detection.
+
+  1) file_size が同じレコードだけを候補にする（DB 集計のみ）
+  2) 保存済みのサンプル指紋（md5_hash）が同じものに絞る（追加 I/O なし）
+     旧方式（先頭 10MB MD5）や無効化された指紋の行はここで再計算して保存する
+  3) まだ衝突しているものだけ全体ハッシュで確定する（結果は File.content_hash に保存）
+
+全体ハッシュは xxhash があれば xxh3_128、無ければ blake2b を使う。
+"""
+
+import os
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+
+from .models import File
+
+logger = logging.getLogger("videos")
+
+try:
+    import xxhash  # 任意依存（pip install xxhash）。無ければ blake2b で代替
+except ImportError:
+    xxhash = None
+
+_READ_SIZE = 8 * 1024 * 1024
+
+
+def _new_full_hasher():
+    if xxhash is not None:
+        return xxhash.xxh3_128()
+    return hashlib.blake2b(digest_size=16)
+
+
+def full_content_hash(file_path: str) -> str | None:
+    """
+    ファイル全体のハッシュ（大きなバッファへ readinto してコピーを避ける）
+    mmap は使わない: 数 GB の動画を写像すると 32 ビット環境やネットワークドライブで失敗し得るうえ、
+    読み終えたページがページキャッシュ・RSS に残る。順読みなら 8MB 単位の readinto でも
+    OS の先読みが効くので、ハッシュ計算の速度はほぼ変わらない。
+    """
+    try:
+        h = _new_full_hasher()
+        buf = bytearray(_READ_SIZE)
+        view = memoryview(buf)
+        with open(file_path, "rb", buffering=0) as f:
+            while True:
+                n = f.readinto(buf)
+                if not n:
+                    break
+                h.update(view[:n])
+        return h.hexdigest()
+    except Exception as e:
+        logger.error(f"Failed to calculate full hash for {file_path}: {e}")
+        return None
+
+
+def _group_by(rows: list[dict], key) -> list[list[dict]]:
+    groups: dict = {}
+    for row in rows:
+        k = key(row)
+        if k is None:
+            continue
+        groups.setdefault(k, []).append(row)
+    return [g for g in groups.values() if len(g) > 1]
+
+
+def upgrade_fingerprints(rows: list[dict], pool: ThreadPoolExecutor | None = None) -> int:
+    """
+    rows（id, abs_path, file_size を持つ dict）の指紋を現行方式で再計算して保存する。
+    rows の md5_hash / fingerprint_version も更新する。戻り値は更新件数。
+    """
+    from .utils import FINGERPRINT_VERSION, calculate_sampled_fingerprint
+
+    if not rows:
+        return 0
+
+    def _calc(r):
+        return calculate_sampled_fingerprint(r["abs_path"], r["file_size"])
+
+    digests = pool.map(_calc, rows) if pool is not None else map(_calc, rows)
+    to_save = []
+    for r, digest in zip(rows, digests):
+        if not digest:
+            continue
+        r["md5_hash"] = digest
+        r["fingerprint_version"] = FINGERPRINT_VERSION
+        to_save.append(File(id=r["id"], md5_hash=digest, fingerprint_version=FINGERPRINT_VERSION))
+    if to_save:
+        with transaction.atomic():
+            File.objects.bulk_update(to_save, ["md5_hash", "fingerprint_version"], batch_size=500)
+        logger.info(f"Recomputed {len(to_save)} file fingerprints")
+    return len(to_save)
+
+
+def _stat_mtime(abs_path: str, expected_size: int) -> int | None:
+    try:
+        st = os.stat(abs_path)
+    except OSError:
+        return None
+    if st.st_size != expected_size:
+        return None
+    return st.st_mtime_ns
+
+
+def duplicate_group_key(file_size: int, content_hash: str) -> str:
+    """File.duplicate_group に保存するグループキー（SQL 側の Concat と同じ形式）"""
+    return f"{file_size}-{content_hash}"
+
+
+def find_duplicate_groups(size_filter=None) -> dict[str, list[int]]:
+    """
+    内容が完全に一致するファイルのグループを {duplicate_group キー: [id, ...]} で返す。
+    size_filter を渡した場合はそのサイズのファイルだけを対象にする。
+    ディスク上に見つからない・読めないファイルは確定できないのでどのグループにも入れない。
+    """
+    sizes_qs = File.objects.values("file_size").annotate(count=Count("id")).filter(count__gt=1)
+    if size_filter is not None:
+        sizes_qs = sizes_qs.filter(file_size__in=list(size_filter))
+    sizes = [row["file_size"] for row in sizes_qs]
+    if not sizes:
+        return {}
+
+    from .utils import FINGERPRINT_VERSION
+
+    rows: list[dict] = []
+    for i in range(0, len(sizes), 500):
+        rows.extend(
+            File.objects.filter(file_size__in=sizes[i:i + 500]).values(
+                "id", "file_path", "file_size", "md5_hash", "fingerprint_version",
+                "content_hash", "content_hash_mtime",
+            )
+        )
+    for r in rows:
+        r["abs_path"] = os.path.join(settings.MEDIA_ROOT, r["file_path"])
+        r["mtime"] = _stat_mtime(r["abs_path"], r["file_size"])
+
+    workers = getattr(settings, "DEDUP_HASH_WORKERS", 4)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="videos.dedup") as pool:
+        # 古い方式の指紋を遅延再計算（同サイズの相手がいる行だけが対象になる）
+        upgrade_fingerprints(
+            [r for r in rows if r["fingerprint_version"] != FINGERPRINT_VERSION and r["mtime"] is not None],
+            pool,
+        )
+
+        # 1) + 2) サイズと指紋で候補を作る（ディスク上で確認できない行は確定できないので除外）
+        candidates = _group_by(
+            [r for r in rows if r["mtime"] is not None and r["fingerprint_version"] == FINGERPRINT_VERSION],
+            lambda r: (r["file_size"], r["md5_hash"]),
+        )
+        if not candidates:
+            return {}
+
+        # 保存済みの全体ハッシュが有効（サイズ・mtime 不変）なら再計算しない
+        def _cached(r):
+            return r["content_hash"] if r["content_hash_mtime"] == r["mtime"] else None
+
+        # 3) 全体ハッシュ
+        need_full = [r for g in candidates for r in g if _cached(r) is None]
+        for r, digest in zip(need_full, pool.map(lambda r: full_content_hash(r["abs_path"]), need_full)):
+            r["full"] = digest
+
+    to_save = [
+        File(id=r["id"], content_hash=r["full"], content_hash_mtime=r["mtime"])
+        for r in need_full if r.get("full")
+    ]
+    if to_save:
+        with transaction.atomic():
+            File.objects.bulk_update(to_save, ["content_hash", "content_hash_mtime"], batch_size=500)
+        logger.info(f"Stored {len(to_save)} verified content hashes")
+
+    result: dict[str, list[int]] = {}
+    for group in candidates:
+        for g in _group_by(group, lambda r: _cached(r) or r.get("full")):
+            key = duplicate_group_key(g[0]["file_size"], _cached(g[0]) or g[0]["full"])
+            result[key] = [r["id"] for r in g]
+    return result
@@ -0,0 +1,97 @@
+# backend/videos/foldertree.py
+"""
+Folder tree for the sidebar, built from two queries and cached.
+
+フォルダ一覧（1 クエリ）とフォルダごとのファイル数（GROUP BY の 1 クエリ）を読み、
+親子関係はメモリ上で組み立てる。フォルダ数によらずクエリは 2 回（サブフォルダを含む
+ファイル数も返す場合は閉包テーブルでの集計がもう 1 回）。
+
+組み立てた木は FILE_LIST_CACHE_ALIAS のキャッシュに置き、フォルダの作成・変更・削除と
+ファイルのフォルダ所属の変更で世代を進めて無効にする。世代番号は DB（videos.generations）に
+置くので、別ワーカーや Celery での変更もすぐ反映される。
+"""
+
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Count
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from . import generations
+from .models import File, Folder, FolderClosure
+
+
+def _cache():
+    return caches[getattr(settings, "FILE_LIST_CACHE_ALIAS", "default")]
+
+
+def invalidate() -> None:
+    """コミット後に世代を進める（コミット前に進めると古い木を新しい世代で保存してしまう）"""
+    generations.bump(generations.FOLDERS)
+
+
+def build_tree(recursive_counts: bool = False) -> list[dict]:
+    """
+    [{id, folder_name, file_count, children: [...]}] の木を返す（兄弟はフォルダ名順）。
+    recursive_counts なら total_file_count（サブフォルダを含む重複なしのファイル数）も付ける。
+    """
+    through = File.folders.through.objects
+    file_counts = dict(
+        through.order_by().values("folder_id").annotate(n=Count("file_id")).values_list("folder_id", "n")
+    )
+    total_counts = {}
+    if recursive_counts:
+        # 各所属行を、そのフォルダの祖先（自身を含む）すべてに数える
+        total_counts = dict(
+            FolderClosure.objects.order_by()
+            .values("ancestor_id")
+            .annotate(n=Count("descendant__files", distinct=True))
+            .values_list("ancestor_id", "n")
+        )
+
+    nodes = {}
+    children = defaultdict(list)
+    for pk, name, parent_id in Folder.objects.order_by("folder_name", "id").values_list(
+        "id", "folder_name", "parent_id"
+    ):
+        node = {"id": pk, "folder_name": name, "children": children[pk], "file_count": file_counts.get(pk, 0)}
+        if recursive_counts:
+            node["total_file_count"] = total_counts.get(pk, 0)
+        nodes[pk] = node
+        children[parent_id].append(node)
+    return children[None]
+
+
+def cached_tree(recursive_counts: bool = False) -> list[dict]:
+    # 世代は組み立てる前に読む（途中で変更があっても古い世代のキーに入るだけ）
+    key = f"folders:tree:{generations.current(generations.FOLDERS):x}:{int(recursive_counts)}"
+    cache = _cache()
+    tree = cache.get(key)
+    if tree is None:
+        tree = build_tree(recursive_counts)
+        cache.set(key, tree, timeout=getattr(settings, "FOLDER_TREE_CACHE_TIMEOUT", 600))
+    return tree
+
+
+# ------------------------------------------------------------------
+# 無効化（フォルダの変更とファイルのフォルダ所属の変更）
+# ------------------------------------------------------------------
+@receiver(post_save, sender=Folder)
+def _folder_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        invalidate()
+
+
+@receiver(post_delete, sender=Folder)
+@receiver(post_delete, sender=File)
+def _deleted(sender, instance, **kwargs):
+    # 削除で所属の行も消える
+    invalidate()
+
+
+@receiver(m2m_changed, sender=File.folders.through)
+def _membership_changed(sender, action, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        invalidate()
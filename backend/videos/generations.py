@@ -0,0 +1,41 @@
+# backend/videos/generations.py
+"""
+Shared cache generations.
+
+一覧のレスポンスキャッシュとフォルダツリーのキャッシュは「世代番号」をキーに含め、
+書き込みのたびに世代を進めて古いキーを参照しないようにしている。世代番号を
+プロセスごとのキャッシュ（locmem）に置くと、Celery のスキャンや別ワーカーの書き込みが
+リクエストを処理するプロセスに届かないので、CacheGeneration の行（DB）に置く。
+
+  - 読み出しは主キーでの 1 クエリ。キャッシュの実体（CACHES）は locmem のままでよい
+    （キーに世代が入るので、別プロセスで古い内容が残っていても参照されない）
+  - 進めるのはコミット後（コミット前に進めると、新しい世代のキーで古い内容をキャッシュしてしまう）
+"""
+
+import time
+
+from django.db import transaction
+from django.db.models import F
+
+from .models import CacheGeneration
+
+FILES = "files"
+FOLDERS = "folders"
+
+
+def current(name: str) -> int:
+    value = CacheGeneration.objects.filter(name=name).values_list("value", flat=True).first()
+    if value is None:
+        # 初期値は時刻（作り直したときに、以前の世代のキーやブラウザの ETag と一致しない）
+        value = CacheGeneration.objects.get_or_create(name=name, defaults={"value": time.time_ns()})[0].value
+    return value
+
+
+def _advance(name: str) -> None:
+    if not CacheGeneration.objects.filter(name=name).update(value=F("value") + 1):
+        current(name)
+
+
+def bump(name: str) -> None:
+    """世代を進める。トランザクション中ならコミット後に"""
+    transaction.on_commit(lambda: _advance(name))
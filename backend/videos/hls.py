@@ -0,0 +1,202 @@
+# backend/videos/hls.py
+"""
+HLS packaging with lazily generated segments.
+
+  - マスタープレイリスト: 元動画の width / height / bitrate から画質段（HLS_LADDER）を選ぶ
+  - バリアントプレイリスト: 長さを HLS_SEGMENT_SECONDS で区切るだけなので生成不要
+  - セグメント: 初回リクエスト時に該当区間だけを ffmpeg（CPU, libx264）で変換して
+    HLS_CACHE_DIR に保存する。同じセグメントへの同時リクエストは 1 回の変換にまとめ、
+    キャッシュは HLS_CACHE_MAX_BYTES を超えたら最終アクセスの古い順に削除する。
+"""
+
+import os
+import math
+import time
+import logging
+import threading
+
+import ffmpeg  # ffmpeg-python
+
+from django.conf import settings
+
+from .cache import SingleFlight, evict_lru, source_key
+
+logger = logging.getLogger("videos")
+
+# (高さ, 映像ビットレート bps)。元動画の高さを超える段は使わない
+_DEFAULT_LADDER = (
+    (1080, 5_000_000),
+    (720, 2_800_000),
+    (480, 1_400_000),
+    (360, 800_000),
+)
+AUDIO_BITRATE = 128_000
+
+_flight = SingleFlight()
+_transcode_slots = threading.BoundedSemaphore(
+    getattr(settings, "HLS_MAX_TRANSCODES", None) or max(1, (os.cpu_count() or 2) // 2)
+)
+_evict_lock = threading.Lock()
+_last_evict = 0.0
+
+
+def segment_seconds() -> float:
+    return float(getattr(settings, "HLS_SEGMENT_SECONDS", 6))
+
+
+def _cache_dir() -> str:
+    return getattr(settings, "HLS_CACHE_DIR", os.path.join(settings.MEDIA_ROOT, "hls"))
+
+
+def _even(value: float) -> int:
+    return max(2, int(round(value / 2)) * 2)
+
+
+def renditions(width: int | None, height: int | None, bitrate: int | None) -> list[dict]:
+    """元動画に合わせた画質段の一覧（高画質順）"""
+    ladder = getattr(settings, "HLS_LADDER", _DEFAULT_LADDER)
+    src_height = height or 720
+    aspect = (width / height) if width and height else 16 / 9
+
+    rungs = [(h, br) for h, br in ladder if h <= src_height]
+    if not rungs:
+        # 最低段より小さい動画は元の高さで 1 段だけ
+        rungs = [(_even(src_height), ladder[-1][1])]
+
+    result = []
+    for h, video_bitrate in rungs:
+        if bitrate:
+            # 元より高いビットレートにしても画質は上がらない
+            video_bitrate = min(video_bitrate, max(bitrate - AUDIO_BITRATE, 200_000))
+        result.append({
+            "name": f"{h}p",
+            "height": h,
+            "width": _even(h * aspect),
+            "video_bitrate": video_bitrate,
+        })
+    return result
+
+
+def find_rendition(file, name: str) -> dict | None:
+    return next((r for r in renditions(file.width, file.height, file.bitrate) if r["name"] == name), None)
+
+
+def segment_count(duration: float) -> int:
+    return max(1, math.ceil(duration / segment_seconds()))
+
+
+def master_playlist(file) -> str:
+    lines = ["#EXTM3U", "#EXT-X-VERSION:3"]
+    for r in renditions(file.width, file.height, file.bitrate):
+        bandwidth = int((r["video_bitrate"] + AUDIO_BITRATE) * 1.1)
+        lines.append(
+            f"#EXT-X-STREAM-INF:BANDWIDTH={bandwidth},"
+            f"AVERAGE-BANDWIDTH={r['video_bitrate'] + AUDIO_BITRATE},"
+            f"RESOLUTION={r['width']}x{r['height']}"
+        )
+        lines.append(f"{r['name']}/index.m3u8")
+    return "\n".join(lines) + "\n"
+
+
+def variant_playlist(duration: float) -> str:
+    seg = segment_seconds()
+    count = segment_count(duration)
+    lines = [
+        "#EXTM3U",
+        "#EXT-X-VERSION:3",
+        "#EXT-X-PLAYLIST-TYPE:VOD",
+        f"#EXT-X-TARGETDURATION:{math.ceil(seg)}",
+        "#EXT-X-MEDIA-SEQUENCE:0",
+    ]
+    for i in range(count):
+        length = min(seg, duration - i * seg)
+        lines.append(f"#EXTINF:{length:.3f},")
+        lines.append(f"{i:05d}.ts")
+    lines.append("#EXT-X-ENDLIST")
+    return "\n".join(lines) + "\n"
+
+
+def segment_path(file_id: int, st: os.stat_result, rendition: str, index: int) -> str:
+    return os.path.join(_cache_dir(), source_key(file_id, st), rendition, f"{index:05d}.ts")
+
+
+def _transcode_segment(src_path: str, out_path: str, rendition: dict, start: float, length: float) -> None:
+    part_path = f"{out_path}.part"
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    source = ffmpeg.input(src_path, ss=f"{start:.3f}", t=f"{length:.3f}")
+    video = source["v:0"].filter("scale", -2, rendition["height"])
+    bitrate = rendition["video_bitrate"]
+    try:
+        with _transcode_slots:
+            (
+                ffmpeg.output(
+                    video,
+                    source["a:0?"],
+                    part_path,
+                    format="mpegts",
+                    vcodec="libx264",
+                    preset=getattr(settings, "HLS_X264_PRESET", "veryfast"),
+                    video_bitrate=bitrate,
+                    maxrate=int(bitrate * 1.1),
+                    bufsize=int(bitrate * 1.5),
+                    pix_fmt="yuv420p",
+                    # セグメント単体で再生を始められるよう先頭をキーフレームにする
+                    force_key_frames="expr:eq(n,0)",
+                    acodec="aac",
+                    audio_bitrate=AUDIO_BITRATE,
+                    ac=2,
+                    # 区間ごとに変換してもタイムスタンプが連続するようずらす
+                    output_ts_offset=f"{start:.3f}",
+                    muxdelay=0,
+                )
+                .global_args("-nostdin", "-loglevel", "error")
+                .overwrite_output()
+                .run(cmd=getattr(settings, "FFMPEG_BINARY", "ffmpeg"), capture_stdout=True, capture_stderr=True)
+            )
+        os.replace(part_path, out_path)
+    except ffmpeg.Error as e:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise RuntimeError(
+            f"HLS segment transcode failed for {src_path}: "
+            f"{e.stderr.decode(errors='replace') if getattr(e, 'stderr', None) else e}"
+        ) from e
+
+
+def _maybe_evict() -> None:
+    """セグメントは数が多いので、キャッシュ全体の走査は一定間隔に抑える"""
+    global _last_evict
+    interval = getattr(settings, "HLS_EVICT_INTERVAL", 30)
+    with _evict_lock:
+        if time.monotonic() - _last_evict < interval:
+            return
+        _last_evict = time.monotonic()
+    evict_lru(_cache_dir(), getattr(settings, "HLS_CACHE_MAX_BYTES", 10 * 1024 ** 3), (".ts",))
+
+
+def ensure_segment(file, src_path: str, rendition: dict, index: int) -> str:
+    """
+    セグメントのキャッシュパスを返す。無ければ生成する（同じセグメントの同時要求は 1 回にまとめる）。
+    範囲外の index には IndexError を送出する。
+    """
+    duration = file.video_duration
+    if index < 0 or index >= segment_count(duration):
+        raise IndexError(index)
+
+    out_path = segment_path(file.id, os.stat(src_path), rendition["name"], index)
+    if os.path.exists(out_path):
+        return out_path
+
+    def _generate():
+        if not os.path.exists(out_path):
+            seg = segment_seconds()
+            start = index * seg
+            started = time.monotonic()
+            _transcode_segment(src_path, out_path, rendition, start, min(seg, duration - start))
+            logger.debug(
+                f"HLS segment {file.id}/{rendition['name']}/{index} generated in {time.monotonic() - started:.2f}s"
+            )
+            _maybe_evict()
+        return out_path
+
+    return _flight.do(out_path, _generate)
@@ -0,0 +1,118 @@
+# backend/videos/listcache.py
+"""
+Versioned response cache for the file list endpoints.
+
+一覧画面は同じページを何度も取り直すので、FileViewSet の一覧系アクションのレスポンスを
+「正規化したクエリ + カタログの世代番号」をキーにキャッシュする。
+
+  - 世代番号はファイル・タグ・フォルダへの書き込み（スキャンの登録、一括操作、タグ・フォルダの
+    編集など）のたびに 1 つ進める。古い世代のキーは参照されなくなり、期限切れで消える
+  - 世代番号は DB（videos.generations）に置くので、Celery や別ワーカーの書き込みもすぐ反映される
+  - キャッシュの実体は Django の CACHES[FILE_LIST_CACHE_ALIAS]（locmem / ファイル / Redis）
+  - ETag（弱い ETag。世代番号 + キー）を返すので、ブラウザは If-None-Match で再検証し、
+    変わっていなければ 304 だけを受け取る（クエリもシリアライズもしない）
+
+再生時の last_accessed の更新では世代を進めない（再生のたびに全キャッシュが無効になるため）。
+"""
+
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from . import generations
+from .models import File, Folder, Tag
+
+
+def _cache():
+    return caches[getattr(settings, "FILE_LIST_CACHE_ALIAS", "default")]
+
+
+def enabled() -> bool:
+    return getattr(settings, "FILE_LIST_CACHE_ENABLED", True)
+
+
+def generation() -> int:
+    """現在の世代番号（DB の 1 行。別プロセスの書き込みで進んだものも見える）"""
+    return generations.current(generations.FILES)
+
+
+def bump() -> None:
+    """カタログが変わったことを記録する（コミット後に世代を進める）"""
+    if enabled():
+        generations.bump(generations.FILES)
+
+
+def cache_key(request) -> str:
+    """パスとクエリパラメータ（キー順に並べ替え）から作るキー。next の URL に使うホストも含める"""
+    params = sorted((name, request.query_params.getlist(name)) for name in request.query_params)
+    normalized = request.build_absolute_uri(request.path) + "?" + repr(params)
+    return hashlib.sha1(normalized.encode()).hexdigest()
+
+
+def cached_list(view_method):
+    """FileViewSet の一覧アクションに付けるデコレータ"""
+
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        if not enabled():
+            return view_method(self, request, *args, **kwargs)
+
+        # 世代は組み立てる前に読む（途中で書き込みがあっても古い世代のキーに入るだけ）
+        current = generation()
+        digest = cache_key(request)
+        etag = f'W/"{current:x}-{digest[:16]}"'
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+        # 弱い比較（W/ の有無は問わない）
+        if_none_match = parse_etags(request.headers.get("If-None-Match", ""))
+        if "*" in if_none_match or etag.removeprefix("W/") in {t.removeprefix("W/") for t in if_none_match}:
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        key = f"files:list:{current:x}:{digest}"
+        data = _cache().get(key)
+        if data is not None:
+            return Response(data, headers=headers)
+
+        response = view_method(self, request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            _cache().set(key, response.data, timeout=getattr(settings, "FILE_LIST_CACHE_TIMEOUT", 300))
+            for name, value in headers.items():
+                response[name] = value
+        return response
+
+    return wrapper
+
+
+# ------------------------------------------------------------------
+# 書き込みで世代を進める（queryset.update() / bulk_create の箇所は呼び出し側で bump()）
+# ------------------------------------------------------------------
+@receiver(post_save, sender=File)
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Folder)
+def _saved(sender, instance, update_fields=None, raw=False, **kwargs):
+    if raw:
+        return
+    if update_fields is not None and set(update_fields) <= {"last_accessed"}:
+        return
+    bump()
+
+
+@receiver(post_delete, sender=File)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Folder)
+def _deleted(sender, instance, **kwargs):
+    bump()
+
+
+@receiver(m2m_changed, sender=File.tags.through)
+@receiver(m2m_changed, sender=File.folders.through)
+def _relations_changed(sender, action, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        bump()
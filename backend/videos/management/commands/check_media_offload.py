@@ -0,0 +1,120 @@
+# backend/videos/management/commands/check_media_offload.py
+"""
+メディア配信（/api/files/<id>/stream/, /thumbnail/）のレスポンスヘッダをローカルで確認する。
+
+    python manage.py check_media_offload                     # 現在の MEDIA_OFFLOAD で確認
+    python manage.py check_media_offload --mode all          # 直接配信・x-accel-redirect・x-sendfile すべて
+    python manage.py check_media_offload --file-id 123
+
+nginx 等の設定前に、Django 側が期待どおりのヘッダを返しているかを確かめるためのもの。
+"""
+
+import os
+from urllib.parse import unquote
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+
+from videos.models import File
+
+MODES = ("", "x-accel-redirect", "x-sendfile")
+
+
+class Command(BaseCommand):
+    help = "Check media streaming / offload response headers for a file"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--file-id", type=int, help="確認に使うファイルの ID（省略時は最初の有効なファイル）")
+        parser.add_argument(
+            "--mode",
+            choices=["current", "all", "off", "x-accel-redirect", "x-sendfile"],
+            default="current",
+        )
+
+    def handle(self, *args, **options):
+        if options["file_id"]:
+            file = File.objects.filter(pk=options["file_id"]).first()
+        else:
+            file = File.objects.filter(delete_flag=False).order_by("id").first()
+        if file is None:
+            raise CommandError("No file to check.")
+
+        mode = options["mode"]
+        if mode == "current":
+            modes = [(getattr(settings, "MEDIA_OFFLOAD", "") or "").lower()]
+        elif mode == "all":
+            modes = list(MODES)
+        else:
+            modes = ["" if mode == "off" else mode]
+
+        self.failures = 0
+        hosts = list(settings.ALLOWED_HOSTS) + ["testserver"]
+        for m in modes:
+            self.stdout.write(f"== MEDIA_OFFLOAD={m or '(off)'} file_id={file.id}")
+            with override_settings(MEDIA_OFFLOAD=m, ALLOWED_HOSTS=hosts):
+                client = Client()
+                self._check_file(client, m, file, f"/api/files/{file.id}/stream/", file.file_path)
+                if file.thumbnail_file_path:
+                    self._check_file(
+                        client, m, file, f"/api/files/{file.id}/thumbnail/", file.thumbnail_file_path
+                    )
+                deleted = File.objects.filter(delete_flag=True).only("id").first()
+                if deleted is not None:
+                    r = client.get(f"/api/files/{deleted.id}/stream/")
+                    self._expect(r.status_code == 404, f"deleted file {deleted.id} -> {r.status_code}")
+
+        if self.failures:
+            raise CommandError(f"{self.failures} check(s) failed.")
+        self.stdout.write(self.style.SUCCESS("All checks passed."))
+
+    def _expect(self, ok: bool, message: str) -> None:
+        if ok:
+            self.stdout.write(f"  OK  {message}")
+        else:
+            self.failures += 1
+            self.stdout.write(self.style.ERROR(f"  NG  {message}"))
+
+    def _check_file(self, client, mode, file, url, rel_path):
+        abs_path = os.path.join(settings.MEDIA_ROOT, rel_path)
+        if file.delete_flag:
+            r = client.get(url)
+            self._expect(r.status_code == 404, f"{url} (deleted) -> {r.status_code}")
+            return
+
+        r = client.get(url, HTTP_RANGE="bytes=0-1")
+        headers = ", ".join(
+            f"{k}: {r[k]}" for k in ("Content-Type", "Content-Range", "X-Accel-Redirect", "X-Sendfile")
+            if r.has_header(k)
+        )
+        self.stdout.write(f"  GET {url} (Range: bytes=0-1) -> {r.status_code} [{headers}]")
+
+        if mode == "":
+            if not os.path.exists(abs_path):
+                self._expect(r.status_code == 404, f"missing file -> {r.status_code}")
+                return
+            body = b"".join(r.streaming_content) if r.streaming else r.content
+            self._expect(r.status_code == 206, "status 206")
+            self._expect(r.get("Accept-Ranges") == "bytes", "Accept-Ranges: bytes")
+            self._expect(
+                r.get("Content-Range", "").startswith("bytes 0-1/") and len(body) == 2,
+                "Content-Range / body length",
+            )
+            self._expect(r.has_header("ETag") and r.has_header("Last-Modified"), "ETag / Last-Modified")
+            r2 = client.get(url, HTTP_IF_NONE_MATCH=r.get("ETag", ""))
+            self._expect(r2.status_code == 304, f"If-None-Match -> {r2.status_code}")
+            return
+
+        body = b"".join(r.streaming_content) if r.streaming else r.content
+        self._expect(r.status_code == 200 and not body, "status 200 with empty body")
+        if mode == "x-accel-redirect":
+            prefix = getattr(settings, "MEDIA_OFFLOAD_ACCEL_PREFIX", "/protected-media/").rstrip("/") + "/"
+            target = r.get("X-Accel-Redirect", "")
+            self._expect(
+                target.startswith(prefix) and unquote(target[len(prefix):]) == rel_path.replace("\\", "/"),
+                f"X-Accel-Redirect maps to {prefix}{rel_path}",
+            )
+        else:
+            target = unquote(r.get("X-Sendfile", ""))
+            self._expect(target == os.path.abspath(abs_path), "X-Sendfile is the absolute path")
+            self._expect(os.path.exists(target), "X-Sendfile target exists")
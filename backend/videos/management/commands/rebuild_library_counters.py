@@ -0,0 +1,21 @@
+# backend/videos/management/commands/rebuild_library_counters.py
+"""
+ライブラリの集計値（LibraryCounters）を DB から数え直す。
+
+    python manage.py rebuild_library_counters
+
+通常は書き込みのたびに差分更新されるので、DB を直接編集した後などの整合性回復用。
+"""
+
+from django.core.management.base import BaseCommand
+
+from videos.counters import rebuild
+
+
+class Command(BaseCommand):
+    help = "Recount library counters (file counts, total bytes, total duration)"
+
+    def handle(self, *args, **options):
+        values = rebuild()
+        summary = ", ".join(f"{name}={value}" for name, value in values.items())
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt library counters: {summary}"))
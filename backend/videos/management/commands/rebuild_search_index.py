@@ -0,0 +1,20 @@
+# backend/videos/management/commands/rebuild_search_index.py
+"""
+全ファイルの検索用テキスト（File.search_text）を作り直す。
+
+    python manage.py rebuild_search_index
+
+通常はスキャン・タグ編集で差分更新されるので、DB を直接編集した後などの整合性回復用。
+"""
+
+from django.core.management.base import BaseCommand
+
+from videos.search import rebuild
+
+
+class Command(BaseCommand):
+    help = "Rebuild File.search_text for all files"
+
+    def handle(self, *args, **options):
+        count = rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt search text for {count} files."))
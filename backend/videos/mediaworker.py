@@ -0,0 +1,44 @@
+# backend/videos/mediaworker.py
+"""
+Entry points run in the scan pipeline's media process pool.
+
+子プロセス（spawn）は関数を受け取るときにこのモジュールを import するので、ここではモデルを
+読み込まない（Django の初期化は init() で行い、utils などは関数の中で import する）。
+"""
+
+import os
+
+
+def init() -> None:
+    # 親プロセスの DJANGO_SETTINGS_MODULE を引き継いで設定を読み直す（DB は使わない）
+    import django
+
+    django.setup()
+
+
+def process_media(file_path: str, filename: str, artifacts) -> tuple[dict | None, dict, str | None]:
+    """
+    1 ファイル分の動画情報取得・派生ファイル生成。
+    (動画情報, metadata に足すもの, サムネイルの相対パス) を返す
+    """
+    from .utils import get_video_info, create_video_artifacts
+    from .mp4 import is_mp4, faststart_info
+
+    metadata = {}
+    info = get_video_info(file_path)
+    if info:
+        # ブラウザ再生可否（remux の判定）に使う
+        metadata["audio_codec"] = info["audio_codec"]
+    if is_mp4(file_path):
+        # moov が末尾だと再生開始が遅い（atom ヘッダを読むだけなので軽い）
+        layout = faststart_info(file_path)
+        if layout:
+            metadata["faststart"] = layout["faststart"]
+
+    # サムネイル等の派生ファイルを 1 回のデコードでまとめて生成（相対パス。例: webp/xxx.webp）
+    produced = create_video_artifacts(file_path, os.path.splitext(filename)[0], artifacts, info)
+    if "preview" in produced:
+        metadata["preview_path"] = produced["preview"]
+    if "storyboard" in produced:
+        metadata["storyboard"] = produced["storyboard"]
+    return info, metadata, produced.get("thumbnail")
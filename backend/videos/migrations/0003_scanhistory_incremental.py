@@ -0,0 +1,33 @@
+# Generated by Django 5.0.1 on 2026-10-17 05:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('videos', '0002_file_file_path_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scanhistory',
+            name='dirs_skipped',
+            field=models.IntegerField(default=0, verbose_name='スキップしたディレクトリ数'),
+        ),
+        migrations.AddField(
+            model_name='scanhistory',
+            name='files_vanished',
+            field=models.IntegerField(default=0, verbose_name='消失ファイル数'),
+        ),
+        migrations.AddField(
+            model_name='scanhistory',
+            name='scan_mode',
+            field=models.CharField(choices=[('full', 'フル'), ('incremental', '差分')], default='full', max_length=20, verbose_name='スキャンモード'),
+        ),
+        migrations.AddField(
+            model_name='scanhistory',
+            name='snapshot_hits',
+            field=models.IntegerField(default=0, verbose_name='変更なしファイル数'),
+        ),
+    ]
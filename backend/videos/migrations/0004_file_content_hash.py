@@ -0,0 +1,23 @@
+# Generated by Django 5.0.1 on 2026-10-17 05:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('videos', '0003_scanhistory_incremental'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='file',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True, verbose_name='内容ハッシュ'),
+        ),
+        migrations.AddField(
+            model_name='file',
+            name='content_hash_mtime',
+            field=models.BigIntegerField(blank=True, null=True, verbose_name='内容ハッシュ計算時のmtime(ns)'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.1 on 2026-10-17 05:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('videos', '0004_file_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='file',
+            name='duplicate_group',
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True, verbose_name='重複グループ'),
+        ),
+    ]
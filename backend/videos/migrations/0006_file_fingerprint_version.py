@@ -0,0 +1,26 @@
+# Generated by Django 5.0.1 on 2026-10-17 05:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('videos', '0005_file_duplicate_group'),
+    ]
+
+    operations = [
+        # 既存行の md5_hash は旧方式（先頭 10MB の MD5）なので 1 で埋める。
+        # 再計算は重複判定で必要になった時点（videos.dedup）または
+        # upgrade_fingerprints タスクで少しずつ行う
+        migrations.AddField(
+            model_name='file',
+            name='fingerprint_version',
+            field=models.PositiveSmallIntegerField(default=1, verbose_name='指紋方式'),
+        ),
+        migrations.AlterField(
+            model_name='file',
+            name='fingerprint_version',
+            field=models.PositiveSmallIntegerField(default=2, verbose_name='指紋方式'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.0.1 on 2026-10-17 06:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('videos', '0006_file_fingerprint_version'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='file',
+            index=models.Index(fields=['delete_flag', 'created_at', 'id'], name='files_delete__26f3d3_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='file',
+            index=models.Index(fields=['delete_flag', 'file_name', 'id'], name='files_delete__d4333d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='file',
+            index=models.Index(fields=['delete_flag', 'file_size', 'id'], name='files_delete__2d5600_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='file',
+            index=models.Index(fields=['delete_flag', 'video_duration', 'id'], name='files_delete__9cfefe_idx'),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.0.1 on 2026-10-17 06:11
+
+from django.db import migrations, models
+
+
+def fill_search_text(apps, schema_editor):
+    from videos.search import build_search_text
+
+    File = apps.get_model('videos', 'File')
+    Through = File.tags.through
+    last_id = 0
+    while True:
+        rows = list(
+            File.objects.filter(id__gt=last_id).order_by('id').values_list('id', 'file_name', 'file_path')[:2000]
+        )
+        if not rows:
+            return
+        ids = [r[0] for r in rows]
+        tag_names = {pk: [] for pk in ids}
+        for file_id, tag_name in Through.objects.filter(file_id__in=ids).values_list('file_id', 'tag__tag_name'):
+            tag_names[file_id].append(tag_name)
+        File.objects.bulk_update(
+            [File(id=pk, search_text=build_search_text(name, path, tag_names[pk])) for pk, name, path in rows],
+            ['search_text'],
+            batch_size=500,
+        )
+        last_id = ids[-1]
+
+
+def create_fulltext_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    # 既定のストップワード（a, i, in, to など）を含む 2-gram は索引に入らず、
+    # 英数字のファイル名が引けなくなるので無効にしてから作る（作成時の設定が索引に残る）
+    schema_editor.execute("SET SESSION innodb_ft_enable_stopword = OFF")
+    schema_editor.execute(
+        "CREATE FULLTEXT INDEX files_search_text_ft ON files (search_text) WITH PARSER ngram"
+    )
+
+
+def drop_fulltext_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    schema_editor.execute("DROP INDEX files_search_text_ft ON files")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('videos', '0007_file_list_cursor_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='file',
+            name='search_text',
+            field=models.TextField(blank=True, default='', editable=False, verbose_name='検索用テキスト'),
+        ),
+        migrations.RunPython(fill_search_text, migrations.RunPython.noop),
+        migrations.RunPython(create_fulltext_index, drop_fulltext_index),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.0.1 on 2026-10-17 06:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def fill_closure(apps, schema_editor):
+    Folder = apps.get_model('videos', 'Folder')
+    FolderClosure = apps.get_model('videos', 'FolderClosure')
+    parents = dict(Folder.objects.values_list('id', 'parent_id'))
+    rows = []
+    for folder_id in parents:
+        # 親を辿って祖先ごとに 1 行（循環していたらそこで止める）
+        current, depth, seen = folder_id, 0, set()
+        while current is not None and current not in seen:
+            seen.add(current)
+            rows.append(FolderClosure(ancestor_id=current, descendant_id=folder_id, depth=depth))
+            current, depth = parents.get(current), depth + 1
+    FolderClosure.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('videos', '0008_file_search_text'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FolderClosure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveIntegerField(verbose_name='階層の差')),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descendant_links', to='videos.folder')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_links', to='videos.folder')),
+            ],
+            options={
+                'verbose_name': 'フォルダ階層',
+                'verbose_name_plural': 'フォルダ階層',
+                'db_table': 'folder_closure',
+                'indexes': [models.Index(fields=['descendant', 'depth'], name='folder_clos_descend_f1b10a_idx')],
+                'unique_together': {('ancestor', 'descendant')},
+            },
+        ),
+        migrations.RunPython(fill_closure, migrations.RunPython.noop),
+    ]
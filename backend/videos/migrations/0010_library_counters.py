@@ -0,0 +1,53 @@
+# Generated by Django 5.0.1 on 2026-10-17 06:20
+
+from django.db import migrations, models
+from django.db.models import Count, Exists, OuterRef, Q, Sum
+from django.utils import timezone
+
+
+def count_library(apps, schema_editor):
+    File = apps.get_model('videos', 'File')
+    LibraryCounters = apps.get_model('videos', 'LibraryCounters')
+    active = Q(delete_flag=False)
+    in_folder = Exists(File.folders.through.objects.filter(file_id=OuterRef('pk')))
+    values = File.objects.aggregate(
+        file_count=Count('id', filter=active),
+        no_folder_count=Count('id', filter=active & ~Q(in_folder)),
+        deleted_count=Count('id', filter=Q(delete_flag=True)),
+        duplicate_count=Count('id', filter=Q(duplicate_flag=True)),
+        total_bytes=Sum('file_size', filter=active),
+        total_duration=Sum('video_duration', filter=active),
+    )
+    LibraryCounters.objects.create(
+        id=1, rebuilt_at=timezone.now(), **{name: value or 0 for name, value in values.items()}
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('videos', '0009_folder_closure'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LibraryCounters',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file_count', models.IntegerField(default=0, verbose_name='ファイル数（削除除く）')),
+                ('no_folder_count', models.IntegerField(default=0, verbose_name='フォルダ未所属のファイル数（削除除く）')),
+                ('deleted_count', models.IntegerField(default=0, verbose_name='削除フラグのファイル数')),
+                ('duplicate_count', models.IntegerField(default=0, verbose_name='重複フラグのファイル数')),
+                ('total_bytes', models.BigIntegerField(default=0, verbose_name='合計サイズ（削除除く）')),
+                ('total_duration', models.FloatField(default=0, verbose_name='合計時間（秒。削除除く）')),
+                ('rebuilt_at', models.DateTimeField(blank=True, null=True, verbose_name='再集計日時')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'ライブラリ集計',
+                'verbose_name_plural': 'ライブラリ集計',
+                'db_table': 'library_counters',
+            },
+        ),
+        migrations.RunPython(count_library, migrations.RunPython.noop),
+    ]
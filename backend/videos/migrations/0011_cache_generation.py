@@ -0,0 +1,26 @@
+# Generated by Django 5.0.1 on 2026-10-17 06:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('videos', '0010_library_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CacheGeneration',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False, verbose_name='名前')),
+                ('value', models.BigIntegerField(default=0, verbose_name='世代番号')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'キャッシュ世代',
+                'verbose_name_plural': 'キャッシュ世代',
+                'db_table': 'cache_generations',
+            },
+        ),
+    ]
@@ -3,7 +3,7 @@ Models for video streaming application.
 """
 
 import hashlib
-from django.db import models
+from django.db import models, transaction
 from django.core.validators import MinValueValidator
 import json
 
@@ -73,24 +73,108 @@ class Folder(models.Model):
         unique_together = [['folder_name', 'parent']]
 
     def __str__(self):
-        if self.parent:
-            return f"{self.parent} / {self.folder_name}"
-        return self.folder_name
+        return " / ".join(self.get_path_names())
+
+    def get_path_names(self):
+        """ルートから自身までのフォルダ名（閉包テーブルを 1 クエリで引く）"""
+        if self.pk is None:
+            # 未保存のフォルダは閉包テーブルに行が無い
+            return [*(self.parent.get_path_names() if self.parent else []), self.folder_name]
+        return list(
+            FolderClosure.objects.filter(descendant_id=self.pk)
+            .order_by('-depth')
+            .values_list('ancestor__folder_name', flat=True)
+        )
 
     def get_full_path(self):
         """フルパスを取得"""
-        if self.parent:
-            return f"{self.parent.get_full_path()}/{self.folder_name}"
-        return self.folder_name
+        return "/".join(self.get_path_names())
 
     def get_ancestors(self):
-        """祖先フォルダのリストを取得"""
-        ancestors = []
-        current = self.parent
-        while current:
-            ancestors.insert(0, current)
-            current = current.parent
-        return ancestors
+        """祖先フォルダのリストを取得（ルートから順）"""
+        return list(
+            Folder.objects.filter(
+                descendant_links__descendant_id=self.pk, descendant_links__depth__gt=0
+            ).order_by('-descendant_links__depth')
+        )
+
+    def get_descendants(self, include_self=False):
+        """子孫フォルダの QuerySet"""
+        return Folder.objects.filter(
+            ancestor_links__ancestor_id=self.pk,
+            ancestor_links__depth__gte=0 if include_self else 1,
+        )
+
+    def is_descendant_of(self, folder) -> bool:
+        """folder 自身またはその子孫かどうか"""
+        return FolderClosure.objects.filter(ancestor_id=folder.pk, descendant_id=self.pk).exists()
+
+    def save(self, *args, **kwargs):
+        # 作成・移動（parent の変更）のときは閉包テーブルも同じトランザクションで更新する
+        with transaction.atomic():
+            adding = self._state.adding
+            old_parent_id = None
+            if not adding:
+                old_parent_id = (
+                    Folder.objects.filter(pk=self.pk).values_list('parent_id', flat=True).first()
+                )
+            super().save(*args, **kwargs)
+            if adding:
+                FolderClosure.insert_leaf(self)
+            elif old_parent_id != self.parent_id:
+                FolderClosure.move_subtree(self)
+
+
+class FolderClosure(models.Model):
+    """
+    フォルダ階層の閉包テーブル（祖先・子孫の全組み合わせと距離。自身は depth=0）。
+    祖先・子孫・フルパス・配下のファイルの取得を再帰なしの 1 クエリで行うためのもの。
+    Folder.save() が作成・移動時に更新し、削除は外部キーの CASCADE で消える。
+    """
+    ancestor = models.ForeignKey(Folder, on_delete=models.CASCADE, related_name='descendant_links')
+    descendant = models.ForeignKey(Folder, on_delete=models.CASCADE, related_name='ancestor_links')
+    depth = models.PositiveIntegerField(verbose_name='階層の差')
+
+    class Meta:
+        db_table = 'folder_closure'
+        verbose_name = 'フォルダ階層'
+        verbose_name_plural = 'フォルダ階層'
+        unique_together = [['ancestor', 'descendant']]
+        indexes = [
+            models.Index(fields=['descendant', 'depth']),
+        ]
+
+    @classmethod
+    def insert_leaf(cls, folder):
+        """新しいフォルダの行（親の祖先すべて + 自身）を追加"""
+        rows = [cls(ancestor_id=folder.pk, descendant_id=folder.pk, depth=0)]
+        if folder.parent_id:
+            rows += [
+                cls(ancestor_id=ancestor_id, descendant_id=folder.pk, depth=depth + 1)
+                for ancestor_id, depth in cls.objects.filter(
+                    descendant_id=folder.parent_id
+                ).values_list('ancestor_id', 'depth')
+            ]
+        cls.objects.bulk_create(rows)
+
+    @classmethod
+    def move_subtree(cls, folder):
+        """folder 以下を新しい親の下へ付け替える（部分木の外の祖先との行を作り直す）"""
+        subtree = list(cls.objects.filter(ancestor_id=folder.pk).values_list('descendant_id', 'depth'))
+        subtree_ids = [descendant_id for descendant_id, _ in subtree]
+        cls.objects.filter(descendant_id__in=subtree_ids).exclude(ancestor_id__in=subtree_ids).delete()
+        if folder.parent_id:
+            ancestors = list(
+                cls.objects.filter(descendant_id=folder.parent_id).values_list('ancestor_id', 'depth')
+            )
+            cls.objects.bulk_create(
+                [
+                    cls(ancestor_id=ancestor_id, descendant_id=descendant_id, depth=up + down + 1)
+                    for ancestor_id, up in ancestors
+                    for descendant_id, down in subtree
+                ],
+                batch_size=1000,
+            )
 
 
 class File(models.Model):
@@ -102,12 +186,21 @@ class File(models.Model):
 
     file_size = models.BigIntegerField(validators=[MinValueValidator(0)], verbose_name='ファイルサイズ（バイト）')
     md5_hash = models.CharField(max_length=32, db_index=True, verbose_name='MD5ハッシュ')
+    # md5_hash の計算方式（videos.utils.FINGERPRINT_VERSION 参照）。古い方式の行は必要時に再計算する
+    fingerprint_version = models.PositiveSmallIntegerField(default=2, verbose_name='指紋方式')
+    # 重複確定用の全体ハッシュ（サイズ・先頭ハッシュが衝突したファイルだけ計算する）
+    content_hash = models.CharField(max_length=64, null=True, blank=True, db_index=True, verbose_name='内容ハッシュ')
+    content_hash_mtime = models.BigIntegerField(null=True, blank=True, verbose_name='内容ハッシュ計算時のmtime(ns)')
     video_duration = models.FloatField(null=True, blank=True, validators=[MinValueValidator(0)], verbose_name='動画の長さ（秒）')
     folders = models.ManyToManyField(Folder, related_name='files', blank=True, verbose_name='所属フォルダ')
     tags = models.ManyToManyField('Tag', related_name='files', blank=True, verbose_name='タグ')
     delete_flag = models.BooleanField(default=False, db_index=True, verbose_name='削除フラグ')
     duplicate_flag = models.BooleanField(default=False, db_index=True, verbose_name='重複フラグ')
+    # 重複グループのキー（"<file_size>-<content_hash>"）。重複でなければ NULL
+    duplicate_group = models.CharField(max_length=64, null=True, blank=True, db_index=True, verbose_name='重複グループ')
     thumbnail_file_path = models.CharField(max_length=255, null=True, blank=True, verbose_name='サムネイルGIFパス')
+    # 検索用に正規化したファイル名・ディレクトリ・タグ名（videos.search が更新する。MySQL では FULLTEXT ngram）
+    search_text = models.TextField(blank=True, default='', editable=False, verbose_name='検索用テキスト')
 
     # メタデータ用のJSONフィールド
     metadata = models.JSONField(default=dict, blank=True, verbose_name='メタデータ')
@@ -131,6 +224,11 @@ class File(models.Model):
         indexes = [
             models.Index(fields=['file_size', 'md5_hash']),
             models.Index(fields=['delete_flag', 'duplicate_flag']),
+            # 一覧のカーソルページネーション（ソート列 + id）用
+            models.Index(fields=['delete_flag', 'created_at', 'id']),
+            models.Index(fields=['delete_flag', 'file_name', 'id']),
+            models.Index(fields=['delete_flag', 'file_size', 'id']),
+            models.Index(fields=['delete_flag', 'video_duration', 'id']),
         ]
 
     def __str__(self):
@@ -185,10 +283,81 @@ class File(models.Model):
 
     # ここに save() を追加してハッシュをセットする（既存メソッドは消していません）
     def save(self, *args, **kwargs):
+        from . import counters
+
         # file_path が設定されているなら SHA-256 を計算して file_path_hash に入れる
         if self.file_path:
             self.file_path_hash = sha256_hex(self.file_path)
-        super().save(*args, **kwargs)
+        if self._state.adding:
+            with transaction.atomic():
+                super().save(*args, **kwargs)
+                counters.record_created([self])
+            self._counted_values = self._counted_snapshot()
+            return
+        update_fields = kwargs.get('update_fields')
+        saving = counters.COUNTED_FIELDS if update_fields is None else counters.COUNTED_FIELDS & set(update_fields)
+        current = self._counted_snapshot()
+        loaded = getattr(self, '_counted_values', None)
+        # 読み込んだ時から値が変わった列だけを見る（読み込み時の値が無ければ変わり得るものとして扱う）
+        changed = {
+            name for name in saving
+            if name in current and (loaded is None or name not in loaded or loaded[name] != current[name])
+        }
+        if not changed:
+            super().save(*args, **kwargs)
+        else:
+            # フラグ・サイズ・長さが変わる保存はライブラリの集計値も同じトランザクションで更新する
+            with counters.tracking([self.pk]):
+                super().save(*args, **kwargs)
+        self._counted_values = {**(loaded or {}), **{name: current[name] for name in saving if name in current}}
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # 集計対象の列の読み込み時の値（save() で変わっていなければ集計を取り直さない）
+        instance._counted_values = instance._counted_snapshot()
+        return instance
+
+    def _counted_snapshot(self):
+        from . import counters
+
+        deferred = self.get_deferred_fields()
+        return {name: getattr(self, name) for name in counters.COUNTED_FIELDS if name not in deferred}
+
+
+class LibraryCounters(models.Model):
+    """
+    ライブラリ全体の集計値（1 行だけ）。サイドバー・一覧の件数を COUNT(*) せずに返すためのもの。
+    videos.counters がフラグ・フォルダ所属・スキャンの変更と同じトランザクションで差分更新する。
+    """
+    file_count = models.IntegerField(default=0, verbose_name='ファイル数（削除除く）')
+    no_folder_count = models.IntegerField(default=0, verbose_name='フォルダ未所属のファイル数（削除除く）')
+    deleted_count = models.IntegerField(default=0, verbose_name='削除フラグのファイル数')
+    duplicate_count = models.IntegerField(default=0, verbose_name='重複フラグのファイル数')
+    total_bytes = models.BigIntegerField(default=0, verbose_name='合計サイズ（削除除く）')
+    total_duration = models.FloatField(default=0, verbose_name='合計時間（秒。削除除く）')
+    rebuilt_at = models.DateTimeField(null=True, blank=True, verbose_name='再集計日時')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'library_counters'
+        verbose_name = 'ライブラリ集計'
+        verbose_name_plural = 'ライブラリ集計'
+
+
+class CacheGeneration(models.Model):
+    """
+    キャッシュの世代番号（名前ごとに 1 行）。一覧・フォルダツリーのキャッシュキーに使う。
+    DB に置くので、Celery や別の gunicorn ワーカーでの書き込みもすべてのプロセスに届く。
+    """
+    name = models.CharField(max_length=50, primary_key=True, verbose_name='名前')
+    value = models.BigIntegerField(default=0, verbose_name='世代番号')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'cache_generations'
+        verbose_name = 'キャッシュ世代'
+        verbose_name_plural = 'キャッシュ世代'
 
 
 class ScanHistory(models.Model):
@@ -205,10 +374,22 @@ class ScanHistory(models.Model):
         default='running',
         verbose_name='ステータス'
     )
+    scan_mode = models.CharField(
+        max_length=20,
+        choices=[
+            ('full', 'フル'),
+            ('incremental', '差分'),
+        ],
+        default='full',
+        verbose_name='スキャンモード'
+    )
     files_scanned = models.IntegerField(default=0, verbose_name='スキャン済みファイル数')
     files_added = models.IntegerField(default=0, verbose_name='追加ファイル数')
     files_updated = models.IntegerField(default=0, verbose_name='更新ファイル数')
     duplicates_found = models.IntegerField(default=0, verbose_name='重複ファイル数')
+    files_vanished = models.IntegerField(default=0, verbose_name='消失ファイル数')
+    dirs_skipped = models.IntegerField(default=0, verbose_name='スキップしたディレクトリ数')
+    snapshot_hits = models.IntegerField(default=0, verbose_name='変更なしファイル数')
     errors = models.JSONField(default=list, blank=True, verbose_name='エラー')
 
     class Meta:
@@ -0,0 +1,189 @@
+# backend/videos/mp4.py
+"""
+MP4 / MOV top-level atom inspection and faststart relocation.
+
+moov が末尾にある MP4 は、ブラウザが先頭を読んだあと末尾へのレンジ要求（またはファイル全体の
+読み込み）をしないと最初のフレームを出せない。スキャン時にトップレベルの atom ヘッダだけを
+読んで（ファイルサイズに関係なく数回の小さな読み込み）faststart かどうかを記録し、
+必要なら ffmpeg のストリームコピー（-movflags +faststart）で moov を先頭に移す。
+
+  - FASTSTART_FIX = ""         何もしない（判定と記録のみ）
+  - FASTSTART_FIX = "cache"    faststart 版を FASTSTART_CACHE_DIR に作り、配信時に差し替える
+  - FASTSTART_FIX = "rewrite"  元ファイルそのものを置き換える
+"""
+
+import os
+import time
+import struct
+import logging
+import subprocess
+
+import ffmpeg  # ffmpeg-python
+
+from django.conf import settings
+
+from . import cache
+
+logger = logging.getLogger("videos")
+
+MP4_EXTS = {".mp4", ".m4v", ".mov"}
+
+# ヘッダを読む atom 数の上限（壊れたファイルで延々と読まないように）
+_MAX_ATOMS = 64
+
+
+def is_mp4(path: str) -> bool:
+    return os.path.splitext(path)[1].lower() in MP4_EXTS
+
+
+def top_level_atoms(path: str) -> list[tuple[str, int, int]]:
+    """
+    トップレベル atom を (type, offset, size) で返す。中身は読まずにヘッダだけを辿る。
+    size=1 は 64bit の largesize、size=0 は「ファイル末尾まで」。
+    """
+    atoms = []
+    with open(path, "rb") as f:
+        file_size = os.fstat(f.fileno()).st_size
+        offset = 0
+        while offset + 8 <= file_size and len(atoms) < _MAX_ATOMS:
+            f.seek(offset)
+            header = f.read(16)
+            if len(header) < 8:
+                break
+            size, kind = struct.unpack(">I4s", header[:8])
+            if size == 1:
+                if len(header) < 16:
+                    break
+                size = struct.unpack(">Q", header[8:16])[0]
+            elif size == 0:
+                size = file_size - offset
+            if size < 8:
+                # 壊れている（またはMP4ではない）
+                break
+            atoms.append((kind.decode("latin-1"), offset, size))
+            offset += size
+    return atoms
+
+
+def faststart_info(path: str) -> dict | None:
+    """
+    moov / mdat の位置から faststart かどうかを判定する。MP4 として読めなければ None。
+    """
+    try:
+        atoms = top_level_atoms(path)
+    except OSError as e:
+        logger.warning(f"Could not read MP4 atoms of {path}: {e}")
+        return None
+    offsets = {}
+    for kind, offset, _ in atoms:
+        offsets.setdefault(kind, offset)
+    if "moov" not in offsets or not atoms or atoms[0][0] not in ("ftyp", "free", "skip", "wide"):
+        return None
+    mdat = offsets.get("mdat")
+    return {
+        "faststart": mdat is None or offsets["moov"] < mdat,
+        "moov_offset": offsets["moov"],
+    }
+
+
+def _cache_dir() -> str:
+    return getattr(settings, "FASTSTART_CACHE_DIR", os.path.join(settings.MEDIA_ROOT, "faststart"))
+
+
+def cache_path_for(file_id: int, st: os.stat_result) -> str:
+    return os.path.join(_cache_dir(), f"{cache.source_key(file_id, st)}.mp4")
+
+
+def find_cached_copy(file_id: int, src_path: str) -> str | None:
+    """faststart 版のキャッシュがあればパスを返す（LRU 用に atime を更新する）"""
+    path = cache_path_for(file_id, os.stat(src_path))
+    if not os.path.exists(path):
+        return None
+    cache.touch(path)
+    return path
+
+
+def evict() -> int:
+    return cache.evict_lru(
+        _cache_dir(), getattr(settings, "FASTSTART_CACHE_MAX_BYTES", 50 * 1024 ** 3), (".mp4",)
+    )
+
+
+def _stream_types(path: str) -> list[str] | None:
+    """ストリームの種類（video / audio / subtitle / data ...）を並び順で返す。読めなければ None"""
+    try:
+        return [s.get("codec_type") for s in ffmpeg.probe(path)["streams"]]
+    except (ffmpeg.Error, OSError, KeyError, ValueError):
+        return None
+
+
+def _copy_faststart(src_path: str, part_path: str, all_streams: bool) -> None:
+    source = ffmpeg.input(src_path)
+    # 入力ノードそのものを渡すと -map 0（字幕・チャプター・データトラックを含む全ストリーム）
+    streams = [source] if all_streams else [source["v"], source["a?"]]
+    (
+        ffmpeg.output(
+            *streams,
+            part_path,
+            format="mov" if src_path.lower().endswith(".mov") else "mp4",
+            codec="copy",
+            map_metadata=0,
+            movflags="+faststart",
+        )
+        .global_args("-nostdin", "-loglevel", "error")
+        .overwrite_output()
+        .run(cmd=getattr(settings, "FFMPEG_BINARY", "ffmpeg"), capture_stdout=True, capture_stderr=True)
+    )
+
+
+def relocate_moov(src_path: str, out_path: str, keep_all_streams: bool = True) -> bool:
+    """
+    ストリームコピーで moov を先頭に移した MP4 を out_path に作る（再エンコードなし）。
+    全ストリームをコピーし、出力のストリーム構成が元と一致しなければ失敗にする
+    （rewrite では元ファイルを置き換えるので、字幕などが 1 本でも欠けたら使わない）。
+    keep_all_streams=False（キャッシュ用。元ファイルは残る）のときだけ、全ストリームで
+    失敗したら映像・音声だけで作り直す。書き出しは .part 経由。
+    """
+    part_path = f"{out_path}.part"
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    attempts = (True,) if keep_all_streams else (True, False)
+    for all_streams in attempts:
+        try:
+            _copy_faststart(src_path, part_path, all_streams)
+            info = faststart_info(part_path)
+            if not info or not info["faststart"]:
+                raise RuntimeError("output is not faststart")
+            if all_streams:
+                expected = _stream_types(src_path)
+                if expected is None or _stream_types(part_path) != expected:
+                    raise RuntimeError(f"output does not keep all streams ({expected})")
+            os.replace(part_path, out_path)
+            return True
+        except (ffmpeg.Error, RuntimeError, OSError) as e:
+            detail = e.stderr.decode(errors="replace") if getattr(e, "stderr", None) else e
+            logger.error(
+                f"moov relocation ({'all streams' if all_streams else 'video/audio only'}) "
+                f"failed for {src_path}: {detail}"
+            )
+            if os.path.exists(part_path):
+                os.remove(part_path)
+    return False
+
+
+def first_frame_ms(path: str) -> float | None:
+    """
+    ffmpeg が開いてから最初の映像フレームをデコードし終えるまでの時間（ミリ秒）。
+    moov が末尾にあるとその分の読み込みが先に必要になる。
+    """
+    cmd = [
+        getattr(settings, "FFMPEG_BINARY", "ffmpeg"),
+        "-nostdin", "-loglevel", "error",
+        "-i", path, "-map", "0:v:0", "-frames:v", "1", "-f", "null", "-",
+    ]
+    started = time.perf_counter()
+    try:
+        subprocess.run(cmd, capture_output=True, check=True, timeout=60)
+    except (OSError, subprocess.SubprocessError) as e:
+        logger.warning(f"Could not measure first frame time of {path}: {e}")
+        return None
+    return round((time.perf_counter() - started) * 1000, 1)
@@ -0,0 +1,181 @@
+# backend/videos/pagination.py
+"""
+Keyset (cursor) pagination for the file list endpoints.
+
+PageNumberPagination は深いページほど OFFSET の読み飛ばしが増え、毎ページ COUNT(*)
+（distinct() 付きの結合を含む）も実行する。ここでは「ソート列 + id」の組で位置を表し、
+次ページは直前のページの最後の行より後ろを条件で取得するので、どの深さでも
+1 ページ分の読み込みで済む。
+
+  - ?sort_by=<列> / -<列>  ソート（SORT_FIELDS と検索時の search_score。id を第 2 キーにして順序を一意にする）
+  - ?page_size=<n>         1 ページの件数（FILE_LIST_MAX_PAGE_SIZE まで）
+  - ?cursor=<token>        前のレスポンスの next に含まれる位置
+  - ?count=true            総件数も返す（既定では数えない。先頭ページでだけ指定する想定）
+
+NULL になり得る列は昇順で先頭・降順で末尾に並べる（MySQL の既定と同じなので索引が使える）。
+"""
+
+import json
+import base64
+import binascii
+from collections import OrderedDict
+from datetime import datetime
+
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from .models import File
+
+# カーソルで並べられる列（いずれも File の単純な列）
+SORT_FIELDS = {
+    "created_at",
+    "updated_at",
+    "last_accessed",
+    "file_name",
+    "file_size",
+    "video_duration",
+    "width",
+    "height",
+    "duplicate_group",
+}
+# クエリで注釈される列（検索の関連度）。カーソルに入れる値の型
+ANNOTATED_SORT_FIELDS = {"search_score": float}
+DEFAULT_SORT = "-created_at"
+
+
+def check_sort_key(queryset, key: str) -> str:
+    """
+    ソート指定（"<列>" / "-<列>"）がカーソルで並べられる列かを確かめる。
+    SORT_FIELDS 以外の列や、注釈されていない search_score（検索語なし）は 400
+    """
+    field = key[1:] if key.startswith("-") else key
+    if field not in SORT_FIELDS and not (
+        field in ANNOTATED_SORT_FIELDS and field in queryset.query.annotations
+    ):
+        raise ValidationError({"sort_by": f"Unsupported sort field: {key}"})
+    return key
+
+
+class FileCursorPagination(BasePagination):
+    """ソート列 + id によるキーセットページネーション（前方向のみ。無限スクロール用）"""
+
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+    count_query_param = "count"
+    invalid_cursor_message = "Invalid cursor"
+
+    def get_page_size(self, request) -> int:
+        default = getattr(settings, "REST_FRAMEWORK", {}).get("PAGE_SIZE") or 100
+        max_size = getattr(settings, "FILE_LIST_MAX_PAGE_SIZE", 500)
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, default))
+        except (TypeError, ValueError):
+            size = default
+        return max(1, min(size, max_size))
+
+    def get_sort_key(self, queryset) -> str:
+        """ビューで order_by() 済みの先頭の列を使う"""
+        ordering = [o for o in queryset.query.order_by if isinstance(o, str)]
+        return check_sort_key(queryset, ordering[0] if ordering else DEFAULT_SORT)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.sort_key = self.get_sort_key(queryset)
+        self.field = self.sort_key.lstrip("-")
+        self.descending = self.sort_key.startswith("-")
+        self.page_size = self.get_page_size(request)
+
+        self.count = None
+        if request.query_params.get(self.count_query_param, "").lower() == "true":
+            self.count = queryset.order_by().count()
+
+        column = F(self.field)
+        if self.descending:
+            queryset = queryset.order_by(column.desc(nulls_last=True), F("id").desc())
+        else:
+            queryset = queryset.order_by(column.asc(nulls_first=True), F("id").asc())
+
+        position = self.decode_cursor(request)
+        if position is not None:
+            queryset = queryset.filter(self._after(*position))
+
+        # 1 件多く取って次ページの有無を判定する（COUNT は使わない）
+        rows = list(queryset[: self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[: self.page_size]
+        return self.page
+
+    def _after(self, value, pk) -> Q:
+        """(列, id) が直前のページの最後の行より後ろにある条件"""
+        field = self.field
+        if not self.descending:
+            # 昇順: NULL → 値の小さい順
+            if value is None:
+                return Q(**{f"{field}__isnull": True, "id__gt": pk}) | Q(**{f"{field}__isnull": False})
+            return Q(**{f"{field}__gt": value}) | Q(**{field: value, "id__gt": pk})
+        # 降順: 値の大きい順 → NULL
+        if value is None:
+            return Q(**{f"{field}__isnull": True, "id__lt": pk})
+        return (
+            Q(**{f"{field}__lt": value})
+            | Q(**{field: value, "id__lt": pk})
+            | Q(**{f"{field}__isnull": True})
+        )
+
+    def encode_cursor(self, row) -> str:
+        value = row[self.field] if isinstance(row, dict) else getattr(row, self.field)
+        pk = row["id"] if isinstance(row, dict) else row.pk
+        if isinstance(value, datetime):
+            # マイクロ秒まで残す（丸めると同じ値の行を飛ばしてしまう）
+            value = value.isoformat()
+        payload = json.dumps({"s": self.sort_key, "v": value, "id": pk}, separators=(",", ":"))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+            # ソートを変えたら古いカーソルは使えない
+            if payload["s"] != self.sort_key:
+                raise ValueError(payload["s"])
+            value = payload["v"]
+            if value is not None and self.field in ANNOTATED_SORT_FIELDS:
+                value = ANNOTATED_SORT_FIELDS[self.field](value)
+            elif value is not None:
+                value = File._meta.get_field(self.field).to_python(value)
+            return value, int(payload["id"])
+        except (TypeError, ValueError, KeyError, binascii.Error, DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        url = self.request.build_absolute_uri()
+        # 総件数は先頭ページだけで十分
+        url = remove_query_param(url, self.count_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+
+    def get_paginated_response(self, data):
+        body = OrderedDict([("next", self.get_next_link()), ("results", data)])
+        if self.count is not None:
+            body["count"] = self.count
+            body.move_to_end("count", last=False)
+        return Response(body)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "count": {"type": "integer", "example": 123},
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
@@ -0,0 +1,332 @@
+# backend/videos/pipeline.py
+"""
+Multi-stage ingest pipeline used by scan_video_directory.
+
+  submit() ──> [hash queue] ──> 指紋計算ワーカー（スレッド。I/O 待ち主体）
+           ──> [media queue] ──> ffprobe / サムネイル生成（プロセスプール）
+           ──> [write queue] ──> DB 書き込み（単一スレッドでバッチ bulk_create）
+
+走査側はディレクトリを読みながら submit() するので、走査と指紋計算・サムネイル生成は重なって進む。
+各キューは上限付きなので、下流が詰まると submit() がブロックして走査側に背圧がかかる。
+どこかのステージのスレッドが落ちた場合は、キューで待っている側（submit() / close() を含む）が
+PipelineError で抜ける（書き込みスレッドが落ちたまま put() で待ち続け、スキャンのロックを
+握ったまま止まることはない）。
+"""
+
+import os
+import queue
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import File, sha256_hex
+from . import counters, mediaworker
+
+logger = logging.getLogger("videos")
+
+_STOP = object()
+# キューの待ちの間隔（秒）。この間隔で他のステージが落ちていないかを確かめる
+_POLL = 0.5
+
+
+class PipelineError(RuntimeError):
+    """パイプラインのステージが異常終了した"""
+
+
+@dataclass
+class IngestItem:
+    """パイプラインを流れる新規ファイル 1 件分の情報"""
+    relative_path: str
+    file_path: str
+    filename: str
+    file_size: int
+    md5_hash: str | None = None
+    info: dict | None = None
+    thumbnail_file_path: str | None = None
+    metadata: dict = field(default_factory=dict)
+
+
+@dataclass
+class PipelineStats:
+    added: int = 0
+    # 追加したファイルのサイズ（重複グループの差分再計算に使う）
+    added_sizes: set = field(default_factory=set)
+    errors: list = field(default_factory=list)
+    # 処理に失敗した relative_path（スナップショットから除外して次回再処理させる）
+    failed: set = field(default_factory=set)
+
+
+class ScanPipeline:
+    """
+    新規ファイルの指紋計算・動画情報取得・サムネイル生成・DB 登録を並列に行う。
+
+    動画情報・サムネイルはプロセスプール（SCAN_MEDIA_WORKERS 個。ffprobe の出力の解析や
+    代表フレームの選定も GIL を取り合わない）で処理し、media スレッドはプールへの受け渡しと
+    キューの背圧だけを受け持つ。
+    """
+
+    def __init__(
+        self,
+        webp_dir: str,
+        hash_workers: int | None = None,
+        media_workers: int | None = None,
+        queue_size: int | None = None,
+        batch_size: int | None = None,
+    ):
+        self.webp_dir = webp_dir
+        self.hash_workers = hash_workers or getattr(settings, "SCAN_HASH_WORKERS", 4)
+        self.media_workers = media_workers or getattr(settings, "SCAN_MEDIA_WORKERS", None) or (os.cpu_count() or 2)
+        self.batch_size = batch_size or getattr(settings, "SCAN_DB_BATCH_SIZE", 200)
+        queue_size = queue_size or getattr(settings, "SCAN_QUEUE_SIZE", 64)
+        # 部分バッチを書き出すまでの最大待ち時間（秒）。大量取り込み中も順次 UI に反映させる
+        self.flush_interval = getattr(settings, "SCAN_DB_FLUSH_INTERVAL", 2.0)
+
+        self.stats = PipelineStats()
+        self._lock = threading.Lock()
+        self._hash_q: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._media_q: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._write_q: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._hash_threads: list[threading.Thread] = []
+        self._media_threads: list[threading.Thread] = []
+        self._writer: threading.Thread | None = None
+        self._media_pool: ProcessPoolExecutor | None = None
+        self._failure: BaseException | None = None
+        self._started = False
+        self._closed = False
+
+    # ------------------------------------------------------------------
+    # public API
+    # ------------------------------------------------------------------
+    def start(self) -> "ScanPipeline":
+        if self._started:
+            return self
+        self._started = True
+        # fork は他のスレッドが動いているプロセスでは安全でないので spawn で起動する
+        self._media_pool = ProcessPoolExecutor(
+            max_workers=self.media_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=mediaworker.init,
+        )
+        for i in range(self.hash_workers):
+            self._hash_threads.append(self._spawn(self._hash_worker, f"videos.scan.hash-{i}"))
+        for i in range(self.media_workers):
+            self._media_threads.append(self._spawn(self._media_worker, f"videos.scan.media-{i}"))
+        self._writer = self._spawn(self._db_writer, "videos.scan.writer")
+        return self
+
+    def submit(self, item: IngestItem) -> None:
+        """新規ファイルを投入する。キューが満杯なら空くまでブロックする（ステージが落ちたら PipelineError）"""
+        if not self._started:
+            self.start()
+        self._put(self._hash_q, item)
+
+    def close(self) -> PipelineStats:
+        """投入済みの全アイテムを処理し終えるまで待ってから統計を返す（ステージが落ちていたら PipelineError）"""
+        if self._closed or not self._started:
+            self._closed = True
+            return self.stats
+        self._closed = True
+
+        try:
+            # 上流から順にステージを閉じる
+            for _ in self._hash_threads:
+                self._put(self._hash_q, _STOP)
+            self._join(self._hash_threads)
+            for _ in self._media_threads:
+                self._put(self._media_q, _STOP)
+            self._join(self._media_threads)
+            self._put(self._write_q, _STOP)
+            self._join([self._writer])
+        finally:
+            self._media_pool.shutdown(wait=self._failure is None, cancel_futures=True)
+        self._check()
+        return self.stats
+
+    def __enter__(self) -> "ScanPipeline":
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is not None:
+            # 走査側で例外が出た場合はステージを止めて、元の例外をそのまま伝える
+            self._failure = self._failure or exc
+            self._closed = True
+            if self._media_pool is not None:
+                self._media_pool.shutdown(wait=False, cancel_futures=True)
+            return
+        self.close()
+
+    # ------------------------------------------------------------------
+    # queues / liveness
+    # ------------------------------------------------------------------
+    def _spawn(self, target, name: str) -> threading.Thread:
+        def run():
+            try:
+                target()
+            except PipelineError:
+                # 別のステージが先に落ちた（記録済み）
+                return
+            except BaseException as e:
+                # 他のステージと submit() / close() に伝える
+                logger.exception(f"Scan pipeline stage {name} failed")
+                self._failure = self._failure or e
+
+        t = threading.Thread(target=run, daemon=True, name=name)
+        t.start()
+        return t
+
+    def _check(self) -> None:
+        if self._failure is not None:
+            raise PipelineError(f"scan pipeline stopped: {self._failure!r}") from self._failure
+
+    def _put(self, q: queue.Queue, item) -> None:
+        while True:
+            self._check()
+            try:
+                q.put(item, timeout=_POLL)
+                return
+            except queue.Full:
+                continue
+
+    def _get(self, q: queue.Queue, timeout: float | None = None):
+        """キューから取り出す。timeout を過ぎたら None、他のステージが落ちていたら _STOP"""
+        waited = 0.0
+        while True:
+            if self._failure is not None:
+                return _STOP
+            try:
+                return q.get(timeout=_POLL)
+            except queue.Empty:
+                waited += _POLL
+                if timeout is not None and waited >= timeout:
+                    return None
+
+    def _join(self, threads) -> None:
+        for t in threads:
+            while t.is_alive():
+                self._check()
+                t.join(_POLL)
+
+    # ------------------------------------------------------------------
+    # stages
+    # ------------------------------------------------------------------
+    def _fail(self, item: IngestItem, msg: str) -> None:
+        logger.error(msg)
+        with self._lock:
+            self.stats.errors.append(msg)
+            self.stats.failed.add(item.relative_path)
+
+    def _hash_worker(self) -> None:
+        from .utils import calculate_sampled_fingerprint
+
+        while True:
+            item = self._get(self._hash_q)
+            if item is _STOP:
+                return
+            try:
+                item.md5_hash = calculate_sampled_fingerprint(item.file_path, item.file_size)
+            except Exception as e:
+                self._fail(item, f"Error processing file {item.file_path}: {e}")
+                continue
+            if not item.md5_hash:
+                self._fail(item, f"Failed to calculate fingerprint for {item.file_path}")
+                continue
+            self._put(self._media_q, item)
+
+    def _media_worker(self) -> None:
+        artifacts = tuple(getattr(settings, "INGEST_ARTIFACTS", ("thumbnail",)))
+
+        while True:
+            item = self._get(self._media_q)
+            if item is _STOP:
+                return
+            try:
+                item.info, metadata, item.thumbnail_file_path = self._media_pool.submit(
+                    mediaworker.process_media, item.file_path, item.filename, artifacts
+                ).result()
+                item.metadata.update(metadata)
+            except BrokenProcessPool:
+                # 子プロセスが落ちた。以降のファイルも処理できないのでステージごと止める
+                raise
+            except Exception as e:
+                # 動画情報・サムネイルが無くても登録自体は行う（従来挙動と同じ）
+                logger.error(f"Error processing media for {item.file_path}: {e}")
+            self._put(self._write_q, item)
+
+    def _db_writer(self) -> None:
+        batch: list[IngestItem] = []
+        try:
+            while True:
+                item = self._get(self._write_q, timeout=self.flush_interval)
+                if item is _STOP:
+                    if self._failure is not None:
+                        return
+                    break
+                if item is not None:
+                    batch.append(item)
+                if batch and (item is None or len(batch) >= self.batch_size):
+                    self._flush(batch)
+                    batch = []
+            if batch:
+                self._flush(batch)
+        finally:
+            # このスレッド専用の DB 接続を閉じる
+            connection.close()
+
+    def _flush(self, batch: list[IngestItem]) -> None:
+        from .utils import FINGERPRINT_VERSION
+        from .search import build_search_text
+
+        records = []
+        for item in batch:
+            info = item.info or {}
+            records.append(
+                File(
+                    file_name=item.filename,
+                    file_path=item.relative_path,
+                    # bulk_create は save() を通らないのでここでハッシュを設定する
+                    file_path_hash=sha256_hex(item.relative_path),
+                    file_size=item.file_size,
+                    md5_hash=item.md5_hash,
+                    fingerprint_version=FINGERPRINT_VERSION,
+                    # 重複検出は後で check_and_mark_duplicates() で差分処理
+                    duplicate_flag=False,
+                    video_duration=info.get("duration"),
+                    width=info.get("width"),
+                    height=info.get("height"),
+                    fps=info.get("fps"),
+                    codec=info.get("codec"),
+                    bitrate=info.get("bitrate"),
+                    thumbnail_file_path=item.thumbnail_file_path,
+                    metadata=item.metadata,
+                    search_text=build_search_text(item.filename, item.relative_path),
+                )
+            )
+        try:
+            with transaction.atomic():
+                File.objects.bulk_create(records)
+                counters.record_created(records)
+        except Exception as e:
+            logger.error(f"Batch insert of {len(records)} files failed ({e}); retrying one by one")
+            records_by_path = {r.file_path: r for r in records}
+            for item in batch:
+                try:
+                    records_by_path[item.relative_path].save()
+                except Exception as e2:
+                    self._fail(item, f"Error processing file {item.file_path}: {e2}")
+                    continue
+                self._added(item)
+            return
+        for item in batch:
+            self._added(item)
+
+    def _added(self, item: IngestItem) -> None:
+        with self._lock:
+            self.stats.added += 1
+            self.stats.added_sizes.add(item.file_size)
+        logger.info(f"Added file: {item.filename}")
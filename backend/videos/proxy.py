@@ -0,0 +1,110 @@
+# backend/videos/proxy.py
+"""
+Low-bitrate preview proxies for multi-view playback.
+
+マルチプレイヤーで元動画を何本も同時に再生するとディスク・回線の負荷が本数倍になるため、
+360p 程度の軽い MP4（faststart）をバックグラウンドで作っておき、
+/api/files/<id>/stream/?quality=proxy で配信する。
+
+  - 生成はバックグラウンドタスク（generate_proxies）だけが行う。リクエスト時には作らず、
+    プロキシが無ければ元ファイルを返す
+  - 保存先は PROXY_CACHE_DIR、合計は PROXY_CACHE_MAX_BYTES まで。満杯のときは
+    最近再生されたファイルを優先し、長く使われていないプロキシと入れ替える
+"""
+
+import os
+import time
+import logging
+
+import ffmpeg  # ffmpeg-python
+
+from django.conf import settings
+
+from . import cache
+
+logger = logging.getLogger("videos")
+
+
+def _cache_dir() -> str:
+    return getattr(settings, "PROXY_CACHE_DIR", os.path.join(settings.MEDIA_ROOT, "proxy"))
+
+
+def max_bytes() -> int:
+    return getattr(settings, "PROXY_CACHE_MAX_BYTES", 5 * 1024 ** 3)
+
+
+def proxy_path_for(file_id: int, st: os.stat_result) -> str:
+    return os.path.join(_cache_dir(), f"{cache.source_key(file_id, st)}.mp4")
+
+
+def find_proxy(file_id: int, src_path: str) -> str | None:
+    """生成済みのプロキシがあればパスを返す（LRU 用に atime を更新する）"""
+    path = proxy_path_for(file_id, os.stat(src_path))
+    if not os.path.exists(path):
+        return None
+    cache.touch(path)
+    return path
+
+
+def cached_proxies() -> list[tuple[int, int, str]]:
+    return cache.entries(_cache_dir(), (".mp4",))
+
+
+def remove_proxy(path: str) -> bool:
+    return cache.remove(_cache_dir(), path)
+
+
+def evict() -> int:
+    return cache.evict_lru(_cache_dir(), max_bytes(), (".mp4",))
+
+
+def create_proxy(src_path: str, out_path: str, height: int | None = None) -> bool:
+    """src_path から低ビットレートの MP4 を作る。途中で失敗したら何も残さない"""
+    target = getattr(settings, "PROXY_HEIGHT", 360)
+    # 元より大きくはしない（libx264 は偶数サイズが必要）
+    out_height = max(2, min(target, height or target) // 2 * 2)
+    part_path = f"{out_path}.part"
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+
+    source = ffmpeg.input(src_path)
+    started = time.monotonic()
+    try:
+        (
+            ffmpeg.output(
+                source["v:0"].filter("scale", -2, out_height),
+                source["a:0?"],
+                part_path,
+                format="mp4",
+                vcodec="libx264",
+                preset=getattr(settings, "PROXY_X264_PRESET", "veryfast"),
+                crf=getattr(settings, "PROXY_CRF", 28),
+                maxrate=getattr(settings, "PROXY_MAX_BITRATE", "600k"),
+                bufsize=getattr(settings, "PROXY_BUFSIZE", "1200k"),
+                pix_fmt="yuv420p",
+                # シークしやすいよう 2 秒ごとにキーフレーム
+                force_key_frames="expr:gte(t,n_forced*2)",
+                acodec="aac",
+                audio_bitrate="64k",
+                ac=2,
+                movflags="+faststart",
+                threads=getattr(settings, "PROXY_THREADS", 2),
+            )
+            .global_args("-nostdin", "-loglevel", "error")
+            .overwrite_output()
+            .run(cmd=getattr(settings, "FFMPEG_BINARY", "ffmpeg"), capture_stdout=True, capture_stderr=True)
+        )
+        os.replace(part_path, out_path)
+    except ffmpeg.Error as e:
+        logger.error(
+            f"Proxy generation failed for {src_path}: "
+            f"{e.stderr.decode(errors='replace') if getattr(e, 'stderr', None) else e}"
+        )
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        return False
+
+    logger.info(
+        f"Generated proxy for {src_path} ({os.path.getsize(out_path)} bytes) "
+        f"in {time.monotonic() - started:.1f}s"
+    )
+    return True
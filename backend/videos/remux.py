@@ -0,0 +1,209 @@
+# backend/videos/remux.py
+"""
+On-the-fly remux of MKV / AVI / WMV / FLV into fragmented MP4.
+
+ブラウザが再生できるコーデック（H.264 など）であれば再エンコードせずコンテナだけを
+fragmented MP4（empty_moov + フラグメント単位）に詰め替え、ffmpeg の出力をそのまま
+クライアントへ流す。先頭フラグメントが出た時点で再生を始められる。
+
+同時にディスクキャッシュ（REMUX_CACHE_DIR）へ書き出し、最後まで変換できたものは
+次回から通常のファイル配信（Range / オフロード対応）になる。キャッシュは
+REMUX_CACHE_MAX_BYTES を超えたら最終アクセスの古いものから削除する。
+"""
+
+import os
+import asyncio
+import logging
+import threading
+from collections import deque
+
+import ffmpeg  # ffmpeg-python
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+
+from .cache import evict_lru, source_key
+
+logger = logging.getLogger("videos")
+
+# ブラウザでそのまま再生できる MP4 の中身
+_DEFAULT_VIDEO_CODECS = ("h264", "vp9", "av1")
+_DEFAULT_AUDIO_CODECS = ("aac", "mp3", "opus", "flac")
+
+# 変換中のキャッシュキー（同じファイルを複数人が同時に開いても書き込みは 1 本だけ）
+_in_progress: set[str] = set()
+_lock = threading.Lock()
+
+
+def remux_exts() -> set[str]:
+    return set(getattr(settings, "REMUX_EXTS", (".mkv", ".avi", ".wmv", ".flv")))
+
+
+def needs_remux(file_path: str) -> bool:
+    return os.path.splitext(file_path)[1].lower() in remux_exts()
+
+
+def _cache_dir() -> str:
+    return getattr(
+        settings,
+        "REMUX_CACHE_DIR",
+        os.path.join(settings.MEDIA_ROOT, "remux"),
+    )
+
+
+def remux_plan(video_codec: str | None, audio_codec: str | None) -> dict | None:
+    """
+    コピーで済むかを判定して ffmpeg の出力オプションを返す。映像が非対応なら None。
+    音声だけが非対応（WMA など）の場合は音声のみ AAC に変換する（映像のデコードは不要で軽い）。
+    """
+    video_ok = getattr(settings, "REMUX_VIDEO_CODECS", _DEFAULT_VIDEO_CODECS)
+    audio_ok = getattr(settings, "REMUX_AUDIO_CODECS", _DEFAULT_AUDIO_CODECS)
+    if (video_codec or "").lower() not in video_ok:
+        return None
+    plan = {"vcodec": "copy"}
+    if not audio_codec:
+        plan["an"] = None
+    elif audio_codec.lower() in audio_ok:
+        plan["acodec"] = "copy"
+    elif getattr(settings, "REMUX_TRANSCODE_AUDIO", True):
+        plan["acodec"] = "aac"
+        plan["audio_bitrate"] = "192k"
+    else:
+        return None
+    return plan
+
+
+def cache_path_for(file_id: int, st: os.stat_result) -> str:
+    return os.path.join(_cache_dir(), f"{source_key(file_id, st)}.mp4")
+
+
+def evict(max_bytes: int | None = None) -> int:
+    """キャッシュ合計が REMUX_CACHE_MAX_BYTES を超えていれば最終アクセスの古い順に削除する"""
+    if max_bytes is None:
+        max_bytes = getattr(settings, "REMUX_CACHE_MAX_BYTES", 20 * 1024 ** 3)
+    return evict_lru(_cache_dir(), max_bytes, (".mp4",))
+
+
+class RemuxJob:
+    """
+    ffmpeg で fragmented MP4 を標準出力に書かせ、読んだチャンクをキャッシュにも書く。
+    最後まで読み切れたら .part を本来の名前に置き換える。途中で閉じられたら破棄する。
+    """
+
+    def __init__(self, src_path: str, plan: dict, cache_path: str | None):
+        self.cache_path = cache_path
+        self.chunk_size = getattr(settings, "STREAM_CHUNK_SIZE", 512 * 1024)
+        self._stderr = deque(maxlen=50)
+        self._part = None
+        self._done = False
+        self._closed = False
+
+        if cache_path is not None:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            self._part = open(f"{cache_path}.part", "wb")
+
+        source = ffmpeg.input(src_path)
+        streams = [source["v:0"]] if "an" in plan else [source["v:0"], source["a:0?"]]
+        self.process = (
+            ffmpeg.output(
+                *streams,
+                "pipe:",
+                format="mp4",
+                movflags="frag_keyframe+empty_moov+default_base_moof",
+                **plan,
+            )
+            .global_args("-nostdin", "-loglevel", "error")
+            .run_async(cmd=getattr(settings, "FFMPEG_BINARY", "ffmpeg"), pipe_stdout=True, pipe_stderr=True)
+        )
+        # stderr が詰まって ffmpeg が止まらないよう読み捨てておく
+        threading.Thread(target=self._drain_stderr, daemon=True).start()
+
+    def _drain_stderr(self) -> None:
+        for line in self.process.stderr:
+            self._stderr.append(line.decode(errors="replace").rstrip())
+
+    def read(self) -> bytes:
+        data = self.process.stdout.read1(self.chunk_size)
+        if data:
+            if self._part is not None:
+                self._part.write(data)
+        else:
+            self._done = self.process.wait() == 0
+            if not self._done:
+                logger.error("Remux failed: " + " / ".join(self._stderr))
+        return data
+
+    def close(self) -> None:
+        # ジェネレータの finally とレスポンスの close() の両方から呼ばれる
+        with _lock:
+            if self._closed:
+                return
+            self._closed = True
+        if self.process.poll() is None:
+            self.process.kill()
+            self.process.wait()
+        if self._part is not None:
+            self._part.close()
+            part_path = f"{self.cache_path}.part"
+            try:
+                if self._done:
+                    os.replace(part_path, self.cache_path)
+                    evict()
+                else:
+                    os.remove(part_path)
+            except OSError as e:
+                logger.warning(f"Could not finalize remux cache {self.cache_path}: {e}")
+            with _lock:
+                _in_progress.discard(self.cache_path)
+
+    def __iter__(self):
+        try:
+            while True:
+                data = self.read()
+                if not data:
+                    return
+                yield data
+        finally:
+            self.close()
+
+
+class _AsyncRemuxStream:
+    """ASGI 用。読み出しはスレッドで行う（StreamingHttpResponse から close() も呼ばれる）"""
+
+    def __init__(self, job: RemuxJob):
+        self.job = job
+
+    async def __aiter__(self):
+        try:
+            while True:
+                data = await asyncio.to_thread(self.job.read)
+                if not data:
+                    return
+                yield data
+        finally:
+            await asyncio.to_thread(self.job.close)
+
+    def close(self) -> None:
+        self.job.close()
+
+
+def start_remux(request, src_path: str, plan: dict, cache_path: str):
+    """
+    変換を開始してレスポンス本文用のイテレータを返す。
+    同じキーを別のリクエストが変換中ならキャッシュには書かずに流すだけにする。
+    """
+    with _lock:
+        owner = cache_path not in _in_progress
+        if owner:
+            _in_progress.add(cache_path)
+    try:
+        job = RemuxJob(src_path, plan, cache_path if owner else None)
+    except Exception:
+        if owner:
+            with _lock:
+                _in_progress.discard(cache_path)
+        raise
+    # 一度も読まれずにレスポンスが閉じられても close() で ffmpeg を止められるようオブジェクトごと渡す
+    if isinstance(request, ASGIRequest):
+        return _AsyncRemuxStream(job)
+    return job
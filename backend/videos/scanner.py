@@ -7,7 +7,8 @@ import os
 import time
 import logging
 from django.conf import settings
-from .utils import scan_video_directory, check_and_mark_duplicates
+from .utils import scan_video_directory
+from .watcher import start_watcher
 
 logger = logging.getLogger("videos")
 
@@ -31,8 +32,8 @@ def initial_scan() -> None:
     _ensure_media_dirs()
     logger.info("Starting initial file scan (with WebP thumbnails)...")
     try:
-        scan_video_directory()
-        check_and_mark_duplicates()
+        # スナップショットがあれば差分スキャン（無ければ自動的に全件扱いになる）
+        scan_video_directory(incremental=getattr(settings, "SCAN_INCREMENTAL", True))
         logger.info("Initial file scan finished.")
     except Exception:
         logger.exception("Initial file scan failed.")
@@ -42,17 +43,30 @@ def periodic_scan() -> None:
     """
     常駐で定期的にスキャンを回すループ。
     AppConfig から別スレッドで呼ばれる想定。
+    通常は差分スキャンを行い、FULL_SCAN_INTERVAL ごとにフルスキャンで整合性を取る。
+    ファイル監視（FILE_WATCH_ENABLED）が動いている場合は新規ファイルを監視側で取り込むので、
+    このループは FULL_SCAN_INTERVAL ごとのフルスキャン（取りこぼしの補正）だけを行う。
     """
     _ensure_media_dirs()
     interval = getattr(settings, "FILE_SCAN_INTERVAL", 6 * 60 * 60)  # 既定 6 時間
+    full_interval = getattr(settings, "FULL_SCAN_INTERVAL", 24 * 60 * 60)  # 既定 24 時間
+    use_incremental = getattr(settings, "SCAN_INCREMENTAL", True)
+
+    if start_watcher() is not None:
+        interval = full_interval
+        use_incremental = False
     logger.info("Starting periodic scan loop (interval=%s sec) with WebP thumbnails...", interval)
 
+    # initial_scan が直前に走るので、最初のフルスキャンは full_interval 後
+    last_full = time.monotonic()
     while True:
+        time.sleep(interval)
         try:
-            logger.info("Periodic scan tick.")
-            scan_video_directory()
-            check_and_mark_duplicates()
+            incremental = use_incremental and (time.monotonic() - last_full) < full_interval
+            logger.info("Periodic scan tick (%s).", "incremental" if incremental else "full")
+            scan_video_directory(incremental=incremental)
+            if not incremental:
+                last_full = time.monotonic()
             logger.info("Periodic scan tick finished.")
         except Exception:
             logger.exception("Periodic scan tick failed.")
-        time.sleep(interval)
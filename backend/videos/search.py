@@ -0,0 +1,159 @@
+# backend/videos/search.py
+"""
+Indexed search over file names, folder paths and tag names.
+
+File.search_text に「ファイル名・ディレクトリ・タグ名」を正規化して（NFKC + 小文字化、
+記号は空白に）まとめておき、MySQL では ngram パーサの FULLTEXT インデックスで検索する。
+ngram（既定 2 文字）で分割するので、空白で区切られない日本語のファイル名でも部分一致で引ける。
+関連度（MATCH ... AGAINST のスコア）を search_score として注釈し、sort_by=relevance で並べる。
+
+  - SEARCH_BACKEND = "fulltext"  MySQL の FULLTEXT（ngram）を使う
+  - SEARCH_BACKEND = "like"      search_text への部分一致（SQLite など FULLTEXT が無い DB 用）
+  - 未設定なら MySQL のときだけ fulltext
+
+search_text はスキャナの登録・移動、タグの付け外し、タグ名の変更・削除のたびに差分で更新する。
+"""
+
+import os
+import re
+import unicodedata
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import FloatField, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .models import File, Tag
+
+_SEPARATORS = re.compile(r"[\W_]+")
+
+
+def normalize(text: str) -> str:
+    """全角英数・半角カナを揃えて小文字にし、記号を空白にする（検索語にも同じ処理をする）"""
+    return _SEPARATORS.sub(" ", unicodedata.normalize("NFKC", text).casefold()).strip()
+
+
+def build_search_text(file_name: str, file_path: str, tag_names=()) -> str:
+    # file_path の末尾はファイル名と同じなのでディレクトリ部分だけ足す
+    directory = os.path.dirname((file_path or "").replace("\\", "/"))
+    return normalize(" ".join([file_name or "", directory, *tag_names]))
+
+
+def backend() -> str:
+    configured = getattr(settings, "SEARCH_BACKEND", None)
+    if configured:
+        return configured
+    return "fulltext" if connection.vendor == "mysql" else "like"
+
+
+def refresh(file_ids) -> int:
+    """指定したファイルの search_text を作り直す（ファイル情報とタグ名を 2 クエリで読む）"""
+    file_ids = list(set(file_ids))
+    if not file_ids:
+        return 0
+    tag_names: dict[int, list] = {pk: [] for pk in file_ids}
+    for file_id, tag_name in File.tags.through.objects.filter(
+        file_id__in=file_ids
+    ).values_list("file_id", "tag__tag_name"):
+        tag_names[file_id].append(tag_name)
+
+    records = [
+        File(id=pk, search_text=build_search_text(name, path, tag_names[pk]))
+        for pk, name, path in File.objects.filter(id__in=file_ids).values_list("id", "file_name", "file_path")
+    ]
+    File.objects.bulk_update(records, ["search_text"], batch_size=500)
+    return len(records)
+
+
+def rebuild(batch_size: int = 2000) -> int:
+    """全ファイルの search_text を作り直す（移行・整合性回復用）"""
+    count = 0
+    last_id = 0
+    while True:
+        ids = list(
+            File.objects.filter(id__gt=last_id).order_by("id").values_list("id", flat=True)[:batch_size]
+        )
+        if not ids:
+            return count
+        count += refresh(ids)
+        last_id = ids[-1]
+
+
+def apply_search(queryset, query: str):
+    """
+    検索条件を付け、関連度を search_score として注釈する。
+    ngram より短い語（1 文字など）は FULLTEXT では引けないので部分一致で絞る。
+    """
+    terms = normalize(query).split()
+    if not terms:
+        return queryset.annotate(search_score=Value(0.0, output_field=FloatField()))
+
+    if backend() != "fulltext":
+        for term in terms:
+            queryset = queryset.filter(search_text__contains=term)
+        return queryset.annotate(search_score=Value(0.0, output_field=FloatField()))
+
+    ngram = getattr(settings, "SEARCH_NGRAM_SIZE", 2)
+    phrases = [t for t in terms if len(t) >= ngram]
+    for term in terms:
+        if len(term) < ngram:
+            queryset = queryset.filter(search_text__contains=term)
+    if not phrases:
+        return queryset.annotate(search_score=Value(0.0, output_field=FloatField()))
+
+    # 記号は normalize() で除いてあるので、各語を必須のフレーズとしてそのまま渡せる
+    expression = " ".join(f'+"{t}"' for t in phrases)
+    score = RawSQL(
+        f"MATCH({File._meta.db_table}.search_text) AGAINST (%s IN BOOLEAN MODE)",
+        (expression,),
+        output_field=FloatField(),
+    )
+    return queryset.annotate(search_score=score).filter(search_score__gt=0)
+
+
+# ------------------------------------------------------------------
+# search_text の差分更新
+# ------------------------------------------------------------------
+@receiver(m2m_changed, sender=File.tags.through)
+def _tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == "pre_clear":
+        # tag.files.clear() は post_clear で対象が分からないので控えておく
+        instance._search_file_ids = list(instance.files.values_list("id", flat=True))
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        refresh([instance.pk])
+    elif action == "post_clear":
+        refresh(getattr(instance, "_search_file_ids", []))
+    else:
+        refresh(pk_set or [])
+
+
+@receiver(post_save, sender=File)
+def _file_saved(sender, instance, created, update_fields=None, raw=False, **kwargs):
+    if raw:
+        return
+    if update_fields is not None and not {"file_name", "file_path"} & set(update_fields):
+        return
+    refresh([instance.pk])
+
+
+@receiver(post_save, sender=Tag)
+def _tag_saved(sender, instance, created, update_fields=None, raw=False, **kwargs):
+    if raw or created:
+        return
+    if update_fields is not None and "tag_name" not in update_fields:
+        return
+    refresh(instance.files.values_list("id", flat=True))
+
+
+@receiver(pre_delete, sender=Tag)
+def _tag_deleting(sender, instance, **kwargs):
+    instance._search_file_ids = list(instance.files.values_list("id", flat=True))
+
+
+@receiver(post_delete, sender=Tag)
+def _tag_deleted(sender, instance, **kwargs):
+    refresh(getattr(instance, "_search_file_ids", []))
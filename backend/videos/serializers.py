@@ -10,6 +10,7 @@ from django.utils.timezone import is_naive, make_aware, get_current_timezone
 from rest_framework import serializers
 
 from .models import File, Folder, Tag, Group, ScanHistory
+from . import bulk
 
 
 # ----------------------------
@@ -91,17 +92,33 @@ class FolderSerializer(serializers.ModelSerializer):
             if "parent" in data
             else getattr(self.instance, "parent", None)
         )
-        current = self.instance
-        while new_parent is not None:
-            if current and new_parent.id == current.id:
-                raise serializers.ValidationError("親フォルダに自身は指定できません。")
-            new_parent = new_parent.parent
+        # 自身またはその子孫を親にすると循環する（閉包テーブルで 1 クエリ）
+        if self.instance is not None and new_parent is not None and new_parent.is_descendant_of(self.instance):
+            raise serializers.ValidationError("親フォルダに自身は指定できません。")
         return data
 
 
 # ----------------------------
 # File（一覧用）
 # ----------------------------
+def format_duration(seconds: float | None) -> str:
+    if seconds is None:
+        return "-"
+    total = int(seconds)
+    h = total // 3600
+    m = (total % 3600) // 60
+    s = total % 60
+    return f"{h}:{m:02d}:{s:02d}" if h > 0 else f"{m}:{s:02d}"
+
+
+def media_url(relative_path: str | None) -> str | None:
+    if not relative_path:
+        return None
+    # 例: /media/webp/xxxx.webp
+    base = getattr(settings, "MEDIA_URL", "/media/")
+    return f"{base}{relative_path}".replace("//", "/")
+
+
 class FileListSerializer(serializers.ModelSerializer):
     """ファイル一覧"""
 
@@ -132,6 +149,7 @@ class FileListSerializer(serializers.ModelSerializer):
             "bitrate",
             "delete_flag",
             "duplicate_flag",
+            "duplicate_group",
             "thumbnail_file_path",
             "thumbnail_url",
             "folder_ids",
@@ -142,20 +160,55 @@ class FileListSerializer(serializers.ModelSerializer):
         read_only_fields = fields
 
     def get_duration_hms(self, obj: File) -> str:
-        if obj.video_duration is None:
-            return "-"
-        total = int(obj.video_duration)
-        h = total // 3600
-        m = (total % 3600) // 60
-        s = total % 60
-        return f"{h}:{m:02d}:{s:02d}" if h > 0 else f"{m}:{s:02d}"
+        return format_duration(obj.video_duration)
 
     def get_thumbnail_url(self, obj: File) -> str | None:
-        if not obj.thumbnail_file_path:
-            return None
-        # 例: /media/webp/xxxx.webp
-        base = getattr(settings, "MEDIA_URL", "/media/")
-        return f"{base}{obj.thumbnail_file_path}".replace("//", "/")
+        return media_url(obj.thumbnail_file_path)
+
+    # 一覧の高速パス用: values() で取得する列（カーソルページネーションのソート列を含む）
+    VALUES_FIELDS = [
+        f for f in Meta.fields if f not in ("duration_hms", "thumbnail_url", "folder_ids", "tag_names")
+    ] + ["last_accessed"]
+
+    @classmethod
+    def rows(cls, values: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        File.objects.values(*VALUES_FIELDS) の行を一覧用の dict にする（モデルを生成しない）。
+        folder_ids / tag_names はページ分をまとめて 2 クエリで取得する（行ごとの N+1 を避ける）。
+        出力は通常のシリアライズと同じ形式。
+        """
+        ids = [row["id"] for row in values]
+        folder_ids: Dict[int, list] = {pk: [] for pk in ids}
+        tag_names: Dict[int, list] = {pk: [] for pk in ids}
+        if ids:
+            for file_id, folder_id in File.folders.through.objects.filter(
+                file_id__in=ids
+            ).values_list("file_id", "folder_id"):
+                folder_ids[file_id].append(folder_id)
+            for file_id, tag_name in File.tags.through.objects.filter(
+                file_id__in=ids
+            ).values_list("file_id", "tag__tag_name"):
+                tag_names[file_id].append(tag_name)
+
+        datetime_field = serializers.DateTimeField()
+        result = []
+        for row in values:
+            data = {}
+            for name in cls.Meta.fields:
+                if name == "duration_hms":
+                    data[name] = format_duration(row["video_duration"])
+                elif name == "thumbnail_url":
+                    data[name] = media_url(row["thumbnail_file_path"])
+                elif name == "folder_ids":
+                    data[name] = folder_ids[row["id"]]
+                elif name == "tag_names":
+                    data[name] = tag_names[row["id"]]
+                elif name in ("created_at", "updated_at"):
+                    data[name] = datetime_field.to_representation(row[name]) if row[name] else None
+                else:
+                    data[name] = row[name]
+            result.append(data)
+        return result
 
 
 # ----------------------------
@@ -202,6 +255,7 @@ class FileDetailSerializer(serializers.ModelSerializer):
             "bitrate",
             "delete_flag",
             "duplicate_flag",
+            "duplicate_group",
             "thumbnail_file_path",
             "thumbnail_url",
             "metadata",
@@ -215,19 +269,10 @@ class FileDetailSerializer(serializers.ModelSerializer):
         ]
 
     def get_duration_hms(self, obj: File) -> str:
-        if obj.video_duration is None:
-            return "-"
-        total = int(obj.video_duration)
-        h = total // 3600
-        m = (total % 3600) // 60
-        s = total % 60
-        return f"{h}:{m:02d}:{s:02d}" if h > 0 else f"{m}:{s:02d}"
+        return format_duration(obj.video_duration)
 
     def get_thumbnail_url(self, obj: File) -> str | None:
-        if not obj.thumbnail_file_path:
-            return None
-        base = getattr(settings, "MEDIA_URL", "/media/")
-        return f"{base}{obj.thumbnail_file_path}".replace("//", "/")
+        return media_url(obj.thumbnail_file_path)
 
     def update(self, instance: File, validated_data: Dict[str, Any]) -> File:
         # M2M は pop してから set
@@ -263,8 +308,11 @@ class FileBulkActionSerializer(serializers.Serializer):
     )
 
     ids = serializers.ListField(
-        child=serializers.IntegerField(min_value=1), allow_empty=False
+        child=serializers.IntegerField(min_value=1), allow_empty=False, required=False
     )
+    # ids の代わりに一覧と同じクエリパラメータ（search / tag_all / folder_id / delete_flag など）で
+    # 対象を指定する（「検索に一致するすべてのファイル」）。ビューが File の QuerySet にして渡す
+    filter = serializers.DictField(required=False)
     action = serializers.ChoiceField(choices=ACTIONS)
     tag_ids = serializers.ListField(
         child=serializers.IntegerField(min_value=1), required=False
@@ -273,6 +321,8 @@ class FileBulkActionSerializer(serializers.Serializer):
 
     def validate(self, attrs: Dict[str, Any]) -> Dict[str, Any]:
         action = attrs["action"]
+        if ("ids" in attrs) == ("filter" in attrs):
+            raise serializers.ValidationError("ids または filter のどちらか一方が必要です。")
         if action in ("add_tags", "remove_tags") and "tag_ids" not in attrs:
             raise serializers.ValidationError("tag_ids が必要です。")
         if (
@@ -282,40 +332,47 @@ class FileBulkActionSerializer(serializers.Serializer):
             raise serializers.ValidationError("folder_id が必要です。")
         return attrs
 
-    def perform(self) -> Dict[str, Any]:
-        ids: List[int] = self.validated_data["ids"]
+    def perform(self, files=None) -> Dict[str, Any]:
+        """
+        files: filter 指定時にビューが組み立てた QuerySet。対象の id は Python に読み出さず、
+        サブクエリのまま UPDATE / INSERT ... SELECT / DELETE に渡す（videos.bulk）
+        """
         action: str = self.validated_data["action"]
-
-        files = File.objects.filter(id__in=ids)
-        affected = files.count()
-
-        if action == "mark_deleted":
-            files.update(delete_flag=True)
-        elif action == "restore":
-            files.update(delete_flag=False)
-        elif action == "mark_duplicate":
-            files.update(duplicate_flag=True)
+        if files is None:
+            files = File.objects.filter(id__in=self.validated_data["ids"])
+        changed = None
+
+        if action in ("mark_deleted", "restore", "mark_duplicate"):
+            field, value = {
+                "mark_deleted": ("delete_flag", True),
+                "restore": ("delete_flag", False),
+                "mark_duplicate": ("duplicate_flag", True),
+            }[action]
+            # 対象件数は UPDATE の行数
+            affected = bulk.set_flag(files, field, value)
         elif action in ("add_tags", "remove_tags"):
+            # 中間テーブルへの一括 INSERT / DELETE（usage_count も同じトランザクションで数え直す）
             tag_ids: List[int] = self.validated_data["tag_ids"]
-            tags = Tag.objects.filter(id__in=tag_ids)
-            for f in files:
-                if action == "add_tags":
-                    f.tags.add(*tags)
-                else:
-                    f.tags.remove(*tags)
-        elif action in ("add_to_folder", "remove_from_folder"):
+            affected = files.count()
+            if action == "add_tags":
+                changed = bulk.add_tags(files, tag_ids)
+            else:
+                changed = bulk.remove_tags(files, tag_ids)
+        else:
             folder_id: int = self.validated_data["folder_id"]
-            try:
-                folder = Folder.objects.get(id=folder_id)
-            except Folder.DoesNotExist:
+            if not Folder.objects.filter(id=folder_id).exists():
                 raise serializers.ValidationError("指定されたフォルダが存在しません。")
-            for f in files:
-                if action == "add_to_folder":
-                    f.folders.add(folder)
-                else:
-                    f.folders.remove(folder)
+            affected = files.count()
+            if action == "add_to_folder":
+                changed = bulk.add_to_folder(files, folder_id)
+            else:
+                changed = bulk.remove_from_folder(files, folder_id)
 
-        return {"affected": affected, "action": action}
+        result = {"affected": affected, "action": action}
+        if changed is not None:
+            # 実際に追加・削除した関連の数（既に付いていた / 付いていなかった組は数えない）
+            result["changed"] = changed
+        return result
 
 
 # ----------------------------
@@ -334,10 +391,14 @@ class ScanHistorySerializer(serializers.ModelSerializer):
             "started_at",
             "completed_at",
             "status",
+            "scan_mode",
             "files_scanned",
             "files_added",
             "files_updated",
             "duplicates_found",
+            "files_vanished",
+            "dirs_skipped",
+            "snapshot_hits",
             "errors",
             "duration_seconds",
             "duration_display",
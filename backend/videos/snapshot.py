@@ -0,0 +1,184 @@
+# backend/videos/snapshot.py
+"""
+Persisted stat snapshot used by the incremental scan mode.
+
+ファイルごとの (size, mtime_ns, inode) とディレクトリごとの mtime を JSON で保存し、
+次回スキャン時に「変化のないサブツリー」を読み飛ばすために使う。
+"""
+
+import os
+import json
+import logging
+import tempfile
+from dataclasses import dataclass, field
+
+logger = logging.getLogger("videos")
+
+
+def _stat_sig(st: os.stat_result) -> list[int]:
+    """比較用のシグネチャ (size, mtime_ns, inode)。JSON 化しやすいよう list で返す。"""
+    return [int(st.st_size), int(st.st_mtime_ns), int(st.st_ino)]
+
+
+def _rel(path: str, base: str) -> str:
+    return os.path.relpath(path, base).replace("\\", "/")
+
+
+@dataclass
+class WalkResult:
+    """ディレクトリ走査の結果"""
+    # relative_path -> [size, mtime_ns, inode]（今回確認できた全ファイル）
+    files: dict = field(default_factory=dict)
+    # relative_dir -> {"mtime": int, "files": [...], "subdirs": [...]}
+    dirs: dict = field(default_factory=dict)
+    # DB ステージへ渡すもの
+    changed: list = field(default_factory=list)  # 新規 or 変更された relative_path
+    vanished: list = field(default_factory=list)  # 前回あって今回ない relative_path
+    # 統計
+    dirs_skipped: int = 0  # mtime 不変で listdir/stat を省略したディレクトリ数
+    snapshot_hits: int = 0  # スナップショットと一致したファイル数
+
+
+class ScanSnapshot:
+    """
+    スキャン結果のスナップショット。
+    パスはすべて MEDIA_ROOT からの相対パス（File.file_path と同じ形式）で保持する。
+    """
+
+    VERSION = 1
+
+    def __init__(self, path: str, video_dir: str, files: dict | None = None, dirs: dict | None = None):
+        self.path = path
+        self.video_dir = video_dir
+        self.files: dict = files or {}
+        self.dirs: dict = dirs or {}
+
+    def __len__(self) -> int:
+        return len(self.files)
+
+    @classmethod
+    def load(cls, path: str, video_dir: str) -> "ScanSnapshot":
+        """保存済みスナップショットを読み込む。無い・壊れている・対象が違う場合は空を返す。"""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return cls(path, video_dir)
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable scan snapshot {path}: {e}")
+            return cls(path, video_dir)
+
+        if data.get("version") != cls.VERSION or data.get("video_dir") != video_dir:
+            logger.info("Scan snapshot does not match current VIDEO_DIR/version; starting fresh.")
+            return cls(path, video_dir)
+        return cls(path, video_dir, data.get("files") or {}, data.get("dirs") or {})
+
+    def save(self) -> None:
+        """一時ファイルに書いてから置き換える（途中で落ちても壊れたファイルを残さない）"""
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        payload = {
+            "version": self.VERSION,
+            "video_dir": self.video_dir,
+            "files": self.files,
+            "dirs": self.dirs,
+        }
+        fd, tmp_path = tempfile.mkstemp(prefix=".scan_snapshot.", dir=directory)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(payload, f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp_path, self.path)
+        except Exception:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def walk(
+        self, media_root: str, video_exts: set[str], incremental: bool = True, on_changed=None
+    ) -> WalkResult:
+        """
+        VIDEO_DIR を走査して前回スナップショットとの差分を返す。
+        on_changed(relative_path, file_size) を渡すと、新規 or 変更されたファイルを見つけるたびに呼ぶ
+        （走査を終える前に取り込みを始められる）。
+
+        incremental=True の場合、mtime が前回と同じディレクトリは listdir も
+        配下ファイルの stat も行わず、前回の内容をそのまま引き継ぐ。
+        （ディレクトリの mtime はエントリの追加・削除・リネームで更新されるが、
+        既存ファイルの上書きでは変わらない。上書きの検出はフルスキャンに任せる）
+        サブディレクトリ自身の mtime は毎回確認するため、深い階層の変更も拾える。
+        """
+        result = WalkResult()
+        stack = [self.video_dir]
+
+        while stack:
+            current = stack.pop()
+            try:
+                dir_mtime = os.stat(current).st_mtime_ns
+            except OSError as e:
+                logger.warning(f"Cannot stat directory {current}: {e}")
+                continue
+
+            rel_dir = _rel(current, media_root)
+            prev = self.dirs.get(rel_dir)
+
+            if incremental and prev and prev.get("mtime") == dir_mtime:
+                result.dirs_skipped += 1
+                result.dirs[rel_dir] = prev
+                for name in prev.get("files", []):
+                    rel_path = f"{rel_dir}/{name}"
+                    sig = self.files.get(rel_path)
+                    if sig is None:
+                        # スナップショットの不整合。念のため DB ステージへ回す
+                        full_path = os.path.join(current, name)
+                        try:
+                            sig = _stat_sig(os.stat(full_path))
+                        except OSError:
+                            continue
+                        result.changed.append(rel_path)
+                        if on_changed:
+                            on_changed(rel_path, sig[0])
+                    else:
+                        result.snapshot_hits += 1
+                    result.files[rel_path] = sig
+                for sub in prev.get("subdirs", []):
+                    stack.append(os.path.join(current, sub))
+                continue
+
+            names: list[str] = []
+            subdirs: list[str] = []
+            try:
+                with os.scandir(current) as it:
+                    for entry in it:
+                        try:
+                            if entry.is_dir():
+                                # os.walk(followlinks=False) と同じくシンボリックリンク先には入らない
+                                if not entry.is_symlink():
+                                    subdirs.append(entry.name)
+                                continue
+                            if not any(entry.name.lower().endswith(ext) for ext in video_exts):
+                                continue
+                            sig = _stat_sig(entry.stat())
+                        except OSError as e:
+                            logger.warning(f"Cannot stat {entry.path}: {e}")
+                            continue
+
+                        names.append(entry.name)
+                        rel_path = f"{rel_dir}/{entry.name}"
+                        result.files[rel_path] = sig
+                        if incremental and self.files.get(rel_path) == sig:
+                            result.snapshot_hits += 1
+                        else:
+                            result.changed.append(rel_path)
+                            if on_changed:
+                                on_changed(rel_path, sig[0])
+            except OSError as e:
+                logger.warning(f"Cannot list directory {current}: {e}")
+                continue
+
+            result.dirs[rel_dir] = {"mtime": dir_mtime, "files": names, "subdirs": subdirs}
+            stack.extend(os.path.join(current, sub) for sub in subdirs)
+
+        result.vanished = [p for p in self.files if p not in result.files]
+        return result
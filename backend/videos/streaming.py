@@ -0,0 +1,290 @@
+# backend/videos/streaming.py
+"""
+Range-capable file responses for video streaming.
+
+  - Range: bytes=... を解釈して 206 Partial Content / multipart/byteranges を返す
+  - ETag / Last-Modified による条件付きリクエスト（304 / If-Range）に対応
+  - ASGI（Daphne）では非同期イテレータでチャンクを読み出し、イベントループを塞がない
+  - WSGI サーバーが wsgi.file_wrapper を提供する場合（gunicorn 等）は単一レンジも
+    ファイルオブジェクトのまま渡し、サーバー側の os.sendfile でカーネル内コピーさせる
+  - MEDIA_OFFLOAD を設定すると本文は送らず X-Accel-Redirect / X-Sendfile で
+    リバースプロキシに配信を任せる
+"""
+
+import os
+import uuid
+import asyncio
+import logging
+import mimetypes
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+
+logger = logging.getLogger("videos")
+
+# ブラウザが再生できる/できないに関わらず、拡張子から正しい Content-Type を返す
+mimetypes.add_type("video/mp4", ".m4v")
+mimetypes.add_type("video/x-matroska", ".mkv")
+mimetypes.add_type("video/x-flv", ".flv")
+mimetypes.add_type("video/x-ms-wmv", ".wmv")
+
+
+def _chunk_size() -> int:
+    return getattr(settings, "STREAM_CHUNK_SIZE", 512 * 1024)
+
+
+def parse_range_header(header: str | None, size: int) -> list[tuple[int, int]] | None:
+    """
+    Range ヘッダを [(start, end), ...]（end を含む）に変換する。
+      - None: ヘッダなし・書式不正（RFC 7233 に従い無視して全体を返す）
+      - []:   満たせるレンジが一つもない（416）
+    重なり・隣接するレンジは結合し、開始位置順に並べる。
+    """
+    if not header:
+        return None
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or not spec:
+        return None
+
+    ranges = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        first, sep, last = part.partition("-")
+        if not sep:
+            return None
+        try:
+            if first == "":
+                # bytes=-N（末尾 N バイト）
+                length = int(last)
+                if length <= 0:
+                    continue
+                start, end = max(size - length, 0), size - 1
+            else:
+                start = int(first)
+                end = int(last) if last else size - 1
+                if last and start > end:
+                    return None
+                end = min(end, size - 1)
+        except ValueError:
+            return None
+        if start < size:
+            ranges.append((start, end))
+
+    ranges.sort()
+    merged: list[tuple[int, int]] = []
+    for start, end in ranges:
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+
+    max_ranges = getattr(settings, "STREAM_MAX_RANGES", 16)
+    if len(merged) > max_ranges:
+        # 細切れの大量レンジは 1 つにまとめる（DoS 対策、レスポンスは少し大きくなる）
+        merged = [(merged[0][0], merged[-1][1])]
+    return merged
+
+
+class RangeFile:
+    """
+    ファイルの一部分だけを読めるファイルライクオブジェクト。
+    fileno() を持つので、wsgi.file_wrapper（gunicorn など）は現在位置から
+    Content-Length 分を os.sendfile で送れる。
+    """
+
+    def __init__(self, path: str, start: int, length: int):
+        self._f = open(path, "rb")
+        self._f.seek(start)
+        self.remaining = length
+
+    def fileno(self) -> int:
+        return self._f.fileno()
+
+    def read(self, size: int = -1) -> bytes:
+        if self.remaining <= 0:
+            return b""
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self._f.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self) -> None:
+        self._f.close()
+
+
+def _iter_parts(path: str, parts: list, chunk_size: int):
+    """parts は bytes（区切り文字列など）か (start, length) のリスト"""
+    with open(path, "rb") as f:
+        for part in parts:
+            if isinstance(part, bytes):
+                yield part
+                continue
+            start, remaining = part
+            f.seek(start)
+            while remaining > 0:
+                data = f.read(min(chunk_size, remaining))
+                if not data:
+                    return
+                remaining -= len(data)
+                yield data
+
+
+async def _aiter_parts(path: str, parts: list, chunk_size: int):
+    """_iter_parts の非同期版。読み出しはスレッドに逃がしてイベントループを塞がない"""
+    f = await asyncio.to_thread(open, path, "rb")
+    try:
+        for part in parts:
+            if isinstance(part, bytes):
+                yield part
+                continue
+            start, remaining = part
+            await asyncio.to_thread(f.seek, start)
+            while remaining > 0:
+                data = await asyncio.to_thread(f.read, min(chunk_size, remaining))
+                if not data:
+                    return
+                remaining -= len(data)
+                yield data
+    finally:
+        await asyncio.to_thread(f.close)
+
+
+def _streaming_response(request, path: str, parts: list, status: int, content_type: str):
+    chunk_size = _chunk_size()
+    if isinstance(request, ASGIRequest):
+        # 同期イテレータだと Django は ASGI 下で全体をメモリに読み込んでしまう
+        content = _aiter_parts(path, parts, chunk_size)
+    else:
+        content = _iter_parts(path, parts, chunk_size)
+    return StreamingHttpResponse(content, status=status, content_type=content_type)
+
+
+def file_etag(st: os.stat_result) -> str:
+    return f'"{st.st_size:x}-{st.st_mtime_ns:x}"'
+
+
+def _if_range_matches(request, etag: str, last_modified: int) -> bool:
+    if_range = request.META.get("HTTP_IF_RANGE")
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith("W/"):
+        # 弱い ETag は If-Range では一致とみなさない
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def ranged_file_response(request, path: str, content_type: str | None = None):
+    """
+    path のファイルを Range / 条件付きリクエスト対応で返す。
+    ファイルが無ければ FileNotFoundError を送出する（呼び出し側で 404 にする）。
+    """
+    st = os.stat(path)
+    size = st.st_size
+    etag = file_etag(st)
+    last_modified = int(st.st_mtime)
+    if content_type is None:
+        content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+
+    # If-None-Match / If-Modified-Since など（304 / 412）
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        ranges = parse_range_header(request.META.get("HTTP_RANGE"), size)
+        if ranges is not None and not _if_range_matches(request, etag, last_modified):
+            ranges = None
+
+        if ranges == []:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{size}"
+        elif request.method == "HEAD":
+            response = HttpResponse(content_type=content_type)
+            response["Content-Length"] = str(size)
+        elif ranges is None:
+            if isinstance(request, ASGIRequest):
+                response = _streaming_response(request, path, [(0, size)], 200, content_type)
+            else:
+                # FileResponse は wsgi.file_wrapper（sendfile）にそのまま渡される
+                response = FileResponse(open(path, "rb"), content_type=content_type)
+                response.block_size = _chunk_size()
+            response["Content-Length"] = str(size)
+        elif len(ranges) == 1:
+            start, end = ranges[0]
+            length = end - start + 1
+            if isinstance(request, ASGIRequest):
+                response = _streaming_response(request, path, [(start, length)], 206, content_type)
+            else:
+                response = FileResponse(RangeFile(path, start, length), status=206, content_type=content_type)
+                response.block_size = _chunk_size()
+            response["Content-Range"] = f"bytes {start}-{end}/{size}"
+            response["Content-Length"] = str(length)
+        else:
+            # multipart/byteranges
+            boundary = uuid.uuid4().hex
+            parts: list = []
+            total = 0
+            for start, end in ranges:
+                head = (
+                    f"\r\n--{boundary}\r\n"
+                    f"Content-Type: {content_type}\r\n"
+                    f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+                ).encode("ascii")
+                parts.append(head)
+                parts.append((start, end - start + 1))
+                total += len(head) + end - start + 1
+            tail = f"\r\n--{boundary}--\r\n".encode("ascii")
+            parts.append(tail)
+            total += len(tail)
+            response = _streaming_response(
+                request, path, parts, 206, f"multipart/byteranges; boundary={boundary}"
+            )
+            response["Content-Length"] = str(total)
+
+    response["Accept-Ranges"] = "bytes"
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    return response
+
+
+def offload_response(path: str, mode: str, content_type: str | None = None) -> HttpResponse:
+    """
+    実際の送信をリバースプロキシに任せるレスポンス（本文は空）。
+      - "x-accel-redirect": nginx。MEDIA_ROOT 配下のパスを MEDIA_OFFLOAD_ACCEL_PREFIX
+                            （internal 指定の location）配下の URI に変換して返す
+      - "x-sendfile":       Apache mod_xsendfile / lighttpd。絶対パス（URL エンコード）を返す
+    Range・ETag・304 はプロキシ側が処理する。
+    ファイルが無ければ（直接配信と同じく）FileNotFoundError を送出する。プロキシに渡してから
+    404 になると、呼び出し側が 200 として last_accessed を更新してしまうため。
+    """
+    if not os.path.isfile(path):
+        raise FileNotFoundError(path)
+    if content_type is None:
+        content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    response = HttpResponse(content_type=content_type)
+
+    if mode == "x-accel-redirect":
+        rel = os.path.relpath(path, settings.MEDIA_ROOT).replace("\\", "/")
+        if rel.startswith("../"):
+            raise ValueError(f"{path} is outside MEDIA_ROOT")
+        prefix = getattr(settings, "MEDIA_OFFLOAD_ACCEL_PREFIX", "/protected-media/")
+        response["X-Accel-Redirect"] = quote(prefix.rstrip("/") + "/" + rel)
+    elif mode == "x-sendfile":
+        # 非 ASCII のパスはヘッダにそのまま置けないので URL エンコードする
+        # （mod_xsendfile は XSendFileUnescape が既定で有効）
+        response["X-Sendfile"] = quote(os.path.abspath(path), safe="/:\\")
+    else:
+        raise ValueError(f"Unknown MEDIA_OFFLOAD mode: {mode}")
+    return response
+
+
+def media_file_response(request, path: str, content_type: str | None = None) -> HttpResponse:
+    """MEDIA_OFFLOAD が設定されていればプロキシへ委譲し、無ければ Django から直接返す"""
+    mode = (getattr(settings, "MEDIA_OFFLOAD", "") or "").lower()
+    if mode:
+        return offload_response(path, mode, content_type)
+    return ranged_file_response(request, path, content_type)
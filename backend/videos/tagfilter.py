@@ -0,0 +1,297 @@
+# backend/videos/tagfilter.py
+"""
+In-process bitmap index for tag / flag filtering.
+
+タグごとに「そのタグが付いたファイル id」のビットマップ（Python の int。bit i = id i）を
+メモリに持ち、削除・重複・フォルダ未所属も同じ形で持つ。タグの AND / OR / NOT と
+フラグの組み合わせは int のビット演算だけで求まり、結果を昇順の id リストにして
+一覧のクエリ（カーソルページネーション）に渡す。
+
+  - tag_all=1,2   すべてのタグが付いている（AND）
+  - tag_any=3,4   いずれかのタグが付いている（OR。従来の tag_ids も同じ扱い）
+  - tag_not=5     どのタグも付いていない（NOT）
+
+索引は初回の検索時に DB から作り、以降はタグ・フォルダ・フラグの変更（シグナルと一括更新）で
+差分更新する。別プロセス（Celery のスキャンなど）の変更は TAG_INDEX_MAX_AGE 秒ごとの
+作り直しで取り込む。該当件数が TAG_INDEX_MAX_IDS を超える場合は id リストが大きくなり
+すぎるので、同じ条件をサブクエリで組み立てる。
+"""
+
+import time
+import logging
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .models import File, Folder, Tag
+
+logger = logging.getLogger("videos")
+
+
+def to_bitmap(ids) -> int:
+    """id の集合をビットマップにする（1 ビットずつ int を作り直さないよう bytearray 経由）"""
+    ids = list(ids)
+    if not ids:
+        return 0
+    buf = bytearray(max(ids) // 8 + 1)
+    for i in ids:
+        buf[i >> 3] |= 1 << (i & 7)
+    return int.from_bytes(buf, "little")
+
+
+def to_ids(bitmap: int) -> list[int]:
+    """ビットの立っている位置（= id）を昇順で返す"""
+    result = []
+    data = bitmap.to_bytes((bitmap.bit_length() + 7) // 8, "little")
+    for offset, byte in enumerate(data):
+        while byte:
+            low = byte & -byte
+            result.append(offset * 8 + low.bit_length() - 1)
+            byte ^= low
+    return result
+
+
+class FileBitmapIndex:
+    """タグ・フラグごとのファイル id ビットマップ（スレッドセーフ）"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._loaded_at = None
+        self.files = 0
+        self.deleted = 0
+        self.duplicate = 0
+        self.no_folder = 0
+        self.tags: dict[int, int] = {}
+
+    # ------------------------------------------------------------------
+    # 構築
+    # ------------------------------------------------------------------
+    def rebuild(self) -> None:
+        started = time.monotonic()
+        with self._lock:
+            ids, deleted, duplicate = [], [], []
+            for pk, delete_flag, duplicate_flag in File.objects.values_list(
+                "id", "delete_flag", "duplicate_flag"
+            ).iterator(chunk_size=10000):
+                ids.append(pk)
+                if delete_flag:
+                    deleted.append(pk)
+                if duplicate_flag:
+                    duplicate.append(pk)
+
+            by_tag = defaultdict(list)
+            for tag_id, file_id in File.tags.through.objects.values_list(
+                "tag_id", "file_id"
+            ).iterator(chunk_size=10000):
+                by_tag[tag_id].append(file_id)
+            in_folder = File.folders.through.objects.values_list("file_id", flat=True)
+
+            self.files = to_bitmap(ids)
+            self.deleted = to_bitmap(deleted)
+            self.duplicate = to_bitmap(duplicate)
+            self.no_folder = self.files & ~to_bitmap(in_folder.iterator(chunk_size=10000))
+            self.tags = {tag_id: to_bitmap(file_ids) for tag_id, file_ids in by_tag.items()}
+            self._loaded_at = time.monotonic()
+        logger.info(
+            f"Built tag bitmap index: {len(ids)} files, {len(self.tags)} tags "
+            f"in {time.monotonic() - started:.2f}s"
+        )
+
+    def invalidate(self) -> None:
+        """次の検索で DB から作り直す（id が分からない一括追加の後など）"""
+        with self._lock:
+            self._loaded_at = None
+
+    def _ensure_loaded(self) -> None:
+        max_age = getattr(settings, "TAG_INDEX_MAX_AGE", 300)
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > max_age:
+            self.rebuild()
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded_at is not None
+
+    # ------------------------------------------------------------------
+    # 差分更新（未構築なら何もしない。次の検索で作られる）
+    # ------------------------------------------------------------------
+    def set_tag(self, tag_id: int, file_ids, on: bool) -> None:
+        with self._lock:
+            if not self.loaded:
+                return
+            mask = to_bitmap(file_ids)
+            current = self.tags.get(tag_id, 0)
+            self.tags[tag_id] = (current | mask) if on else (current & ~mask)
+
+    def drop_tag(self, tag_id: int) -> None:
+        with self._lock:
+            self.tags.pop(tag_id, None)
+
+    def clear_tags(self, file_ids) -> None:
+        with self._lock:
+            if not self.loaded:
+                return
+            mask = ~to_bitmap(file_ids)
+            self.tags = {tag_id: bitmap & mask for tag_id, bitmap in self.tags.items()}
+
+    def update_flags(self, file_ids, deleted: bool | None = None, duplicate: bool | None = None) -> None:
+        with self._lock:
+            if not self.loaded:
+                return
+            mask = to_bitmap(file_ids)
+            if deleted is not None:
+                self.deleted = (self.deleted | mask) if deleted else (self.deleted & ~mask)
+            if duplicate is not None:
+                self.duplicate = (self.duplicate | mask) if duplicate else (self.duplicate & ~mask)
+
+    def add_file(self, file: File) -> None:
+        with self._lock:
+            if not self.loaded:
+                return
+            bit = 1 << file.pk
+            if not self.files & bit:
+                # 新規ファイルはフォルダ未所属（フォルダは保存後に追加される）
+                self.files |= bit
+                self.no_folder |= bit
+        self.update_flags([file.pk], deleted=file.delete_flag, duplicate=file.duplicate_flag)
+
+    def remove_file(self, file_id: int) -> None:
+        with self._lock:
+            if not self.loaded:
+                return
+            mask = ~(1 << file_id)
+            self.files &= mask
+            self.deleted &= mask
+            self.duplicate &= mask
+            self.no_folder &= mask
+            self.tags = {tag_id: bitmap & mask for tag_id, bitmap in self.tags.items()}
+
+    def refresh_folders(self, file_ids) -> None:
+        """フォルダの付け外し後に、対象ファイルがフォルダ未所属かどうかを DB から取り直す"""
+        file_ids = set(file_ids)
+        if not file_ids or not self.loaded:
+            return
+        in_folder = set(
+            File.folders.through.objects.filter(file_id__in=file_ids).values_list("file_id", flat=True)
+        )
+        with self._lock:
+            self.no_folder = (self.no_folder | to_bitmap(file_ids - in_folder)) & ~to_bitmap(in_folder)
+
+    # ------------------------------------------------------------------
+    # 検索
+    # ------------------------------------------------------------------
+    def query(
+        self,
+        all_tags=(),
+        any_tags=(),
+        not_tags=(),
+        deleted: bool | None = None,
+        duplicate: bool | None = None,
+        no_folder: bool | None = None,
+    ) -> int:
+        """条件に合うファイルのビットマップを返す"""
+        with self._lock:
+            self._ensure_loaded()
+            result = self.files
+            for tag_id in all_tags:
+                result &= self.tags.get(tag_id, 0)
+            if any_tags:
+                union = 0
+                for tag_id in any_tags:
+                    union |= self.tags.get(tag_id, 0)
+                result &= union
+            for tag_id in not_tags:
+                result &= ~self.tags.get(tag_id, 0)
+            for flag, bitmap in ((deleted, self.deleted), (duplicate, self.duplicate), (no_folder, self.no_folder)):
+                if flag is True:
+                    result &= bitmap
+                elif flag is False:
+                    result &= ~bitmap
+            return result
+
+
+file_index = FileBitmapIndex()
+
+
+def apply_tag_filter(queryset, all_tags=(), any_tags=(), not_tags=(), **flags):
+    """
+    タグ条件（AND / OR / NOT）で絞り込む。flags（deleted / duplicate / no_folder）は
+    ビットマップ側の絞り込みにだけ使う（クエリ側の同じ条件はそのまま残る）。
+    """
+    if not (all_tags or any_tags or not_tags):
+        return queryset
+    if getattr(settings, "TAG_INDEX_ENABLED", True):
+        bitmap = file_index.query(all_tags, any_tags, not_tags, **flags)
+        if bitmap.bit_count() <= getattr(settings, "TAG_INDEX_MAX_IDS", 20000):
+            return queryset.filter(id__in=to_ids(bitmap))
+
+    # 該当件数が多いときは同じ条件をサブクエリで（結合しないので distinct() は不要）
+    through = File.tags.through.objects
+    for tag_id in all_tags:
+        queryset = queryset.filter(id__in=through.filter(tag_id=tag_id).values("file_id"))
+    if any_tags:
+        queryset = queryset.filter(id__in=through.filter(tag_id__in=any_tags).values("file_id"))
+    if not_tags:
+        queryset = queryset.exclude(id__in=through.filter(tag_id__in=not_tags).values("file_id"))
+    return queryset
+
+
+# ------------------------------------------------------------------
+# 索引の差分更新
+# ------------------------------------------------------------------
+@receiver(m2m_changed, sender=File.tags.through)
+def _tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ("post_add", "post_remove"):
+        on = action == "post_add"
+        if reverse:
+            file_index.set_tag(instance.pk, pk_set or (), on)
+        else:
+            for tag_id in pk_set or ():
+                file_index.set_tag(tag_id, [instance.pk], on)
+    elif action == "post_clear":
+        if reverse:
+            file_index.drop_tag(instance.pk)
+        else:
+            file_index.clear_tags([instance.pk])
+
+
+@receiver(m2m_changed, sender=File.folders.through)
+def _folders_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == "pre_clear":
+        instance._index_file_ids = list(instance.files.values_list("id", flat=True))
+    if action in ("post_add", "post_remove"):
+        file_index.refresh_folders(pk_set or () if reverse else [instance.pk])
+    elif action == "post_clear":
+        file_index.refresh_folders(getattr(instance, "_index_file_ids", []) if reverse else [instance.pk])
+
+
+@receiver(post_save, sender=File)
+def _file_saved(sender, instance, created, update_fields=None, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        file_index.add_file(instance)
+    elif update_fields is None or {"delete_flag", "duplicate_flag"} & set(update_fields):
+        file_index.update_flags([instance.pk], deleted=instance.delete_flag, duplicate=instance.duplicate_flag)
+
+
+@receiver(post_delete, sender=File)
+def _file_deleted(sender, instance, **kwargs):
+    file_index.remove_file(instance.pk)
+
+
+@receiver(post_delete, sender=Tag)
+def _tag_deleted(sender, instance, **kwargs):
+    file_index.drop_tag(instance.pk)
+
+
+@receiver(pre_delete, sender=Folder)
+def _folder_deleting(sender, instance, **kwargs):
+    instance._index_file_ids = list(instance.files.values_list("id", flat=True))
+
+
+@receiver(post_delete, sender=Folder)
+def _folder_deleted(sender, instance, **kwargs):
+    file_index.refresh_folders(getattr(instance, "_index_file_ids", []))
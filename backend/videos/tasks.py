@@ -6,24 +6,27 @@ import logging
 from celery import shared_task
 from django.utils import timezone
 from datetime import timedelta
-from .utils import scan_video_directory, check_and_mark_duplicates
+from .utils import scan_video_directory
 
 logger = logging.getLogger('videos')
 
 
 @shared_task
-def periodic_scan_task():
+def periodic_scan_task(full=False):
     """
     定期的なファイルスキャンタスク
+    full=False の場合はスナップショットとの差分だけを処理する
     """
+    from django.conf import settings
+
     logger.info("Starting periodic file scan task...")
     
     try:
         # ファイルスキャンを実行
-        scan_history = scan_video_directory()
-        
-        # 重複チェック
-        duplicates = check_and_mark_duplicates()
+        incremental = not full and getattr(settings, 'SCAN_INCREMENTAL', True)
+        # 重複フラグの更新もスキャン内で行われる
+        scan_history = scan_video_directory(incremental=incremental)
+        duplicates = scan_history.duplicates_found
         
         logger.info(f"Periodic scan completed. Files added: {scan_history.files_added}, Duplicates: {duplicates}")
         
@@ -32,6 +35,7 @@ def periodic_scan_task():
             'scan_id': scan_history.id,
             'files_added': scan_history.files_added,
             'files_updated': scan_history.files_updated,
+            'snapshot_hits': scan_history.snapshot_hits,
             'duplicates_found': duplicates
         }
     
@@ -58,6 +62,18 @@ def cleanup_old_scan_history():
     return deleted_count
 
 
+@shared_task
+def rebuild_library_counters():
+    """
+    ライブラリの集計値を数え直す（差分更新のずれや DB の直接編集の補正）
+    """
+    from .counters import rebuild
+
+    values = rebuild()
+    logger.info(f"Rebuilt library counters: {values}")
+    return values
+
+
 @shared_task
 def generate_missing_thumbnails():
     """
@@ -96,4 +112,220 @@ def generate_missing_thumbnails():
             logger.error(f"Failed to generate thumbnail for {file.file_name}: {str(e)}")
     
     logger.info(f"Generated {generated_count} missing thumbnails")
-    return generated_count
\ No newline at end of file
+    return generated_count
+
+@shared_task
+def upgrade_fingerprints(limit=2000):
+    """
+    旧方式の指紋（md5_hash）を少しずつ現行方式で再計算する
+    （重複判定でも必要な分は遅延再計算されるので、これは残りの埋め合わせ）
+    """
+    import os
+    from django.conf import settings
+    from .models import File
+    from .dedup import upgrade_fingerprints as _upgrade
+    from .utils import FINGERPRINT_VERSION
+
+    rows = list(
+        File.objects.exclude(fingerprint_version=FINGERPRINT_VERSION)
+        .values('id', 'file_path', 'file_size')[:limit]
+    )
+    for r in rows:
+        r['abs_path'] = os.path.join(settings.MEDIA_ROOT, r['file_path'])
+    rows = [r for r in rows if os.path.exists(r['abs_path'])]
+
+    upgraded = _upgrade(rows)
+    logger.info(f"Upgraded {upgraded} file fingerprints")
+    return upgraded
+
+
+@shared_task
+def generate_missing_storyboards(limit=200):
+    """
+    ストーリーボード（シークプレビュー用スプライト）が未生成のファイルに生成する
+    （新規ファイルは取り込み時に生成されるので、既存ファイルの埋め合わせ用）
+    """
+    import os
+    from django.conf import settings
+    from .models import File
+    from .utils import create_video_artifacts, get_video_info
+
+    generated_count = 0
+    files = File.objects.filter(delete_flag=False).order_by('id')
+    for file in files.iterator():
+        if generated_count >= limit:
+            break
+        if (file.metadata or {}).get('storyboard'):
+            continue
+        video_path = os.path.join(settings.MEDIA_ROOT, file.file_path)
+        if not os.path.exists(video_path):
+            continue
+
+        info = {'width': file.width, 'height': file.height, 'duration': file.video_duration}
+        if not file.width or not file.height:
+            info = get_video_info(video_path) or info
+
+        produced = create_video_artifacts(
+            video_path, os.path.splitext(file.file_name)[0], ('storyboard',), info
+        )
+        if 'storyboard' not in produced:
+            logger.warning(f"Failed to generate storyboard for: {file.file_name}")
+            continue
+        file.metadata = dict(file.metadata or {}, storyboard=produced['storyboard'])
+        file.save(update_fields=['metadata', 'updated_at'])
+        generated_count += 1
+
+    logger.info(f"Generated {generated_count} missing storyboards")
+    return generated_count
+
+
+@shared_task
+def generate_proxies(limit=20):
+    """
+    マルチビュー用の軽量プロキシを、最近再生されたファイルから順に生成する
+    容量（PROXY_CACHE_MAX_BYTES）が一杯なら、候補より長く使われていないプロキシとだけ入れ替える
+    """
+    import os
+    from django.conf import settings
+    from django.db.models import F
+    from .models import File
+    from . import proxy
+
+    budget = proxy.max_bytes()
+    cached = proxy.cached_proxies()  # atime の古い順
+    usage = sum(size for _, size, _ in cached)
+
+    generated_count = 0
+    files = (
+        File.objects.filter(delete_flag=False)
+        .order_by(F('last_accessed').desc(nulls_last=True), '-id')
+        .only('id', 'file_path', 'file_name', 'height', 'last_accessed')
+    )
+    for file in files.iterator():
+        if generated_count >= limit:
+            break
+        video_path = os.path.join(settings.MEDIA_ROOT, file.file_path)
+        try:
+            st = os.stat(video_path)
+        except OSError:
+            continue
+        out_path = proxy.proxy_path_for(file.id, st)
+        if os.path.exists(out_path):
+            continue
+
+        # 満杯なら、このファイルより長く再生されていないプロキシを空ける
+        accessed_ns = int(file.last_accessed.timestamp() * 1e9) if file.last_accessed else 0
+        while usage >= budget and cached and cached[0][0] < accessed_ns:
+            _, size, path = cached.pop(0)
+            if proxy.remove_proxy(path):
+                usage -= size
+        if usage >= budget:
+            # 残りの候補はさらに古いので入れ替えない
+            break
+
+        if proxy.create_proxy(video_path, out_path, file.height):
+            generated_count += 1
+            usage += os.path.getsize(out_path)
+
+    proxy.evict()
+    logger.info(f"Generated {generated_count} proxies ({usage} / {budget} bytes)")
+    return generated_count
+
+
+@shared_task
+def fix_faststart(limit=20, mode=None):
+    """
+    MP4 の faststart 判定（File.metadata["faststart"]）が未記録なら atom ヘッダを読んで記録し、
+    FASTSTART_FIX（"cache" / "rewrite"）が設定されていれば moov をストリームコピーで先頭へ移す。
+    変換前後の「最初のフレームまでの時間」を metadata["faststart_fix"] に残す。
+    """
+    import os
+    from functools import reduce
+    from operator import or_
+    from django.conf import settings
+    from django.db.models import Q
+    from .models import File
+    from . import mp4, listcache, counters
+    from .utils import _scan_lock, check_and_mark_duplicates
+
+    mode = (getattr(settings, 'FASTSTART_FIX', '') if mode is None else mode).lower()
+    if mode not in ('', 'cache', 'rewrite'):
+        raise ValueError(f"Unsupported FASTSTART_FIX: {mode}")
+
+    ext_filter = reduce(or_, (Q(file_path__iendswith=ext) for ext in mp4.MP4_EXTS))
+    files = (
+        File.objects.filter(ext_filter, delete_flag=False)
+        .only('id', 'file_path', 'file_name', 'file_size', 'metadata')
+        .order_by('id')
+    )
+    checked = fixed = 0
+    touched_sizes = set()
+    for file in files.iterator():
+        video_path = os.path.join(settings.MEDIA_ROOT, file.file_path)
+        if not os.path.exists(video_path):
+            continue
+        metadata = file.metadata or {}
+        if 'faststart' not in metadata:
+            layout = mp4.faststart_info(video_path)
+            if layout is None:
+                continue
+            metadata = dict(metadata, faststart=layout['faststart'])
+            File.objects.filter(pk=file.pk).update(metadata=metadata)
+            checked += 1
+
+        if not mode or metadata['faststart'] or fixed >= limit:
+            continue
+        if mode == 'cache':
+            out_path = mp4.cache_path_for(file.id, os.stat(video_path))
+            if os.path.exists(out_path):
+                continue
+        else:
+            out_path = f"{video_path}.faststart"
+
+        # rewrite は元ファイルを置き換えるので、全ストリームを保てた場合だけ（キャッシュは映像・音声のみでも可）
+        if not mp4.relocate_moov(video_path, out_path, keep_all_streams=(mode != 'cache')):
+            continue
+        # どちらもコピー直後でページキャッシュに載った状態で測る（差は moov を探す分の読み込み）
+        fix = {
+            'mode': mode,
+            'fixed_at': timezone.now().isoformat(),
+            'first_frame_ms_before': mp4.first_frame_ms(video_path),
+            'first_frame_ms_after': mp4.first_frame_ms(out_path),
+        }
+
+        if mode == 'rewrite':
+            with _scan_lock:
+                try:
+                    os.replace(out_path, video_path)
+                except OSError as e:
+                    # 再生中で置き換えられない（Windows）場合は次回に回す
+                    logger.warning(f"Could not replace {video_path} with faststart copy: {e}")
+                    os.remove(out_path)
+                    continue
+                new_size = os.path.getsize(video_path)
+                with counters.tracking([file.pk]):
+                    File.objects.filter(pk=file.pk).update(
+                        metadata=dict(metadata, faststart=True, faststart_fix=fix),
+                        file_size=new_size,
+                        # 内容が変わったので指紋・検証済みハッシュは無効
+                        fingerprint_version=0,
+                        content_hash=None,
+                        content_hash_mtime=None,
+                        updated_at=timezone.now(),
+                    )
+            touched_sizes.update((file.file_size, new_size))
+            listcache.bump()
+        else:
+            File.objects.filter(pk=file.pk).update(metadata=dict(metadata, faststart_fix=fix))
+            mp4.evict()
+        fixed += 1
+        logger.info(
+            f"Relocated moov of {file.file_name} ({mode}): first frame "
+            f"{fix['first_frame_ms_before']}ms -> {fix['first_frame_ms_after']}ms"
+        )
+
+    if touched_sizes:
+        with _scan_lock:
+            check_and_mark_duplicates(sizes=touched_sizes)
+    logger.info(f"Faststart: checked {checked} files, relocated moov of {fixed}")
+    return {'checked': checked, 'fixed': fixed}
@@ -0,0 +1,603 @@
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+from urllib.parse import unquote
+
+from django.db import connection
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.request import Request
+
+from . import counters, dedup, foldertree, generations, streaming, utils
+from .models import File, Folder, FolderClosure, Tag
+from .pagination import FileCursorPagination
+from .pipeline import IngestItem, PipelineError, ScanPipeline
+from .tagfilter import file_index
+
+
+@override_settings(FILE_LIST_CACHE_ENABLED=False, ALLOWED_HOSTS=["*"])
+class VideosTestCase(TestCase):
+    """タグ・フォルダ付きのファイルを用意する"""
+
+    FILE_COUNT = 120
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tags = [Tag.objects.create(tag_name=f"tag{i}") for i in range(5)]
+        cls.folders = [Folder.objects.create(folder_name=f"folder{i}") for i in range(3)]
+        cls.files = File.objects.bulk_create(
+            File(
+                file_name=f"video{i:03}.mp4",
+                file_path=f"videos/video{i:03}.mp4",
+                file_path_hash=f"{i:064x}",
+                file_size=1000 + i,
+                md5_hash=f"{i:032x}",
+                video_duration=60.0,
+            )
+            for i in range(cls.FILE_COUNT)
+        )
+        tag_rows, folder_rows = [], []
+        for i, file in enumerate(cls.files):
+            for tag in (cls.tags[i % 5], cls.tags[(i + 1) % 5]):
+                tag_rows.append(File.tags.through(file_id=file.pk, tag_id=tag.pk))
+            folder_rows.append(File.folders.through(file_id=file.pk, folder_id=cls.folders[i % 3].pk))
+        File.tags.through.objects.bulk_create(tag_rows)
+        File.folders.through.objects.bulk_create(folder_rows)
+
+    def setUp(self):
+        # 索引はプロセス内に残るので、テストごとに DB から作り直させる
+        file_index.invalidate()
+
+
+class FileListQueryCountTests(VideosTestCase):
+    # ページ本体 + フォルダ・タグの prefetch 各 1 回（行数によらない）
+    LIST_QUERIES = 3
+
+    def _get_page(self, page_size: int) -> None:
+        with self.assertNumQueries(self.LIST_QUERIES):
+            response = self.client.get("/api/files/all/", {"page_size": page_size})
+        self.assertEqual(response.status_code, 200)
+        results = response.json()["results"]
+        self.assertEqual(len(results), page_size)
+        for row in results:
+            self.assertEqual(len(row["tag_names"]), 2)
+            self.assertEqual(len(row["folder_ids"]), 1)
+
+    def test_query_count_does_not_grow_with_page_size(self):
+        self._get_page(10)
+        self._get_page(100)
+
+
+class FileListSortTests(VideosTestCase):
+    def test_unknown_sort_field_is_rejected(self):
+        for sort_by in ("md5_hash", "-search_score", "search_score"):
+            response = self.client.get("/api/files/", {"sort_by": sort_by})
+            self.assertEqual(response.status_code, 400, sort_by)
+            self.assertIn("sort_by", response.json())
+
+    def test_search_score_with_search(self):
+        response = self.client.get("/api/files/", {"search": "video", "sort_by": "-search_score"})
+        self.assertEqual(response.status_code, 200)
+
+    def test_descending_known_field(self):
+        response = self.client.get("/api/files/", {"sort_by": "-file_size", "page_size": 3})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row["file_size"] for row in response.json()["results"]], [1119, 1118, 1117])
+
+
+class MediaOffloadTests(VideosTestCase):
+    """MEDIA_OFFLOAD 時のヘッダとパスの対応（check_media_offload コマンドで確かめている内容）"""
+
+    def setUp(self):
+        super().setUp()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.media_root = tmp.name
+        self.rel_path = "videos/日本語 a.mp4"
+        os.makedirs(os.path.join(self.media_root, "videos"))
+        with open(os.path.join(self.media_root, self.rel_path), "wb") as f:
+            f.write(b"x" * 16)
+        self.file = self.files[0]
+        File.objects.filter(pk=self.file.pk).update(file_path=self.rel_path)
+
+    def _get(self, mode: str, pk=None):
+        with self.settings(MEDIA_ROOT=self.media_root, MEDIA_OFFLOAD=mode):
+            return self.client.get(f"/api/files/{pk or self.file.pk}/stream/", HTTP_RANGE="bytes=0-1")
+
+    def test_x_accel_redirect(self):
+        response = self._get("x-accel-redirect")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b"")
+        self.assertEqual(response["Content-Type"], "video/mp4")
+        self.assertEqual(
+            response["X-Accel-Redirect"], "/protected-media/videos/%E6%97%A5%E6%9C%AC%E8%AA%9E%20a.mp4"
+        )
+
+    def test_x_sendfile(self):
+        response = self._get("x-sendfile")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            unquote(response["X-Sendfile"]), os.path.abspath(os.path.join(self.media_root, self.rel_path))
+        )
+
+    def test_missing_file_is_404_without_offloading(self):
+        for mode in ("x-accel-redirect", "x-sendfile"):
+            response = self._get(mode, pk=self.files[1].pk)
+            self.assertEqual(response.status_code, 404, mode)
+            self.assertFalse(response.has_header("X-Accel-Redirect") or response.has_header("X-Sendfile"))
+        self.assertIsNone(File.objects.get(pk=self.files[1].pk).last_accessed)
+
+    def test_path_outside_media_root(self):
+        with self.settings(MEDIA_ROOT=os.path.join(self.media_root, "videos")):
+            with self.assertRaises(ValueError):
+                streaming.offload_response(__file__, "x-accel-redirect")
+
+
+class FileCursorPaginationTests(VideosTestCase):
+    def setUp(self):
+        super().setUp()
+        # NULL と同じ値が混ざった列で、ページの境目をまたいでも欠け・重複が無いこと
+        files = list(File.objects.all())
+        for i, file in enumerate(files):
+            file.video_duration = None if i % 4 == 0 else float(i % 5)
+        File.objects.bulk_update(files, ["video_duration"])
+
+    def _walk(self, sort_by: str, page_size: int = 7) -> list[int]:
+        ids, params = [], {"sort_by": sort_by, "page_size": page_size}
+        url = "/api/files/"
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200, response.content)
+            body = response.json()
+            ids += [row["id"] for row in body["results"]]
+            url, params = body["next"], None
+        return ids
+
+    def test_nulls_first_ascending_and_last_descending(self):
+        rows = list(File.objects.values_list("video_duration", "id"))
+        nulls = sorted(pk for duration, pk in rows if duration is None)
+        values = sorted((duration, pk) for duration, pk in rows if duration is not None)
+        self.assertEqual(self._walk("video_duration"), nulls + [pk for _, pk in values])
+        self.assertEqual(self._walk("-video_duration"), [pk for _, pk in reversed(values)] + nulls[::-1])
+
+    def test_datetime_cursor_keeps_microseconds(self):
+        self.assertEqual(
+            self._walk("created_at", page_size=11),
+            list(File.objects.order_by("created_at", "id").values_list("id", flat=True)),
+        )
+
+    def test_encode_decode_round_trip(self):
+        paginator = FileCursorPagination()
+        paginator.sort_key, paginator.field = "-created_at", "created_at"
+        file = File.objects.get(pk=self.files[3].pk)
+        token = paginator.encode_cursor({"created_at": file.created_at, "id": file.pk})
+        request = Request(RequestFactory().get("/", {"cursor": token}))
+        self.assertEqual(paginator.decode_cursor(request), (file.created_at, file.pk))
+
+    def test_invalid_cursor(self):
+        response = self.client.get("/api/files/", {"sort_by": "file_size", "page_size": 5})
+        next_url = response.json()["next"]
+        self.assertEqual(self.client.get(next_url).status_code, 200)
+        # ソートを変えると古いカーソルは使えない
+        self.assertEqual(self.client.get(next_url.replace("sort_by=file_size", "sort_by=-file_size")).status_code, 404)
+        self.assertEqual(self.client.get("/api/files/", {"cursor": "not-a-cursor"}).status_code, 404)
+
+
+class RangeHeaderTests(SimpleTestCase):
+    SIZE = 1000
+
+    def test_ignored_headers(self):
+        for header in (None, "", "items=0-1", "bytes=", "bytes=abc", "bytes=5-1", "bytes=1"):
+            self.assertIsNone(streaming.parse_range_header(header, self.SIZE), header)
+
+    def test_single_ranges(self):
+        for header, expected in (
+            ("bytes=0-99", [(0, 99)]),
+            ("bytes=500-", [(500, 999)]),
+            ("bytes=900-5000", [(900, 999)]),
+            # 末尾 N バイト（ファイルより長ければ全体）
+            ("bytes=-100", [(900, 999)]),
+            ("bytes=-5000", [(0, 999)]),
+        ):
+            self.assertEqual(streaming.parse_range_header(header, self.SIZE), expected, header)
+
+    def test_multiple_ranges_are_sorted_and_merged(self):
+        self.assertEqual(
+            streaming.parse_range_header("bytes=500-599, 0-1,2-3,550-700,-10", self.SIZE),
+            [(0, 3), (500, 700), (990, 999)],
+        )
+
+    @override_settings(STREAM_MAX_RANGES=2)
+    def test_too_many_ranges_collapse_to_one(self):
+        self.assertEqual(streaming.parse_range_header("bytes=0-1,10-11,20-21", self.SIZE), [(0, 21)])
+
+    def test_unsatisfiable(self):
+        for header in ("bytes=1000-", "bytes=2000-3000", "bytes=-0", "bytes=1000-1001,-0"):
+            self.assertEqual(streaming.parse_range_header(header, self.SIZE), [], header)
+        # 満たせるものが 1 つでもあればそれだけ返す
+        self.assertEqual(streaming.parse_range_header("bytes=2000-,0-0", self.SIZE), [(0, 0)])
+
+    def test_responses(self):
+        with tempfile.NamedTemporaryFile(suffix=".mp4") as f:
+            f.write(bytes(range(256)) * 4)
+            f.flush()
+            factory = RequestFactory()
+
+            response = streaming.ranged_file_response(factory.get("/", HTTP_RANGE="bytes=1024-"), f.name)
+            self.assertEqual(response.status_code, 416)
+            self.assertEqual(response["Content-Range"], "bytes */1024")
+
+            response = streaming.ranged_file_response(factory.get("/", HTTP_RANGE="bytes=-4"), f.name)
+            self.assertEqual(response.status_code, 206)
+            self.assertEqual(response["Content-Range"], "bytes 1020-1023/1024")
+            self.assertEqual(b"".join(response.streaming_content), bytes([252, 253, 254, 255]))
+
+            response = streaming.ranged_file_response(factory.get("/", HTTP_RANGE="bytes=0-1,10-11"), f.name)
+            self.assertEqual(response.status_code, 206)
+            self.assertTrue(response["Content-Type"].startswith("multipart/byteranges; boundary="))
+            body = b"".join(response.streaming_content)
+            self.assertEqual(len(body), int(response["Content-Length"]))
+            self.assertIn(b"Content-Range: bytes 0-1/1024\r\n\r\n\x00\x01", body)
+            self.assertIn(b"Content-Range: bytes 10-11/1024\r\n\r\n\x0a\x0b", body)
+
+
+class BulkTagActionTests(VideosTestCase):
+    def setUp(self):
+        super().setUp()
+        self.tag = Tag.objects.create(tag_name="bulk")
+
+    def _bulk(self, payload: dict) -> dict:
+        response = self.client.post("/api/files/bulk_action/", payload, content_type="application/json")
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def _usage_count(self) -> int:
+        self.tag.refresh_from_db()
+        return self.tag.usage_count
+
+    def _assert_add_readd_remove(self, target: dict, expected: int, excluded=()):
+        self._bulk({**target, "action": "add_tags", "tag_ids": [self.tag.pk]})
+        self.assertEqual(self._usage_count(), expected)
+        self.assertEqual(self.tag.files.count(), expected)
+        self.assertFalse(self.tag.files.filter(pk__in=excluded).exists())
+
+        # 付いている組は数え直さない
+        self._bulk({**target, "action": "add_tags", "tag_ids": [self.tag.pk]})
+        self.assertEqual(self._usage_count(), expected)
+
+        self._bulk({**target, "action": "remove_tags", "tag_ids": [self.tag.pk]})
+        self.assertEqual(self._usage_count(), 0)
+        self.assertEqual(self.tag.files.count(), 0)
+
+    def test_ids(self):
+        ids = [f.pk for f in self.files[:7]]
+        self._assert_add_readd_remove({"ids": ids}, 7)
+
+    def test_filter(self):
+        # folder0 は 40 件。そのうち 1 件は削除済み（filter に delete_flag が無ければ対象外）
+        folder_files = [f.pk for i, f in enumerate(self.files) if i % 3 == 0]
+        File.objects.filter(pk=folder_files[0]).update(delete_flag=True)
+        self._assert_add_readd_remove(
+            {"filter": {"folder_id": self.folders[0].pk}}, len(folder_files) - 1, excluded=[folder_files[0]]
+        )
+
+    def test_usage_count_recounted_from_relations(self):
+        # ずれていた usage_count も一括操作で中間テーブルの件数に戻る
+        Tag.objects.filter(pk=self.tag.pk).update(usage_count=99)
+        self._bulk({"ids": [self.files[0].pk], "action": "add_tags", "tag_ids": [self.tag.pk]})
+        self.assertEqual(self._usage_count(), 1)
+
+
+
+class BulkSetBasedTests(VideosTestCase):
+    """filter 指定の一括操作（サブクエリのまま更新する）と派生データの整合"""
+
+    def setUp(self):
+        super().setUp()
+        counters.rebuild()
+        file_index.rebuild()
+        self.folder_files = [f.pk for i, f in enumerate(self.files) if i % 3 == 0]
+
+    def _bulk(self, payload: dict) -> dict:
+        response = self.client.post("/api/files/bulk_action/", payload, content_type="application/json")
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def _assert_counters_consistent(self):
+        summary = counters.summary()
+        self.assertEqual({name: summary[name] for name in counters.FIELDS}, counters.totals(File.objects.all()))
+
+    def test_flags(self):
+        in_folder0 = {"folder_id": self.folders[0].pk}
+        result = self._bulk({"filter": in_folder0, "action": "mark_deleted"})
+        self.assertEqual(result["affected"], len(self.folder_files))
+        self._assert_counters_consistent()
+        self.assertEqual(file_index.query(deleted=True).bit_count(), len(self.folder_files))
+
+        result = self._bulk({"filter": {**in_folder0, "delete_flag": True}, "action": "restore"})
+        self.assertEqual(result["affected"], len(self.folder_files))
+        self._assert_counters_consistent()
+        self.assertEqual(File.objects.filter(delete_flag=True).count(), 0)
+
+    def test_folders(self):
+        folder = Folder.objects.create(folder_name="extra")
+        add = {"filter": {"folder_id": self.folders[0].pk}, "action": "add_to_folder", "folder_id": folder.pk}
+        self.assertEqual(self._bulk(add)["changed"], 40)
+        self.assertEqual(self._bulk(add)["changed"], 0)
+
+        # folder0 から外してもまだ extra に属しているので、未所属は増えない
+        self._bulk(
+            {"filter": {"folder_id": self.folders[0].pk}, "action": "remove_from_folder", "folder_id": self.folders[0].pk}
+        )
+        self.assertEqual(counters.summary()["no_folder_count"], 0)
+        self._bulk({"filter": {"folder_id": folder.pk}, "action": "remove_from_folder", "folder_id": folder.pk})
+        self.assertEqual(counters.summary()["no_folder_count"], 40)
+        self._assert_counters_consistent()
+        self.assertEqual(file_index.query(no_folder=True).bit_count(), 40)
+
+    def test_tags_update_search_text_and_index(self):
+        tag = Tag.objects.create(tag_name="Ｓｐｅｃｉａｌ")
+        self._bulk({"filter": {"folder_id": self.folders[0].pk}, "action": "add_tags", "tag_ids": [tag.pk]})
+        self.assertEqual(File.objects.filter(search_text__contains="special").count(), 40)
+        self.assertEqual(file_index.query(all_tags=[tag.pk]).bit_count(), 40)
+
+        self._bulk({"filter": {"tag_all": tag.pk}, "action": "remove_tags", "tag_ids": [tag.pk]})
+        self.assertFalse(File.objects.filter(search_text__contains="special").exists())
+        self.assertEqual(file_index.query(all_tags=[tag.pk]), 0)
+        tag.refresh_from_db()
+        self.assertEqual(tag.usage_count, 0)
+
+class FolderClosureTests(VideosTestCase):
+    def setUp(self):
+        super().setUp()
+        # root / a / b / c と、別の root / d
+        root = self.folders[0]
+        self.a = Folder.objects.create(folder_name="a", parent=root)
+        self.b = Folder.objects.create(folder_name="b", parent=self.a)
+        self.c = Folder.objects.create(folder_name="c", parent=self.b)
+        self.d = Folder.objects.create(folder_name="d", parent=self.folders[1])
+
+    def _assert_closure_matches_parents(self):
+        """閉包テーブルが parent をたどった結果と一致する"""
+        parents = dict(Folder.objects.values_list("id", "parent_id"))
+        expected = set()
+        for folder_id in parents:
+            ancestor, depth = folder_id, 0
+            while ancestor is not None:
+                expected.add((ancestor, folder_id, depth))
+                ancestor, depth = parents[ancestor], depth + 1
+        self.assertEqual(set(FolderClosure.objects.values_list("ancestor_id", "descendant_id", "depth")), expected)
+
+    def test_move_subtree(self):
+        self._assert_closure_matches_parents()
+        self.b.parent = self.d
+        self.b.save()
+        self._assert_closure_matches_parents()
+        self.assertEqual(self.c.get_full_path(), "folder1/d/b/c")
+        self.assertEqual([f.pk for f in self.c.get_ancestors()], [self.folders[1].pk, self.d.pk, self.b.pk])
+        self.assertFalse(self.a.get_descendants().exists())
+
+        # ルートへ移動
+        self.b.parent = None
+        self.b.save()
+        self._assert_closure_matches_parents()
+        self.assertEqual(self.c.get_full_path(), "b/c")
+
+    def test_cycle_rejected(self):
+        for parent in (self.c, self.a):
+            response = self.client.patch(
+                f"/api/folders/{self.a.pk}/", {"parent": parent.pk}, content_type="application/json"
+            )
+            self.assertEqual(response.status_code, 400, parent.folder_name)
+        self.a.refresh_from_db()
+        self.assertEqual(self.a.parent_id, self.folders[0].pk)
+
+        response = self.client.patch(
+            f"/api/folders/{self.a.pk}/", {"parent": self.d.pk}, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        self._assert_closure_matches_parents()
+
+
+class CounterTrackingTests(VideosTestCase):
+    """差分で更新した LibraryCounters が rebuild() の数え直しと一致する"""
+
+    def setUp(self):
+        super().setUp()
+        counters.rebuild()
+
+    def _assert_matches_rebuild(self):
+        summary = counters.summary()
+        self.assertEqual({name: summary[name] for name in counters.FIELDS}, counters.rebuild())
+
+    def _aggregate_queries(self, save) -> list:
+        with CaptureQueriesContext(connection) as ctx:
+            save()
+        return [q["sql"] for q in ctx.captured_queries if "COUNT(" in q["sql"] or "counters" in q["sql"]]
+
+    def test_save_without_counted_change_skips_aggregates(self):
+        file = File.objects.get(pk=self.files[0].pk)
+        file.file_name = "renamed.mp4"
+        # 集計の前後 2 クエリと加算は行わない
+        self.assertEqual(self._aggregate_queries(file.save), [])
+        self.assertNotEqual(self._aggregate_queries(file.mark_as_deleted), [])
+        self.assertEqual(self._aggregate_queries(file.mark_as_deleted), [])
+        self._assert_matches_rebuild()
+
+    def test_save_with_counted_change(self):
+        file = File.objects.get(pk=self.files[1].pk)
+        file.file_size += 500
+        file.duplicate_flag = True
+        file.save()
+        self._assert_matches_rebuild()
+        file.mark_as_deleted()
+        self._assert_matches_rebuild()
+        file.restore()
+        self._assert_matches_rebuild()
+
+    def test_tracking_update(self):
+        ids = [f.pk for f in self.files[:30]]
+        with counters.tracking(ids):
+            File.objects.filter(pk__in=ids[:10]).update(delete_flag=True)
+            File.objects.filter(pk__in=ids[10:]).update(duplicate_flag=True, video_duration=None)
+        self._assert_matches_rebuild()
+        # フォルダ所属の変更（シグナル）と作成（record_created）
+        self.folders[0].files.clear()
+        File.objects.create(file_name="new.mp4", file_path="videos/new.mp4", file_size=10, md5_hash="0" * 32)
+        self._assert_matches_rebuild()
+
+
+@override_settings(FINGERPRINT_SAMPLES=2, FINGERPRINT_BLOCK_SIZE=4)
+class DedupStagingTests(TestCase):
+    """サイズ → サンプル指紋 → 全体ハッシュの順に絞り、全体ハッシュは最後まで残った組だけ計算する"""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.media_root = tmp.name
+        contents = {
+            # 同一内容（a2 は旧方式の指紋なので再計算される）
+            "a1": b"A" * 100,
+            "a2": b"A" * 100,
+            # 先頭・末尾のサンプルは同じで中身が違う（全体ハッシュで区別する）
+            "b1": b"B" * 98 + b"1" + b"B" * 101,
+            "b2": b"B" * 98 + b"2" + b"B" * 101,
+            # サイズは同じだが指紋が違う（全体ハッシュは計算しない）
+            "c1": b"1" + b"C" * 299,
+            "c2": b"2" + b"C" * 299,
+            # 同じサイズの相手がいない
+            "e": b"E" * 400,
+        }
+        self.ids = {}
+        for name, data in contents.items():
+            path = os.path.join(self.media_root, f"{name}.mp4")
+            with open(path, "wb") as f:
+                f.write(data)
+            self.ids[name] = self._create(name, len(data), utils.calculate_sampled_fingerprint(path, len(data))).pk
+        File.objects.filter(pk=self.ids["a2"]).update(md5_hash="0" * 32, fingerprint_version=1)
+        # ディスク上に無いファイルは確定できないのでどのグループにも入れない
+        self.ids["missing"] = self._create("missing", 100, File.objects.get(pk=self.ids["a1"]).md5_hash).pk
+
+    def _create(self, name, size, md5_hash):
+        return File.objects.create(file_name=f"{name}.mp4", file_path=f"{name}.mp4", file_size=size, md5_hash=md5_hash)
+
+    def _find(self):
+        hashed = []
+        original = dedup.full_content_hash
+
+        def full_content_hash(path):
+            hashed.append(os.path.basename(path).removesuffix(".mp4"))
+            return original(path)
+
+        with self.settings(MEDIA_ROOT=self.media_root), mock.patch.object(dedup, "full_content_hash", full_content_hash):
+            return dedup.find_duplicate_groups(), sorted(hashed)
+
+    def test_stages(self):
+        groups, hashed = self._find()
+        self.assertEqual(hashed, ["a1", "a2", "b1", "b2"])
+        self.assertEqual([sorted(g) for g in groups.values()], [[self.ids["a1"], self.ids["a2"]]])
+        a2 = File.objects.get(pk=self.ids["a2"])
+        self.assertEqual(a2.fingerprint_version, utils.FINGERPRINT_VERSION)
+        self.assertEqual(list(groups), [dedup.duplicate_group_key(100, a2.content_hash)])
+
+        # 保存した全体ハッシュ（mtime が同じ）は再計算しない
+        self.assertEqual(self._find(), (groups, []))
+
+    def test_size_filter(self):
+        with self.settings(MEDIA_ROOT=self.media_root):
+            self.assertEqual(dedup.find_duplicate_groups(size_filter=[200, 300, 400]), {})
+            groups = dedup.find_duplicate_groups(size_filter=[100])
+        self.assertEqual([sorted(g) for g in groups.values()], [[self.ids["a1"], self.ids["a2"]]])
+
+
+    def test_mark_duplicates_incrementally(self):
+        # 以前の結果で重複になっていた行（c1・e）
+        File.objects.filter(pk__in=[self.ids["c1"], self.ids["e"]]).update(duplicate_flag=True, duplicate_group="x")
+        counters.rebuild()
+        with self.settings(MEDIA_ROOT=self.media_root):
+            # 対象のサイズ以外の行は変えない
+            self.assertEqual(utils.check_and_mark_duplicates(sizes=[100, 300]), 2)
+            flagged = dict(File.objects.filter(duplicate_flag=True).values_list("id", "duplicate_group"))
+            a1 = File.objects.get(pk=self.ids["a1"])
+            key = dedup.duplicate_group_key(100, a1.content_hash)
+            self.assertEqual(flagged, {self.ids["a1"]: key, self.ids["a2"]: key, self.ids["e"]: "x"})
+
+            self.assertEqual(utils.check_and_mark_duplicates(), 2)
+        self.assertEqual(
+            set(File.objects.filter(duplicate_flag=True).values_list("id", flat=True)), {self.ids["a1"], self.ids["a2"]}
+        )
+        self.assertEqual(counters.summary()["duplicate_count"], 2)
+
+
+class SharedGenerationTests(VideosTestCase):
+    @override_settings(FILE_LIST_CACHE_ENABLED=True)
+    def test_list_cache_sees_generation_bumped_elsewhere(self):
+        first = self.client.get("/api/files/all/", {"page_size": 10})
+        # 別プロセス（Celery など）の書き込みは DB の世代番号だけを進める
+        File.objects.filter(pk=self.files[0].pk).update(file_name="renamed.mp4")
+        generations._advance(generations.FILES)
+        second = self.client.get("/api/files/all/", {"page_size": 10}, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(second.status_code, 200)
+        self.assertNotEqual(first["ETag"], second["ETag"])
+
+    def test_folder_tree_invalidated_after_commit(self):
+        foldertree.cached_tree()
+        before = generations.current(generations.FOLDERS)
+        with self.captureOnCommitCallbacks(execute=True):
+            Folder.objects.create(folder_name="new")
+        self.assertEqual(generations.current(generations.FOLDERS), before + 1)
+        self.assertIn("new", [node["folder_name"] for node in foldertree.cached_tree()])
+
+
+
+class ScanPipelineFailureTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        # 子プロセスを起動せず、動画情報・サムネイルは空で返す
+        for target, value in (
+            ("videos.pipeline.ProcessPoolExecutor", lambda max_workers, **kwargs: ThreadPoolExecutor(max_workers)),
+            ("videos.mediaworker.process_media", lambda *args: (None, {}, None)),
+        ):
+            patcher = mock.patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _items(self, n):
+        for i in range(n):
+            path = os.path.join(self.tmp.name, f"{i}.mp4")
+            with open(path, "wb") as f:
+                f.write(b"x" * 1024)
+            yield IngestItem(relative_path=f"videos/{i}.mp4", file_path=path, filename=f"{i}.mp4", file_size=1024)
+
+    def test_writer_failure_stops_producers_instead_of_hanging(self):
+        pipeline = ScanPipeline(self.tmp.name, hash_workers=1, media_workers=1, queue_size=1, batch_size=1)
+        with mock.patch.object(ScanPipeline, "_flush", side_effect=RuntimeError("database is gone")):
+            with self.assertRaises(PipelineError):
+                with pipeline:
+                    # キューは 1 件ずつなので、書き込みが止まると submit() がいずれ詰まる
+                    for item in self._items(20):
+                        pipeline.submit(item)
+
+
+class ScanLockTests(SimpleTestCase):
+    def test_db_lock_taken_once_per_outermost_block(self):
+        lock = utils._ScanLock()
+        with mock.patch.object(lock, "_acquire_db") as acquire, mock.patch.object(lock, "_release_db") as release:
+            with lock:
+                # 同じスレッドからの入れ子（スキャン中の ingest_changes など）は DB のロックを取り直さない
+                with lock:
+                    pass
+                release.assert_not_called()
+            acquire.assert_called_once()
+            release.assert_called_once()
+
+    def test_local_lock_released_when_db_lock_fails(self):
+        lock = utils._ScanLock()
+        with mock.patch.object(lock, "_acquire_db", side_effect=RuntimeError("GET_LOCK failed")):
+            with self.assertRaises(RuntimeError):
+                with lock:
+                    pass
+        self.assertTrue(lock._lock.acquire(blocking=False))
+        lock._lock.release()
@@ -11,7 +11,12 @@ from .views import (
     TagViewSet,
     GroupViewSet,
     ScanView,
+    LibrarySummaryView,
     ScanHistoryViewSet,
+    FileStreamView,
+    FileThumbnailView,
+    FileRemuxView,
+    FileHlsView,
 )
 
 router = DefaultRouter()
@@ -39,8 +44,27 @@ urlpatterns = [
         FileViewSet.as_view({"get": "duplicate_files"}),
         name="duplicate-files",
     ),
+    # 動画配信（Range 対応）
+    path("files/<int:pk>/stream/", FileStreamView.as_view(), name="file-stream"),
+    path("files/<int:pk>/remux/", FileRemuxView.as_view(), name="file-remux"),
+    # HLS（セグメントは初回要求時に生成）
+    path("files/<int:pk>/hls/master.m3u8", FileHlsView.as_view(), name="file-hls-master"),
+    path(
+        "files/<int:pk>/hls/<str:rendition>/index.m3u8",
+        FileHlsView.as_view(),
+        {"playlist": True},
+        name="file-hls-playlist",
+    ),
+    path(
+        "files/<int:pk>/hls/<str:rendition>/<int:segment>.ts",
+        FileHlsView.as_view(),
+        name="file-hls-segment",
+    ),
+    path("files/<int:pk>/thumbnail/", FileThumbnailView.as_view(), name="file-thumbnail"),
     # 通常の ViewSet ルート
     path("", include(router.urls)),
     # 強制スキャン
     path("force_refresh/", ScanView.as_view(), name="force-refresh"),
+    # サイドバー用の件数・合計（集計済みの値）
+    path("summary/", LibrarySummaryView.as_view(), name="library-summary"),
 ]
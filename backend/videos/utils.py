@@ -6,19 +6,45 @@ Utility functions for video processing and file management.
 import os
 import hashlib
 import logging
+import threading
+from dataclasses import dataclass, field
 from pathlib import Path
 
 import ffmpeg  # ffmpeg-python
 import imageio  # 依存関係維持のため（未使用でも削除しない）
 
 from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import CharField, F, Value
+from django.db.models.functions import Cast, Concat
 from django.utils import timezone
 
 from .models import File, ScanHistory
+from .snapshot import ScanSnapshot
+from .pipeline import ScanPipeline, IngestItem
+from .dedup import find_duplicate_groups
+from .search import refresh as refresh_search_text
+from .tagfilter import file_index
+from . import counters, listcache
 
 logger = logging.getLogger("videos")
 
 
+# スキャン対象とする動画拡張子
+VIDEO_EXTS = {
+    ".mp4",
+    ".avi",
+    ".mkv",
+    ".mov",
+    ".wmv",
+    ".flv",
+    ".webm",
+    ".m4v",
+    ".mpg",
+    ".mpeg",
+}
+
+
 def _sha256_hex(s: str) -> str:
     return hashlib.sha256(s.encode("utf-8")).hexdigest()
 
@@ -48,6 +74,9 @@ def get_video_info(file_path: str):
 
         codec = video_stream.get("codec_name") or None
         bitrate = int(probe["format"].get("bit_rate") or 0) or None
+        audio_stream = next(
+            (s for s in probe["streams"] if s.get("codec_type") == "audio"), None
+        )
 
         return {
             "duration": duration,
@@ -56,6 +85,8 @@ def get_video_info(file_path: str):
             "fps": fps,
             "codec": codec,
             "bitrate": bitrate,
+            # 音声なしは ""（未取得の None と区別する）
+            "audio_codec": (audio_stream.get("codec_name") or "") if audio_stream else "",
         }
     except Exception as e:
         logger.error(f"Error getting video info for {file_path}: {e}")
@@ -67,6 +98,7 @@ def calculate_md5_partial(
 ) -> str | None:
     """
     先頭 max_bytes 分の MD5 を計算（重いフルハッシュを避ける）
+    ※ 旧方式（fingerprint_version=1）。新規取り込みでは calculate_sampled_fingerprint を使う
     オリジナル仕様の「最初のキーフレームまでをコピー」相当は環境差の影響が大きいので、
     安定性重視で「先頭バイト数での近似ハッシュ」を採用（既存挙動は保持）。
     """
@@ -86,42 +118,67 @@ def calculate_md5_partial(
         return None
 
 
+# md5_hash 列に入っている指紋の方式
+#   1: 先頭 10MB の MD5（calculate_md5_partial。旧方式）
+#   2: 先頭・末尾・等間隔位置のサンプル + サイズの MD5（calculate_sampled_fingerprint）
+# 0 はサイズ変更などで無効になった値。古い値は重複判定で必要になった時点で再計算する
+FINGERPRINT_VERSION = 2
+
+
+def _pread(f, size: int, offset: int) -> bytes:
+    """位置指定読み込み（os.pread が無い Windows では seek + read）"""
+    if hasattr(os, "pread"):
+        return os.pread(f.fileno(), size, offset)
+    f.seek(offset)
+    return f.read(size)
+
+
+def calculate_sampled_fingerprint(file_path: str, file_size: int | None = None) -> str | None:
+    """
+    ファイル全体から小さなブロックを数か所（先頭・等間隔・末尾）だけ読んだ指紋。
+    先頭 10MB だけを読む方式より I/O が大幅に少なく、同じイントロの別動画も区別できる。
+    """
+    samples = max(2, getattr(settings, "FINGERPRINT_SAMPLES", 9))
+    block_size = getattr(settings, "FINGERPRINT_BLOCK_SIZE", 64 * 1024)
+    try:
+        with open(file_path, "rb", buffering=0) as f:
+            if file_size is None:
+                file_size = os.fstat(f.fileno()).st_size
+            h = hashlib.md5()
+            h.update(f"{file_size}:".encode("ascii"))
+            if file_size <= block_size * samples:
+                h.update(_pread(f, file_size, 0))
+            else:
+                last = file_size - block_size
+                for i in range(samples):
+                    h.update(_pread(f, block_size, last * i // (samples - 1)))
+        return h.hexdigest()
+    except Exception as e:
+        logger.error(f"Failed to calculate fingerprint for {file_path}: {e}")
+        return None
+
+
 def create_gif_thumbnail(
     video_path: str, gif_path: str, duration: int = 10, fps: int = 10
 ) -> bool:
     """
     GIF サムネイル生成（既存 API 互換のため残置）
+    パレット生成は同じフィルタグラフ内で行い、デコードは 1 回で済ませる
     """
     try:
-        palette_path = gif_path + ".palette.png"
-        # パレット生成
-        (
-            ffmpeg.input(video_path, ss=0)
-            .filter("fps", fps)
+        clip = (
+            ffmpeg.input(video_path, t=duration)
+            .video.filter("fps", fps)
             .filter("scale", -1, 360)
-            .output(palette_path, vframes=fps * duration, f="image2", vcodec="png")
-            .overwrite_output()
-            .run(capture_stdout=True, capture_stderr=True)
+            .split()
         )
-        # GIF 生成
+        palette = clip[0].filter("palettegen")
         (
-            ffmpeg.input(video_path, ss=0)
-            .filter("fps", fps)
-            .filter("scale", -1, 360)
-            .filter("paletteuse")
-            .output(
-                gif_path,
-                vframes=fps * duration,
-                loop=0,
-                vf=f"paletteuse=diff_mode=rectangle:palette={palette_path}",
-            )
+            ffmpeg.filter([clip[1], palette], "paletteuse", diff_mode="rectangle")
+            .output(gif_path, loop=0)
             .overwrite_output()
             .run(capture_stdout=True, capture_stderr=True)
         )
-        try:
-            os.remove(palette_path)
-        except OSError:
-            pass
         return True
     except ffmpeg.Error as e:
         logger.error(
@@ -139,13 +196,16 @@ def create_webp_thumbnail(
     quality: int = 80,
     lossless: bool = False,
     compression_level: int = 4,
+    seek: float | None = None,
 ) -> bool:
     """
     単枚 WebP サムネイル生成（軽量でフロント互換）
+    seek を指定すると入力側シーク + キーフレームのみデコードでその付近のフレームを使う
+    （動画の長さに関係なくほぼ一定時間で済む）
     """
     try:
         (
-            ffmpeg.input(video_path, ss=0)
+            _keyframe_input(video_path, seek)
             .filter("scale", -1, 360)
             .output(
                 webp_path,
@@ -169,14 +229,657 @@ def create_webp_thumbnail(
         return False
 
 
-def scan_video_directory() -> ScanHistory:
+def _keyframe_input(video_path: str, seek: float | None):
+    """
+    seek 秒付近のキーフレームから読む入力。
+    -ss を入力側に置いてコンテナのインデックスで飛び、-skip_frame nokey で
+    キーフレーム以外のデコードを省く（noaccurate_seek で直前のキーフレームをそのまま使う）
+    """
+    if not seek:
+        return ffmpeg.input(video_path, ss=0)
+    return ffmpeg.input(video_path, ss=f"{seek:.3f}", skip_frame="nokey", noaccurate_seek=None)
+
+
+def _frame_score(gray: bytes | None) -> float | None:
+    """
+    64px 幅のグレースケール（rawvideo）1 フレームの見栄えのスコア。
+    真っ黒・真っ白・単色（ロゴ背景など）ほど低い。取得できていなければ None
+    """
+    if not gray:
+        return None
+    n = len(gray)
+    mean = sum(gray) / n
+    stdev = (sum((p - mean) ** 2 for p in gray) / n) ** 0.5
+    if mean < 16 or mean > 240:
+        # 暗転・白飛びは明示的に後回し
+        return stdev / 10
+    return stdev
+
+
+def thumbnail_candidates(duration: float | None) -> list[float]:
+    """
+    代表フレームの候補時刻（THUMBNAIL_POSITIONS は長さに対する割合。優先順）
+    THUMBNAIL_SCORE_CANDIDATES が無効なら先頭の 1 つだけ（採点しない）
+    """
+    if not duration or duration <= 0:
+        return []
+    positions = getattr(settings, "THUMBNAIL_POSITIONS", (0.1, 0.5))
+    candidates = [duration * p for p in positions if 0 <= p < 1]
+    if not getattr(settings, "THUMBNAIL_SCORE_CANDIDATES", True):
+        return candidates[:1]
+    return candidates
+
+
+def _choose_candidate(gray_frames: list[bytes | None]) -> int | None:
+    """候補（優先順）のうち使うものの番号。十分なスコアのものがあれば最初のもの、なければ最高点"""
+    min_score = getattr(settings, "THUMBNAIL_MIN_SCORE", 20)
+    best, best_score = None, -1.0
+    for i, gray in enumerate(gray_frames):
+        score = _frame_score(gray)
+        if score is None:
+            continue
+        if score >= min_score:
+            return i
+        if score > best_score:
+            best, best_score = i, score
+    return best
+
+
+def _storyboard_layout(info: dict | None) -> dict:
+    """ストーリーボード（シークプレビュー用スプライト）のタイル配置"""
+    columns = getattr(settings, "STORYBOARD_COLUMNS", 5)
+    rows = getattr(settings, "STORYBOARD_ROWS", 5)
+    tile_width = getattr(settings, "STORYBOARD_TILE_WIDTH", 160)
+    width = (info or {}).get("width")
+    height = (info or {}).get("height")
+    # scale=W:-2 と同じく偶数に丸める（不明な場合は 16:9 とみなす）
+    tile_height = int(round(tile_width * height / width / 2)) * 2 if width and height else 90
+    return {
+        "interval": getattr(settings, "STORYBOARD_INTERVAL", 10),
+        "columns": columns,
+        "rows": rows,
+        "tile_width": tile_width,
+        "tile_height": tile_height,
+    }
+
+
+def create_video_artifacts(
+    video_path: str,
+    name: str,
+    artifacts=("thumbnail",),
+    info: dict | None = None,
+) -> dict:
+    """
+    1 回のデコードから複数の派生ファイルを生成する（split フィルタで分岐）
+      - "thumbnail": 単枚 WebP（WEBP_DIR/<name>.webp）
+                     THUMBNAIL_MODE="representative" では候補位置ごとのキーフレームシークを同じ
+                     ffmpeg の入力に加え、採点して 1 枚を選ぶ（全体デコードはしない）
+      - "preview":   アニメーション GIF（GIF_DIR/<name>.gif、パレットはグラフ内で生成）
+      - "storyboard": STORYBOARD_INTERVAL 秒ごとのフレームを並べたスプライト
+                      （WEBP_DIR/storyboards/<name>_NNN.webp）
+    戻り値は生成できたものの MEDIA_ROOT 相対パス（storyboard はレイアウト情報付きの dict）
+    """
+    artifacts = [a for a in artifacts if a in ("thumbnail", "preview", "storyboard")]
+    if not artifacts:
+        return {}
+
+    webp_dir = getattr(settings, "WEBP_DIR", os.path.join(settings.MEDIA_ROOT, "webp"))
+    produced = {}
+
+    # 代表フレームのサムネイルは、同じ ffmpeg の中で候補ごとの入力（キーフレームへの高速シーク）から
+    # 取り出して採点する（全体デコードは不要。ffmpeg の起動は 1 ファイル 1 回）
+    candidates = []
+    if "thumbnail" in artifacts and getattr(settings, "THUMBNAIL_MODE", "representative") == "representative":
+        candidates = thumbnail_candidates((info or {}).get("duration"))
+        if candidates:
+            artifacts = [a for a in artifacts if a != "thumbnail"]
+    thumbnail_path = os.path.join(webp_dir, f"{name}.webp")
+    candidate_files = [(f"{thumbnail_path}.{i}.part", f"{thumbnail_path}.{i}.gray") for i in range(len(candidates))]
+
+    gif_dir = getattr(settings, "GIF_DIR", os.path.join(settings.MEDIA_ROOT, "gifs"))
+    storyboard_dir = os.path.join(webp_dir, "storyboards")
+    layout = _storyboard_layout(info)
+
+    try:
+        outputs = []
+        for ts, (webp_part, gray_part) in zip(candidates, candidate_files):
+            frame = _keyframe_input(video_path, ts).video
+            if len(candidates) > 1:
+                split = frame.split()
+                frame, gray = split[0], split[1]
+                outputs.append(
+                    gray.filter("scale", 64, -2).output(gray_part, vframes=1, f="rawvideo", pix_fmt="gray")
+                )
+            outputs.append(
+                frame.filter("scale", -1, 360).output(
+                    webp_part, vframes=1, f="webp", compression_level=4, **{"qscale:v": 80}
+                )
+            )
+
+        source = ffmpeg.input(video_path).video if artifacts else None
+        branches = source.split() if len(artifacts) > 1 else None
+
+        for i, kind in enumerate(artifacts):
+            stream = branches[i] if branches is not None else source
+            if kind == "thumbnail":
+                path = os.path.join(webp_dir, f"{name}.webp")
+                outputs.append(
+                    stream.filter("scale", -1, 360).output(
+                        path, vframes=1, f="webp", compression_level=4, **{"qscale:v": 80}
+                    )
+                )
+                produced[kind] = f"webp/{name}.webp"
+            elif kind == "preview":
+                os.makedirs(gif_dir, exist_ok=True)
+                path = os.path.join(gif_dir, f"{name}.gif")
+                clip = (
+                    stream.trim(duration=10)
+                    .setpts("PTS-STARTPTS")
+                    .filter("fps", 10)
+                    .filter("scale", -1, 360)
+                    .split()
+                )
+                palette = clip[0].filter("palettegen")
+                outputs.append(
+                    ffmpeg.filter([clip[1], palette], "paletteuse", diff_mode="rectangle")
+                    .output(path, loop=0)
+                )
+                produced[kind] = f"gifs/{name}.gif"
+            else:
+                os.makedirs(storyboard_dir, exist_ok=True)
+                # image2 の連番パターンなのでファイル名中の % はエスケープする
+                pattern = os.path.join(storyboard_dir, f"{name.replace('%', '%%')}_%03d.webp")
+                outputs.append(
+                    stream.filter("fps", f"1/{layout['interval']}")
+                    .filter("scale", layout["tile_width"], layout["tile_height"])
+                    .filter("tile", f"{layout['columns']}x{layout['rows']}")
+                    .output(pattern, f="image2", start_number=0, **{"qscale:v": 70})
+                )
+                produced[kind] = dict(layout, pattern=f"webp/storyboards/{name}_%03d.webp")
+
+        (
+            ffmpeg.merge_outputs(*outputs)
+            .overwrite_output()
+            .run(capture_stdout=True, capture_stderr=True)
+        )
+
+        if candidates:
+            chosen = 0
+            if len(candidates) > 1:
+                chosen = _choose_candidate([_read_if_exists(gray_part) for _, gray_part in candidate_files])
+            if chosen is not None and os.path.exists(candidate_files[chosen][0]):
+                os.replace(candidate_files[chosen][0], thumbnail_path)
+                produced["thumbnail"] = f"webp/{name}.webp"
+
+        if "storyboard" in produced:
+            prefix = f"{name}_"
+            sheets = sorted(
+                f for f in os.listdir(storyboard_dir)
+                if f.startswith(prefix) and f.endswith(".webp") and f[len(prefix):-5].isdigit()
+            )
+            if sheets:
+                produced["storyboard"]["sheets"] = len(sheets)
+            else:
+                produced.pop("storyboard")
+        return produced
+    except ffmpeg.Error as e:
+        logger.error(
+            f"FFmpeg error creating artifacts for {video_path}: "
+            f"{e.stderr.decode(errors='replace') if getattr(e, 'stderr', None) else e}"
+        )
+    except Exception as e:
+        logger.error(f"Error creating artifacts for {video_path}: {e}")
+    finally:
+        for part in (path for pair in candidate_files for path in pair):
+            if os.path.exists(part):
+                os.remove(part)
+    # まとめての生成に失敗した場合も、サムネイルだけは最優先の候補から単独で作る
+    if candidates and create_webp_thumbnail(video_path, thumbnail_path, seek=candidates[0]):
+        return {"thumbnail": f"webp/{name}.webp"}
+    return {}
+
+
+def _read_if_exists(path: str) -> bytes | None:
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def storyboard_cues(storyboard: dict, duration: float | None) -> list[dict]:
+    """
+    File.metadata["storyboard"] から「時間範囲 -> スプライト上の座標」の対応表を作る。
+    各要素は {"start", "end", "sheet", "x", "y", "w", "h"}（sheet は 0 始まりのシート番号）。
+    """
+    interval = storyboard["interval"]
+    columns = storyboard["columns"]
+    per_sheet = columns * storyboard["rows"]
+    tile_w = storyboard["tile_width"]
+    tile_h = storyboard["tile_height"]
+
+    frames = storyboard.get("sheets", 0) * per_sheet
+    if duration:
+        # 最終シートの余白タイルは含めない
+        frames = min(frames, max(1, -(-int(duration * 1000) // int(interval * 1000))))
+
+    cues = []
+    for k in range(frames):
+        sheet, idx = divmod(k, per_sheet)
+        start = k * interval
+        end = (k + 1) * interval
+        if duration:
+            end = min(end, duration)
+        cues.append({
+            "start": start,
+            "end": end,
+            "sheet": sheet,
+            "x": (idx % columns) * tile_w,
+            "y": (idx // columns) * tile_h,
+            "w": tile_w,
+            "h": tile_h,
+        })
+    return cues
+
+
+def _vtt_time(seconds: float) -> str:
+    ms = int(round(seconds * 1000))
+    h, ms = divmod(ms, 3600_000)
+    m, ms = divmod(ms, 60_000)
+    s, ms = divmod(ms, 1000)
+    return f"{h:02d}:{m:02d}:{s:02d}.{ms:03d}"
+
+
+def storyboard_vtt(storyboard: dict, duration: float | None, sheet_urls: list[str]) -> str:
+    """シークプレビュー用の WebVTT（cue 本文は <画像URL>#xywh=x,y,w,h）"""
+    lines = ["WEBVTT", ""]
+    for cue in storyboard_cues(storyboard, duration):
+        lines.append(f"{_vtt_time(cue['start'])} --> {_vtt_time(cue['end'])}")
+        lines.append(f"{sheet_urls[cue['sheet']]}#xywh={cue['x']},{cue['y']},{cue['w']},{cue['h']}")
+        lines.append("")
+    return "\n".join(lines)
+
+
+def _snapshot_path() -> str:
+    return getattr(
+        settings,
+        "SCAN_SNAPSHOT_PATH",
+        os.path.join(settings.MEDIA_ROOT, ".scan_snapshot.json"),
+    )
+
+
+class FileIndex:
+    """
+    スキャンの DB ステージ用に既存レコードを先読みした索引
+    - by_hash: file_path_hash -> (id, file_size)
+    - by_name_size: (file_name, file_size) -> [id, ...]（移動元の候補。現存パスのものは除外済み）
+    """
+
+    def __init__(self, by_hash: dict, by_name_size: dict):
+        self.by_hash = by_hash
+        self.by_name_size = by_name_size
+
+    @classmethod
+    def load(cls, changed_paths: list[str], present_paths) -> "FileIndex":
+        """
+        changed_paths が少なければ該当分だけを IN 句で、多ければ全件を 1 クエリで読み込む。
+        present_paths は今回ディスク上で確認できたパス（移動元候補の除外に使う）。
+        """
+        by_hash: dict = {}
+        by_name_size: dict = {}
+        if not changed_paths:
+            return cls(by_hash, by_name_size)
+
+        fields = ("id", "file_path", "file_path_hash", "file_name", "file_size")
+        threshold = getattr(settings, "SCAN_PRELOAD_THRESHOLD", 2000)
+        if len(changed_paths) > threshold:
+            querysets = [File.objects.values_list(*fields).iterator(chunk_size=5000)]
+        else:
+            hashes = [_sha256_hex(p) for p in changed_paths]
+            names = list({os.path.basename(p) for p in changed_paths})
+            querysets = []
+            for i in range(0, len(hashes), 500):
+                querysets.append(
+                    File.objects.filter(file_path_hash__in=hashes[i:i + 500]).values_list(*fields)
+                )
+            for i in range(0, len(names), 500):
+                querysets.append(
+                    File.objects.filter(file_name__in=names[i:i + 500]).values_list(*fields)
+                )
+
+        seen: set[int] = set()
+        for qs in querysets:
+            for file_id, file_path, path_hash, file_name, file_size in qs:
+                if file_id in seen:
+                    continue
+                seen.add(file_id)
+                by_hash[path_hash or _sha256_hex(file_path)] = (file_id, file_size)
+                if file_path not in present_paths:
+                    by_name_size.setdefault((file_name, file_size), []).append(file_id)
+        return cls(by_hash, by_name_size)
+
+    def pop_moved(self, file_name: str, file_size: int) -> int | None:
+        """移動元候補を 1 件取り出す（同じレコードを 2 つのパスに割り当てない）"""
+        candidates = self.by_name_size.get((file_name, file_size))
+        if candidates:
+            return candidates.pop(0)
+        return None
+
+
+def _bulk_update_files(
+    records: list[File], fields: list[str], errors: list[str], failed: set[str]
+) -> int:
+    """
+    bulk_update をトランザクション付きのバッチで実行し、更新件数を返す。
+    失敗したバッチのパス（record.file_path）は failed に追加する。
+    """
+    batch_size = getattr(settings, "SCAN_DB_BATCH_SIZE", 200)
+    updated = 0
+    for i in range(0, len(records), batch_size):
+        batch = records[i:i + batch_size]
+        try:
+            # サイズが変わるとライブラリの合計サイズも変わる
+            scope = (
+                counters.tracking(r.id for r in batch)
+                if counters.COUNTED_FIELDS & set(fields)
+                else transaction.atomic()
+            )
+            with scope:
+                File.objects.bulk_update(batch, fields)
+            updated += len(batch)
+        except Exception as e:
+            msg = f"Bulk update of {len(batch)} files ({', '.join(fields)}) failed: {e}"
+            logger.error(msg)
+            errors.append(msg)
+            failed.update(r.file_path for r in batch)
+    return updated
+
+
+@dataclass
+class IngestResult:
+    """ingest_changes / ingest_paths の結果"""
+    added: int = 0
+    updated: int = 0
+    errors: list = field(default_factory=list)
+    # 処理に失敗した relative_path
+    failed: set = field(default_factory=set)
+    # 追加・サイズ変更でメンバーが増減したファイルサイズ（重複グループの差分再計算用）
+    touched_sizes: set = field(default_factory=set)
+
+
+class _ScanLock:
+    """
+    フルスキャン・差分スキャン・ファイル監視からの取り込みが同時に DB を更新しないようにする。
+    プロセス内は RLock（同じスレッドからの入れ子は可）、プロセス間（Celery の定期スキャンと
+    Web の ScanView・ファイル監視など）は MySQL の GET_LOCK で排他する。GET_LOCK は接続に
+    結び付くので、ロックを持ったプロセスが落ちれば外れる。MySQL 以外ではプロセス内の排他だけ。
+    """
+
+    NAME = "videos.scan"
+    # 他のプロセスのスキャンを待つ間、この間隔（秒）ごとにログを出す
+    WAIT_LOG_INTERVAL = 60
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._depth = threading.local()
+
+    def __enter__(self) -> "_ScanLock":
+        self._lock.acquire()
+        depth = getattr(self._depth, "value", 0)
+        if depth == 0:
+            try:
+                self._acquire_db()
+            except BaseException:
+                self._lock.release()
+                raise
+        self._depth.value = depth + 1
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self._depth.value -= 1
+        try:
+            if self._depth.value == 0:
+                self._release_db()
+        finally:
+            self._lock.release()
+
+    def _acquire_db(self) -> None:
+        if connection.vendor != "mysql":
+            return
+        with connection.cursor() as cursor:
+            while True:
+                cursor.execute("SELECT GET_LOCK(%s, %s)", [self.NAME, self.WAIT_LOG_INTERVAL])
+                acquired = cursor.fetchone()[0]
+                if acquired == 1:
+                    return
+                if acquired is None:
+                    raise RuntimeError(f"GET_LOCK({self.NAME}) failed")
+                logger.info("Waiting for a scan running in another process")
+
+    def _release_db(self) -> None:
+        if connection.vendor != "mysql":
+            return
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT RELEASE_LOCK(%s)", [self.NAME])
+
+
+_scan_lock = _ScanLock()
+
+
+class IngestSession:
+    """
+    新規 or 変更されたパス（MEDIA_ROOT からの相対パス）を DB に反映する（スキャンの DB ステージ）。
+    feed() は何回に分けて呼んでもよく、新規ファイルはその場でパイプラインに投入する
+    （走査しながら feed() すれば、走査と指紋計算・サムネイル生成が重なって進む）。
+    サイズ変更・移動の更新は finish() でまとめて反映する。
+
+    - present_paths: ディスク上に存在するパス（`in` で判定できるもの）。移動元候補の除外に使う。
+      走査の途中で feed() する場合は、走査済みの一覧ではなく _OnDisk() を渡す
+    """
+
+    def __init__(self, present_paths, webp_dir: str):
+        self.present_paths = present_paths
+        self.result = IngestResult()
+        self.pipeline = ScanPipeline(webp_dir)
+        self.size_updates: list[File] = []
+        self.moves: list[File] = []
+        # 移動元として割り当て済みのレコード（feed() ごとに索引を読み直しても二重に割り当てない）
+        self._moved_ids: set[int] = set()
+        self._now = timezone.now()
+
+    def __enter__(self) -> "IngestSession":
+        self.pipeline.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is not None:
+            self.pipeline.__exit__(exc_type, exc, tb)
+
+    def feed(self, changed: list[str], file_sizes: dict) -> None:
+        """file_sizes: relative_path -> 現在のファイルサイズ"""
+        if not changed:
+            return
+        # 既存レコードを一度だけ読み込み、新規／変更／移動の判定はメモリ上で行う
+        index = FileIndex.load(changed, self.present_paths)
+        result = self.result
+        for relative_path in changed:
+            filename = os.path.basename(relative_path)
+            file_path = os.path.join(settings.MEDIA_ROOT, relative_path)
+
+            try:
+                file_size = file_sizes[relative_path]
+                path_hash = _sha256_hex(relative_path)
+
+                # 1) パス（ハッシュ）で厳密一致（重複ユニークキーと合致）
+                existing = index.by_hash.get(path_hash)
+                if existing:
+                    # パスは同じ。サイズが変わっていた場合のみ更新
+                    file_id, old_size = existing
+                    if old_size != file_size:
+                        result.touched_sizes.update((old_size, file_size))
+                        self.size_updates.append(
+                            File(
+                                id=file_id,
+                                file_path=relative_path,
+                                file_size=file_size,
+                                # 内容が変わったので指紋・検証済みハッシュは無効
+                                fingerprint_version=0,
+                                content_hash=None,
+                                content_hash_mtime=None,
+                                updated_at=self._now,
+                            )
+                        )
+                    continue
+
+                # 2) “ファイル名＋サイズ” で移動検出
+                #    移動元パスがディスク上にまだ存在するレコードは別ファイル（コピー）なので対象外
+                moved_id = index.pop_moved(filename, file_size)
+                while moved_id in self._moved_ids:
+                    moved_id = index.pop_moved(filename, file_size)
+                if moved_id:
+                    self._moved_ids.add(moved_id)
+                    self.moves.append(
+                        File(
+                            id=moved_id,
+                            file_path=relative_path,
+                            file_path_hash=path_hash,
+                            updated_at=self._now,
+                        )
+                    )
+                    index.by_hash[path_hash] = (moved_id, file_size)
+                    continue
+
+                # 3) 新規作成（ハッシュ・動画情報・サムネイル・DB 登録はパイプラインで並列処理）
+                item = IngestItem(
+                    relative_path=relative_path,
+                    file_path=file_path,
+                    filename=filename,
+                    file_size=file_size,
+                )
+            except Exception as e:
+                msg = f"Error processing file {file_path}: {e}"
+                logger.error(msg)
+                result.errors.append(msg)
+                result.failed.add(relative_path)
+                continue
+            # パイプラインが止まった（PipelineError）場合はスキャンごと失敗させる
+            self.pipeline.submit(item)
+
+    def finish(self) -> IngestResult:
+        """パイプラインの完了を待ち、サイズ変更・移動をまとめて反映して結果を返す"""
+        stats = self.pipeline.close()
+        result = self.result
+        result.updated += _bulk_update_files(
+            self.size_updates,
+            ["file_size", "fingerprint_version", "content_hash", "content_hash_mtime", "updated_at"],
+            result.errors,
+            result.failed,
+        )
+        result.updated += _bulk_update_files(
+            self.moves, ["file_path", "file_path_hash", "updated_at"], result.errors, result.failed
+        )
+        # 移動したファイルは検索用テキストのディレクトリ部分が変わる
+        refresh_search_text(r.id for r in self.moves if r.file_path not in result.failed)
+
+        result.added += stats.added
+        if stats.added:
+            # bulk_create はシグナルを送らないので、タグ・フラグの索引は次の検索で作り直す
+            file_index.invalidate()
+        if stats.added or result.updated:
+            listcache.bump()
+        result.errors.extend(stats.errors)
+        result.failed |= stats.failed
+        result.touched_sizes |= stats.added_sizes
+        return result
+
+
+def ingest_changes(changed: list[str], file_sizes: dict, present_paths, webp_dir: str) -> IngestResult:
+    """
+    新規 or 変更されたパス（MEDIA_ROOT からの相対パス）をまとめて DB に反映する
+    - file_sizes: relative_path -> 現在のファイルサイズ
+    - present_paths: 現在ディスク上に存在するパス（`in` で判定できるもの）。移動元候補の除外に使う
+    """
+    if not changed:
+        return IngestResult()
+    with IngestSession(present_paths, webp_dir) as session:
+        session.feed(changed, file_sizes)
+        return session.finish()
+
+
+class _OnDisk:
+    """present_paths として使う、実ファイルの存在で判定するコンテナ"""
+
+    def __contains__(self, relative_path) -> bool:
+        return os.path.exists(os.path.join(settings.MEDIA_ROOT, relative_path))
+
+
+def ingest_paths(relative_paths, renames: list[tuple[str, str]] | None = None) -> IngestResult:
+    """
+    指定パスだけを取り込む（ファイル監視から呼ばれる）。
+    renames は (旧パス, 新パス) のリストで、旧パスのレコードをそのまま付け替える。
+    存在しないパスは無視する（削除されたファイルのレコードはスキャン同様に残す）。
+    """
+    webp_dir = getattr(settings, "WEBP_DIR", os.path.join(settings.MEDIA_ROOT, "webp"))
+    os.makedirs(webp_dir, exist_ok=True)
+    result = IngestResult()
+    pending = set(relative_paths)
+
+    with _scan_lock:
+        for old_path, new_path in renames or []:
+            new_hash = _sha256_hex(new_path)
+            if File.objects.filter(file_path_hash=new_hash).exists():
+                continue
+            renamed_ids = list(
+                File.objects.filter(file_path_hash=_sha256_hex(old_path)).values_list("id", flat=True)
+            )
+            if renamed_ids:
+                result.updated += File.objects.filter(id__in=renamed_ids).update(
+                    file_name=os.path.basename(new_path),
+                    file_path=new_path,
+                    file_path_hash=new_hash,
+                    updated_at=timezone.now(),
+                )
+                # queryset.update() なので検索用テキストと一覧キャッシュはここで更新する
+                refresh_search_text(renamed_ids)
+                listcache.bump()
+                pending.discard(new_path)
+            else:
+                # 監視対象外から移動してきた場合などは通常の取り込みに回す
+                pending.add(new_path)
+
+        file_sizes = {}
+        for relative_path in pending:
+            try:
+                file_sizes[relative_path] = os.path.getsize(
+                    os.path.join(settings.MEDIA_ROOT, relative_path)
+                )
+            except OSError:
+                continue
+        changed = sorted(file_sizes)
+        sub = ingest_changes(changed, file_sizes, _OnDisk(), webp_dir)
+
+    result.added += sub.added
+    result.updated += sub.updated
+    result.errors.extend(sub.errors)
+    result.failed |= sub.failed
+    result.touched_sizes |= sub.touched_sizes
+    return result
+
+
+def scan_video_directory(incremental: bool = False) -> ScanHistory:
     """
     動画ディレクトリをスキャンして DB を更新
     - 既存判定を file_path_hash（= 相対パスの SHA-256）で実施
     - ファイル移動検出は「ファイル名＋サイズ」で既存更新
+    - 既存レコードは FileIndex で先読みし、更新は bulk_update でまとめて反映
     - サムネイルは WebP を生成（既存の GIF 関数は保持）
+    - incremental=True の場合、前回スナップショットと (size, mtime, inode) が一致する
+      ファイルと mtime 不変のディレクトリを読み飛ばし、差分だけを DB ステージへ渡す
+    - 最後に重複フラグを更新する（差分スキャンでは影響のあったサイズのグループのみ）
     """
-    scan_history = ScanHistory.objects.create()
+    scan_history = ScanHistory.objects.create(
+        scan_mode="incremental" if incremental else "full"
+    )
 
     video_dir = settings.VIDEO_DIR
     webp_dir = getattr(settings, "WEBP_DIR", os.path.join(settings.MEDIA_ROOT, "webp"))
@@ -194,158 +897,144 @@ def scan_video_directory() -> ScanHistory:
         scan_history.save()
         return scan_history
 
-    video_exts = {
-        ".mp4",
-        ".avi",
-        ".mkv",
-        ".mov",
-        ".wmv",
-        ".flv",
-        ".webm",
-        ".m4v",
-        ".mpg",
-        ".mpeg",
-    }
-
     files_scanned = files_added = files_updated = duplicates_found = 0
     errors: list[str] = []
 
-    try:
-        for root, _, files in os.walk(video_dir):
-            for filename in files:
-                if not any(filename.lower().endswith(ext) for ext in video_exts):
-                    continue
+    # 同時に走るスキャン（手動・定期・ファイル監視）とスナップショット／DB 更新が競合しないようにする
+    with _scan_lock:
+        try:
+            snapshot = ScanSnapshot.load(_snapshot_path(), video_dir)
+            # 見つけた変更は SCAN_WALK_BATCH 件ごとに取り込みへ回し、走査と並行して処理する
+            # （走査の途中なので、移動元候補の除外はディスク上の存在で判定する）
+            walk_batch = getattr(settings, "SCAN_WALK_BATCH", 200)
+            pending: dict = {}
+            with IngestSession(_OnDisk(), webp_dir) as session:
 
-                files_scanned += 1
-                file_path = os.path.join(root, filename)
-
-                try:
-                    file_size = os.path.getsize(file_path)
-                    relative_path = os.path.relpath(
-                        file_path, settings.MEDIA_ROOT
-                    ).replace("\\", "/")
-                    path_hash = _sha256_hex(relative_path)
-
-                    # 1) パス（ハッシュ）で厳密一致（重複ユニークキーと合致）
-                    existing = File.objects.filter(file_path_hash=path_hash).first()
-
-                    if existing:
-                        # パスは同じ。サイズやメタが変わっていた場合のみ更新
-                        changed = False
-                        if existing.file_size != file_size:
-                            existing.file_size = file_size
-                            changed = True
-                        if changed:
-                            existing.save(update_fields=["file_size", "updated_at"])
-                            files_updated += 1
-                        continue
-
-                    # 2) “ファイル名＋サイズ” で移動検出（元コードの挙動を保持） :contentReference[oaicite:5]{index=5}
-                    moved = File.objects.filter(
-                        file_name=filename, file_size=file_size
-                    ).first()
-                    if moved:
-                        moved.file_path = relative_path
-                        # file_path_hash は save() で自動更新される（モデルの save を維持） :contentReference[oaicite:6]{index=6}
-                        moved.save(update_fields=["file_path", "updated_at"])
-                        files_updated += 1
-                        continue
-
-                    # 3) 新規作成
-                    md5_hash = calculate_md5_partial(file_path)
-                    if not md5_hash:
-                        errors.append(f"Failed to calculate MD5 for {file_path}")
-                        continue
-
-                    # 新規ファイルは初期状態でduplicate_flag=False
-                    # 重複検出は後でcheck_and_mark_duplicates()で一括処理
-                    is_dup = False
-
-                    info = get_video_info(file_path)
-
-                    # WebP サムネイルを生成
-                    webp_filename = f"{os.path.splitext(filename)[0]}.webp"
-                    webp_path = os.path.join(webp_dir, webp_filename)
-                    webp_ok = create_webp_thumbnail(file_path, webp_path)
-
-                    rec = File.objects.create(
-                        file_name=filename,
-                        file_path=relative_path,
-                        file_size=file_size,
-                        md5_hash=md5_hash,
-                        duplicate_flag=is_dup,
-                    )
+                def on_changed(relative_path, file_size):
+                    pending[relative_path] = file_size
+                    if len(pending) >= walk_batch:
+                        session.feed(list(pending), dict(pending))
+                        pending.clear()
 
-                    if info:
-                        rec.video_duration = info["duration"]
-                        rec.width = info["width"]
-                        rec.height = info["height"]
-                        rec.fps = info["fps"]
-                        rec.codec = info["codec"]
-                        rec.bitrate = info["bitrate"]
+                walk = snapshot.walk(
+                    settings.MEDIA_ROOT, VIDEO_EXTS, incremental=incremental, on_changed=on_changed
+                )
+                session.feed(list(pending), dict(pending))
+                result = session.finish()
+            files_scanned = len(walk.files)
+            files_added += result.added
+            files_updated += result.updated
+            errors.extend(result.errors)
+            failed = result.failed
 
-                    if webp_ok:
-                        # 相対パスで保存（例: webp/xxx.webp）
-                        rec.thumbnail_file_path = f"webp/{webp_filename}"
+            if walk.vanished:
+                # レコードは削除しない（削除フラグはユーザー操作のみ）。件数だけ記録する
+                logger.info(f"{len(walk.vanished)} files vanished since last scan")
 
-                    rec.save()
-                    files_added += 1
-                    logger.info(f"Added file: {filename}")
+            # 重複フラグの更新。差分スキャンでは増減のあったサイズのグループだけ再計算する
+            if incremental:
+                touched = result.touched_sizes | {
+                    snapshot.files[p][0] for p in walk.vanished if p in snapshot.files
+                }
+                if touched:
+                    check_and_mark_duplicates(sizes=touched)
+            else:
+                check_and_mark_duplicates()
+            duplicates_found = File.objects.filter(duplicate_flag=True).count()
 
-                except Exception as e:
-                    msg = f"Error processing file {file_path}: {e}"
-                    logger.error(msg)
-                    errors.append(msg)
+            # 失敗したファイルはスナップショットに載せず、次回スキャンで再処理させる
+            for relative_path in failed:
+                walk.files.pop(relative_path, None)
+            snapshot.files = walk.files
+            snapshot.dirs = walk.dirs
+            try:
+                snapshot.save()
+            except Exception as e:
+                msg = f"Failed to save scan snapshot: {e}"
+                logger.error(msg)
+                errors.append(msg)
 
-        scan_history.completed_at = timezone.now()
-        scan_history.status = "completed"
-        scan_history.files_scanned = files_scanned
-        scan_history.files_added = files_added
-        scan_history.files_updated = files_updated
-        scan_history.duplicates_found = duplicates_found
-        scan_history.errors = errors
-        scan_history.save()
-        logger.info(
-            f"Scan completed: {files_scanned} scanned, {files_added} added, "
-            f"{files_updated} updated, {duplicates_found} duplicates"
-        )
+            scan_history.completed_at = timezone.now()
+            scan_history.status = "completed"
+            scan_history.files_scanned = files_scanned
+            scan_history.files_added = files_added
+            scan_history.files_updated = files_updated
+            scan_history.files_vanished = len(walk.vanished)
+            scan_history.dirs_skipped = walk.dirs_skipped
+            scan_history.snapshot_hits = walk.snapshot_hits
+            scan_history.duplicates_found = duplicates_found
+            scan_history.errors = errors
+            scan_history.save()
+            logger.info(
+                f"Scan completed ({scan_history.scan_mode}): {files_scanned} scanned, "
+                f"{files_added} added, {files_updated} updated, "
+                f"{walk.snapshot_hits} unchanged, {walk.dirs_skipped} dirs skipped, "
+                f"{duplicates_found} duplicates"
+            )
 
-    except Exception as e:
-        msg = f"Scan failed: {e}"
-        logger.error(msg)
-        scan_history.completed_at = timezone.now()
-        scan_history.status = "failed"
-        scan_history.errors = [msg]
-        scan_history.save()
+        except Exception as e:
+            msg = f"Scan failed: {e}"
+            logger.error(msg)
+            scan_history.completed_at = timezone.now()
+            scan_history.status = "failed"
+            scan_history.errors = [msg]
+            scan_history.save()
 
     return scan_history
 
 
-def check_and_mark_duplicates() -> int:
+def check_and_mark_duplicates(sizes=None) -> int:
     """
-    すべてのファイルの重複をチェックして duplicate_flag を更新
-    同じサイズ・同じMD5のファイルが2つ以上ある場合のみ重複とマーク
+    ファイルの重複をチェックして duplicate_flag / duplicate_group を更新
+    同じサイズ・同じ内容のファイルが2つ以上ある場合のみ重複とマーク
+    （サイズ -> 先頭MD5 -> サンプル指紋 -> 全体ハッシュの順に絞り込む。videos.dedup 参照）
+    - sizes を渡すとそのファイルサイズのグループだけを再計算する（スキャンで増減したサイズ）
+    - 更新はフラグ・グループが変わる行だけを対象にした一括 UPDATE で行う
+    戻り値は対象範囲内の重複ファイル数
     """
-    from django.db.models import Count
+    if sizes is not None:
+        sizes = list(set(sizes))
+        if not sizes:
+            return 0
 
-    # まず全ファイルの重複フラグをクリア
-    File.objects.all().update(duplicate_flag=False)
+    groups = find_duplicate_groups(size_filter=sizes)
+    new_groups = {file_id: key for key, ids in groups.items() for file_id in ids}
 
-    # ファイルサイズとMD5ハッシュが同じファイルのグループを取得（2つ以上）
-    groups = (
-        File.objects.values("file_size", "md5_hash")
-        .annotate(count=Count("id"))
-        .filter(count__gt=1)
-    )
+    current = File.objects.filter(duplicate_flag=True)
+    if sizes is not None:
+        current = current.filter(file_size__in=sizes)
+    old_groups = dict(current.values_list("id", "duplicate_group"))
 
-    marked = 0
-    for g in groups:
-        # このグループに属するファイルをすべて重複としてマーク
-        updated = File.objects.filter(
-            file_size=g["file_size"],
-            md5_hash=g["md5_hash"],
-        ).update(duplicate_flag=True)
-        marked += updated
-
-    logger.info(f"Marked {marked} files as duplicates")
-    return marked
+    to_clear = [file_id for file_id in old_groups if file_id not in new_groups]
+    to_set = [
+        file_id for file_id, key in new_groups.items() if old_groups.get(file_id) != key
+    ]
+
+    with transaction.atomic():
+        for i in range(0, len(to_clear), 1000):
+            File.objects.filter(id__in=to_clear[i:i + 1000]).update(
+                duplicate_flag=False, duplicate_group=None
+            )
+        for i in range(0, len(to_set), 1000):
+            # グループキーは file_size と content_hash から SQL 側で組み立てる（グループごとの UPDATE 不要）
+            File.objects.filter(id__in=to_set[i:i + 1000]).update(
+                duplicate_flag=True,
+                duplicate_group=Concat(
+                    Cast("file_size", output_field=CharField()),
+                    Value("-"),
+                    F("content_hash"),
+                    output_field=CharField(),
+                ),
+            )
+        # to_clear はすべて重複だったもの、to_set は新たに重複になったものとグループが変わったもの
+        counters.add({"duplicate_count": sum(1 for i in to_set if i not in old_groups) - len(to_clear)})
+    file_index.update_flags(to_clear, duplicate=False)
+    file_index.update_flags(to_set, duplicate=True)
+    if to_clear or to_set:
+        listcache.bump()
+
+    logger.info(
+        f"Duplicates: {len(new_groups)} files in {len(groups)} groups "
+        f"({len(to_set)} newly marked, {len(to_clear)} cleared)"
+    )
+    return len(new_groups)
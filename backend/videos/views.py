@@ -5,25 +5,76 @@ Views for video streaming application.
 
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.renderers import BaseRenderer
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from rest_framework.views import APIView
-from django.db.models import Q, Count
+from django.conf import settings
+from django.db.models import Count
+from django.http import Http404, HttpResponse, QueryDict, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
 from django.utils import timezone
+from django.views import View
 import logging
+import mimetypes
+import os
 
-from .models import File, Folder, Tag, Group, ScanHistory
+from asgiref.sync import sync_to_async
+
+from .models import File, Folder, FolderClosure, Tag, Group, ScanHistory
 from .serializers import (
     FileListSerializer, FileDetailSerializer, FileBulkActionSerializer,
     FolderSerializer, TagSerializer, GroupSerializer, ScanHistorySerializer
 )
-from .utils import scan_video_directory, check_and_mark_duplicates
+from .utils import scan_video_directory, storyboard_cues, storyboard_vtt, get_video_info
+from .streaming import media_file_response
+from .pagination import FileCursorPagination, check_sort_key
+from .search import apply_search
+from .tagfilter import apply_tag_filter
+from .listcache import cached_list
+from .remux import needs_remux, cache_path_for, remux_plan, start_remux
+from .cache import touch as cache_touch
+from .proxy import find_proxy
+from .mp4 import is_mp4, find_cached_copy as find_faststart_copy
+from . import hls, foldertree, counters
 
 logger = logging.getLogger('videos')
 
 
+class WebVTTRenderer(BaseRenderer):
+    """文字列のレスポンスをそのまま WebVTT として返す"""
+    media_type = 'text/vtt'
+    format = 'vtt'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict):
+            # エラー応答など
+            return str(data.get('error') or data.get('detail') or '').encode(self.charset)
+        return data.encode(self.charset)
+
+
+def _id_list(params, name):
+    """?name=1&name=2 / ?name=1,2 のどちらでも受け付けて int のリストにする"""
+    try:
+        return [int(v) for raw in params.getlist(name) for v in raw.split(',') if v.strip()]
+    except ValueError:
+        raise ValidationError({name: 'Comma separated integer ids are required'})
+
+
 class FileViewSet(viewsets.ModelViewSet):
     """ファイルビューセット"""
     queryset = File.objects.all()
+    # 一覧はソート列 + id のカーソルで続きを取る（OFFSET / 毎ページの COUNT を避ける）
+    pagination_class = FileCursorPagination
+    # 一覧アクションごとに固定で付く条件（タグ索引の絞り込みにも使う）
+    ACTION_FLAGS = {
+        'all_files': {'deleted': False},
+        'no_folder_files': {'deleted': False, 'no_folder': True},
+        'deleted_files': {'deleted': True},
+        'duplicate_files': {'duplicate': True},
+    }
     
     def get_serializer_class(self):
         if self.action in ['list']:
@@ -31,11 +82,10 @@ class FileViewSet(viewsets.ModelViewSet):
         return FileDetailSerializer
     
     def get_queryset(self):
-        queryset = super().get_queryset()
-        
-        # クエリパラメータでフィルタリング
-        params = self.request.query_params
-        
+        return self.filter_files(super().get_queryset(), self.request.query_params)
+
+    def filter_files(self, queryset, params):
+        """クエリパラメータでフィルタリング（一覧と一括操作の filter で共通）"""
         # 削除フラグでフィルタ
         delete_flag = params.get('delete_flag')
         if delete_flag is not None:
@@ -46,79 +96,96 @@ class FileViewSet(viewsets.ModelViewSet):
         if duplicate_flag is not None:
             queryset = queryset.filter(duplicate_flag=duplicate_flag.lower() == 'true')
         
-        # フォルダでフィルタ
+        # フォルダでフィルタ（recursive=true ならサブフォルダのファイルも含める）
         folder_id = params.get('folder_id')
         if folder_id:
-            queryset = queryset.filter(folders__id=folder_id)
+            if params.get('recursive', '').lower() == 'true':
+                # 閉包テーブルで子孫フォルダを引き、所属の中間テーブルで絞る（結合しないので重複しない）
+                subtree = FolderClosure.objects.filter(ancestor_id=folder_id).values('descendant_id')
+                queryset = queryset.filter(
+                    id__in=File.folders.through.objects.filter(folder_id__in=subtree).values('file_id')
+                )
+            else:
+                queryset = queryset.filter(folders__id=folder_id)
         
         # フォルダに属さないファイル
         no_folder = params.get('no_folder')
         if no_folder and no_folder.lower() == 'true':
             queryset = queryset.filter(folders__isnull=True)
         
-        # タグでフィルタ
-        tag_ids = params.getlist('tag_ids')
-        if tag_ids:
-            queryset = queryset.filter(tags__id__in=tag_ids).distinct()
+        # タグでフィルタ（AND / OR / NOT。tag_ids は従来どおり OR）
+        # 索引のビットマップで id を求めるので、フラグ条件も一緒に渡して id を減らしておく
+        tag_all = _id_list(params, 'tag_all')
+        tag_any = _id_list(params, 'tag_any') + _id_list(params, 'tag_ids')
+        tag_not = _id_list(params, 'tag_not')
+        if tag_all or tag_any or tag_not:
+            flags = dict(self.ACTION_FLAGS.get(self.action, {}))
+            if delete_flag is not None:
+                flags.setdefault('deleted', delete_flag.lower() == 'true')
+            if duplicate_flag is not None:
+                flags.setdefault('duplicate', duplicate_flag.lower() == 'true')
+            if no_folder and no_folder.lower() == 'true':
+                flags['no_folder'] = True
+            queryset = apply_tag_filter(queryset, tag_all, tag_any, tag_not, **flags)
         
-        # 検索
+        # 検索（ファイル名・ディレクトリ・タグ名の索引。関連度を search_score に付ける）
         search = params.get('search')
         if search:
-            queryset = queryset.filter(
-                Q(file_name__icontains=search) |
-                Q(file_path__icontains=search) |
-                Q(tags__tag_name__icontains=search)
-            ).distinct()
+            queryset = apply_search(queryset, search)
         
-        # ソート
-        sort_by = params.get('sort_by', '-created_at')
-        queryset = queryset.order_by(sort_by)
+        # ソート（relevance は検索時の関連度順。検索語が無ければ新しい順）
+        sort_by = params.get('sort_by') or ('relevance' if search else '-created_at')
+        if sort_by == 'relevance':
+            sort_by = '-search_score' if search else '-created_at'
+        # 未知の列（や検索語なしの search_score）は FieldError（500）になる前に 400 で返す
+        queryset = queryset.order_by(check_sort_key(queryset, sort_by))
         
         return queryset
     
+    def _list_response(self, queryset):
+        """
+        一覧の高速パス: values() で行を取り（モデルを生成しない）、
+        フォルダ・タグはページ分をまとめて取得する（1 ページあたりのクエリ数は件数によらず一定）
+        """
+        # search_score などの注釈はカーソルのソート列に使うので一緒に取る
+        queryset = queryset.values(*FileListSerializer.VALUES_FIELDS, *queryset.query.annotations)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(FileListSerializer.rows(page))
+        return Response(FileListSerializer.rows(list(queryset)))
+
+    @cached_list
+    def list(self, request, *args, **kwargs):
+        return self._list_response(self.filter_queryset(self.get_queryset()))
+
     @action(detail=False, methods=['get'], url_path='all')
+    @cached_list
     def all_files(self, request):
         """削除されていないすべてのファイル"""
-        queryset = self.get_queryset().filter(delete_flag=False)
-        page = self.paginate_queryset(queryset)
-        if page is not None:
-            serializer = FileListSerializer(page, many=True, context={'request': request})
-            return self.get_paginated_response(serializer.data)
-        serializer = FileListSerializer(queryset, many=True, context={'request': request})
-        return Response(serializer.data)
+        return self._list_response(self.get_queryset().filter(delete_flag=False))
     
     @action(detail=False, methods=['get'], url_path='no-folder')
+    @cached_list
     def no_folder_files(self, request):
         """フォルダに属さないファイル"""
-        queryset = self.get_queryset().filter(folders__isnull=True, delete_flag=False)
-        page = self.paginate_queryset(queryset)
-        if page is not None:
-            serializer = FileListSerializer(page, many=True, context={'request': request})
-            return self.get_paginated_response(serializer.data)
-        serializer = FileListSerializer(queryset, many=True, context={'request': request})
-        return Response(serializer.data)
+        return self._list_response(
+            self.get_queryset().filter(folders__isnull=True, delete_flag=False)
+        )
     
     @action(detail=False, methods=['get'], url_path='deleted')
+    @cached_list
     def deleted_files(self, request):
         """削除フラグの付いたファイル"""
-        queryset = self.get_queryset().filter(delete_flag=True)
-        page = self.paginate_queryset(queryset)
-        if page is not None:
-            serializer = FileListSerializer(page, many=True, context={'request': request})
-            return self.get_paginated_response(serializer.data)
-        serializer = FileListSerializer(queryset, many=True, context={'request': request})
-        return Response(serializer.data)
+        return self._list_response(self.get_queryset().filter(delete_flag=True))
     
     @action(detail=False, methods=['get'], url_path='duplicates')
+    @cached_list
     def duplicate_files(self, request):
-        """重複フラグが付いたファイル"""
+        """重複フラグが付いたファイル（sort_by 未指定時は重複グループ順）"""
         queryset = self.get_queryset().filter(duplicate_flag=True)
-        page = self.paginate_queryset(queryset)
-        if page is not None:
-            serializer = FileListSerializer(page, many=True, context={'request': request})
-            return self.get_paginated_response(serializer.data)
-        serializer = FileListSerializer(queryset, many=True, context={'request': request})
-        return Response(serializer.data)
+        if 'sort_by' not in request.query_params:
+            queryset = queryset.order_by('duplicate_group', 'id')
+        return self._list_response(queryset)
 
     @action(detail=True, methods=['post'], url_path='mark_deleted')
     def mark_deleted(self, request, pk=None):
@@ -192,12 +259,69 @@ class FileViewSet(viewsets.ModelViewSet):
 
         return Response({'status': 'tags removed'})
 
+    def _storyboard(self, file):
+        """metadata に記録されたストーリーボードとシート画像の URL（未生成なら None）"""
+        storyboard = (file.metadata or {}).get('storyboard')
+        if not storyboard or not storyboard.get('sheets'):
+            return None, []
+        base = getattr(settings, 'MEDIA_URL', '/media/')
+        # pattern は webp/storyboards/<name>_%03d.webp（name 中の % はそのまま）
+        head, _, tail = storyboard['pattern'].rpartition('%03d')
+        urls = [
+            f"{base}{head}{i:03d}{tail}".replace('//', '/')
+            for i in range(storyboard['sheets'])
+        ]
+        return storyboard, urls
+
+    @action(
+        detail=True, methods=['get'], url_path='storyboard',
+        renderer_classes=[*api_settings.DEFAULT_RENDERER_CLASSES, WebVTTRenderer],
+    )
+    def storyboard(self, request, pk=None, format=None):
+        """
+        シークプレビュー用ストーリーボードの索引
+        既定は JSON、storyboard.vtt（または ?format=vtt）で WebVTT を返す
+        """
+        file = self.get_object()
+        storyboard, urls = self._storyboard(file)
+        if storyboard is None:
+            return Response({'error': 'Storyboard not available'}, status=status.HTTP_404_NOT_FOUND)
+
+        if request.accepted_renderer.format == 'vtt':
+            # 外部プレイヤーからも解決できるよう絶対 URL にする
+            urls = [request.build_absolute_uri(u) for u in urls]
+            data = storyboard_vtt(storyboard, file.video_duration, urls)
+        else:
+            data = {
+                'interval': storyboard['interval'],
+                'columns': storyboard['columns'],
+                'rows': storyboard['rows'],
+                'tile_width': storyboard['tile_width'],
+                'tile_height': storyboard['tile_height'],
+                'sheets': urls,
+                'cues': storyboard_cues(storyboard, file.video_duration),
+            }
+        response = Response(data)
+        response['Cache-Control'] = 'private, max-age=3600'
+        return response
+
     @action(detail=False, methods=['post'], url_path='bulk_action')
     def bulk_action(self, request):
         """一括操作"""
         serializer = FileBulkActionSerializer(data=request.data)
         if serializer.is_valid():
-            result = serializer.perform()
+            files = None
+            if 'filter' in serializer.validated_data:
+                # 一覧と同じ条件で対象を決める（{"search": "...", "tag_all": [1, 2]} など）
+                params = QueryDict(mutable=True)
+                for name, value in serializer.validated_data['filter'].items():
+                    values = value if isinstance(value, list) else [value]
+                    params.setlist(name, [str(v).lower() if isinstance(v, bool) else str(v) for v in values])
+                # 一覧（all_files）と同じく、指定がなければ削除済みは対象にしない
+                if 'delete_flag' not in params:
+                    params['delete_flag'] = 'false'
+                files = self.filter_files(File.objects.all(), params)
+            result = serializer.perform(files)
             return Response(result)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -223,23 +347,12 @@ class FolderViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['get'], url_path='tree')
     def tree(self, request):
-        """フォルダツリーを取得"""
-        def build_tree(parent=None):
-            nodes = Folder.objects.filter(parent=parent).annotate(
-                file_count=Count('files')
-            )
-            folders = []
-            for node in nodes:
-                folders.append({
-                    'id': node.id,
-                    'folder_name': node.folder_name,
-                    'children': build_tree(node),
-                    'file_count': node.file_count
-                })
-            return folders
-
-        tree = build_tree()
-        return Response(tree)
+        """
+        フォルダツリーを取得（フォルダ 1 クエリ + ファイル数 1 クエリで組み立ててキャッシュ）
+        recursive_counts=true でサブフォルダを含むファイル数（total_file_count）も返す
+        """
+        recursive_counts = request.query_params.get('recursive_counts', '').lower() == 'true'
+        return Response(foldertree.cached_tree(recursive_counts))
 
 
 class TagViewSet(viewsets.ModelViewSet):
@@ -270,21 +383,179 @@ class GroupViewSet(viewsets.ModelViewSet):
     serializer_class = GroupSerializer
 
 
+class FileStreamView(View):
+    """
+    動画ファイルの配信（File.id 指定、Range / 条件付きリクエスト対応）
+    static() による /media/ 配信は DEBUG 時のみで Range も無視するため、再生はこちらを使う
+    MEDIA_OFFLOAD 設定時は削除フラグの確認と last_accessed の更新だけを行い、
+    送信はリバースプロキシ（X-Accel-Redirect / X-Sendfile）に任せる
+    ?quality=proxy なら生成済みの軽量プロキシを返す（無ければ元ファイル）
+    """
+    http_method_names = ['get', 'head', 'options']
+    record_access = True
+    allow_proxy = True
+
+    def get_media_path(self, file):
+        return file.file_path
+
+    def serve(self, request, file, path):
+        if is_mp4(path) and (file.metadata or {}).get('faststart') is False:
+            # moov が末尾の MP4 は faststart 版のキャッシュがあればそちらを返す
+            faststart_copy = find_faststart_copy(file.id, path)
+            if faststart_copy:
+                return media_file_response(request, faststart_copy, mimetypes.guess_type(path)[0])
+        return media_file_response(request, path)
+
+    def get(self, request, pk):
+        file = get_object_or_404(
+            File.objects.only('id', 'file_path', 'thumbnail_file_path', 'codec', 'metadata'),
+            pk=pk, delete_flag=False,
+        )
+        rel_path = self.get_media_path(file)
+        if not rel_path:
+            raise Http404('Media file not found')
+        path = os.path.join(settings.MEDIA_ROOT, rel_path)
+        try:
+            proxy_path = None
+            if self.allow_proxy and request.GET.get('quality') == 'proxy':
+                proxy_path = find_proxy(file.id, path)
+            if proxy_path:
+                response = media_file_response(request, proxy_path, 'video/mp4')
+            else:
+                response = self.serve(request, file, path)
+        except (FileNotFoundError, IsADirectoryError):
+            raise Http404('Media file not found')
+
+        # 再生開始時だけ記録する（シークごとのレンジ要求では更新しない）
+        range_header = request.META.get('HTTP_RANGE', '')
+        if (
+            self.record_access
+            and response.status_code < 300
+            and (not range_header or range_header.startswith('bytes=0-'))
+        ):
+            File.objects.filter(pk=file.pk).update(last_accessed=timezone.now())
+        return response
+
+    def head(self, request, pk):
+        return self.get(request, pk)
+
+
+class FileRemuxView(FileStreamView):
+    """
+    MKV / AVI / WMV / FLV を fragmented MP4 に詰め替えて配信する（再エンコードなし）
+    変換済みキャッシュがあれば通常のファイル配信、無ければ変換しながら流す
+    """
+
+    def serve(self, request, file, path):
+        st = os.stat(path)
+        if not needs_remux(path):
+            return media_file_response(request, path)
+
+        cache_path = cache_path_for(file.id, st)
+        if os.path.exists(cache_path):
+            cache_touch(cache_path)
+            return media_file_response(request, cache_path, 'video/mp4')
+
+        metadata = file.metadata or {}
+        if 'audio_codec' not in metadata:
+            # 取り込み時に記録していない古いレコードはここで調べて保存
+            info = get_video_info(path) or {}
+            if 'audio_codec' in info:
+                file.metadata = dict(metadata, audio_codec=info['audio_codec'])
+                file.codec = info.get('codec') or file.codec
+                file.save(update_fields=['metadata', 'codec', 'updated_at'])
+        plan = remux_plan(file.codec, (file.metadata or {}).get('audio_codec'))
+        if plan is None:
+            # コピーで済まないコーデックは元ファイルをそのまま返す（再生できるかはブラウザ次第）
+            return media_file_response(request, path)
+
+        if request.method == 'HEAD':
+            response = HttpResponse(content_type='video/mp4')
+        else:
+            response = StreamingHttpResponse(
+                start_remux(request, path, plan, cache_path), content_type='video/mp4'
+            )
+        # 変換中は長さが分からないのでレンジ要求には応じない（キャッシュ完成後は可能）
+        response['Accept-Ranges'] = 'none'
+        response['Cache-Control'] = 'no-store'
+        return response
+
+
+class FileHlsView(View):
+    """
+    HLS 配信（/hls/master.m3u8, /hls/<画質>/index.m3u8, /hls/<画質>/<番号>.ts）
+    プレイリストは長さと解像度から組み立て、セグメントは初回要求時に生成してキャッシュする
+    変換は数秒かかるので非同期ビューにして、同期ビュー用のスレッドを塞がないようにする
+    """
+    http_method_names = ['get', 'head', 'options']
+    PLAYLIST_TYPE = 'application/vnd.apple.mpegurl'
+
+    async def get(self, request, pk, rendition=None, segment=None, playlist=False):
+        try:
+            file = await File.objects.only(
+                'id', 'file_path', 'width', 'height', 'bitrate', 'video_duration'
+            ).aget(pk=pk, delete_flag=False)
+        except File.DoesNotExist:
+            raise Http404('File not found')
+        if not file.video_duration:
+            raise Http404('Video duration is unknown')
+
+        if rendition is None:
+            await File.objects.filter(pk=file.pk).aupdate(last_accessed=timezone.now())
+            return HttpResponse(hls.master_playlist(file), content_type=self.PLAYLIST_TYPE)
+
+        variant = hls.find_rendition(file, rendition)
+        if variant is None:
+            raise Http404('Unknown rendition')
+        if playlist:
+            return HttpResponse(hls.variant_playlist(file.video_duration), content_type=self.PLAYLIST_TYPE)
+
+        path = os.path.join(settings.MEDIA_ROOT, file.file_path)
+        try:
+            segment_path = await sync_to_async(hls.ensure_segment, thread_sensitive=False)(
+                file, path, variant, segment
+            )
+        except (FileNotFoundError, IndexError):
+            raise Http404('Segment not found')
+        except RuntimeError as e:
+            logger.error(str(e))
+            return HttpResponse(status=status.HTTP_502_BAD_GATEWAY)
+        cache_touch(segment_path)
+        return media_file_response(request, segment_path, 'video/mp2t')
+
+    async def head(self, request, *args, **kwargs):
+        return await self.get(request, *args, **kwargs)
+
+
+class FileThumbnailView(FileStreamView):
+    """サムネイル画像の配信（動画と同じく MEDIA_OFFLOAD に従う）"""
+    record_access = False
+    allow_proxy = False
+
+    def get_media_path(self, file):
+        return file.thumbnail_file_path
+
+
 class ScanView(APIView):
     """ファイルスキャンビュー"""
     
     def get(self, request, format=None):
         """強制スキャンを実行"""
         logger.info("Starting forced file scan...")
+        # 重複フラグの更新もスキャン内で行われる
         scan_history = scan_video_directory()
         
-        # 重複チェック
-        check_and_mark_duplicates()
-        
         serializer = ScanHistorySerializer(scan_history)
         return Response(serializer.data)
 
 
+class LibrarySummaryView(APIView):
+    """ライブラリの件数・合計サイズ・合計時間（集計済みの 1 行を読むだけ）"""
+
+    def get(self, request, format=None):
+        return Response(counters.summary())
+
+
 class ScanHistoryViewSet(viewsets.ReadOnlyModelViewSet):
     """スキャン履歴ビューセット"""
     queryset = ScanHistory.objects.all()
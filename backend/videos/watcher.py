@@ -0,0 +1,201 @@
+# backend/videos/watcher.py
+"""
+Live filesystem watcher for VIDEO_DIR (watchdog).
+
+作成・移動・変更イベントを受け取ったパスだけを取り込みパイプラインに流す。
+コピー途中のファイルはサイズが安定するまで（FILE_WATCH_DEBOUNCE 秒変化なし）待ってから処理する。
+"""
+
+import os
+import time
+import logging
+import threading
+
+from django.conf import settings
+
+logger = logging.getLogger("videos")
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+    from watchdog.observers.polling import PollingObserver
+except ImportError:  # watchdog 未インストールでもスキャン自体は動かす
+    FileSystemEventHandler = object
+    Observer = PollingObserver = None
+
+
+def _is_video(path: str) -> bool:
+    from .utils import VIDEO_EXTS
+
+    return any(path.lower().endswith(ext) for ext in VIDEO_EXTS)
+
+
+def _rel(path: str) -> str:
+    return os.path.relpath(path, settings.MEDIA_ROOT).replace("\\", "/")
+
+
+class _VideoEventHandler(FileSystemEventHandler):
+    """watchdog のイベントを VideoWatcher の保留キューに積むだけのハンドラ"""
+
+    def __init__(self, watcher: "VideoWatcher"):
+        super().__init__()
+        self.watcher = watcher
+
+    def on_created(self, event):
+        if event.is_directory:
+            # フォルダごとコピーされた場合、中身のイベントが来ないことがあるので走査しておく
+            self.watcher.touch_tree(event.src_path)
+        elif _is_video(event.src_path):
+            self.watcher.touch(event.src_path)
+
+    def on_modified(self, event):
+        if not event.is_directory and _is_video(event.src_path):
+            self.watcher.touch(event.src_path)
+
+    def on_moved(self, event):
+        if event.is_directory:
+            # 配下ファイルの移動イベントは watchdog が個別に発行する
+            return
+        if _is_video(event.dest_path):
+            if _is_video(event.src_path):
+                self.watcher.rename(event.src_path, event.dest_path)
+            else:
+                # 一時ファイル名からのリネーム（ダウンロード完了など）は新規扱い
+                self.watcher.touch(event.dest_path)
+
+
+class VideoWatcher:
+    """
+    VIDEO_DIR を監視し、変化のあったパスだけを ingest_paths() に渡す。
+    削除イベントはスキャン同様 DB を変更しないので購読しない。
+    """
+
+    def __init__(self, path: str | None = None, debounce: float | None = None, polling: bool | None = None):
+        self.path = path or settings.VIDEO_DIR
+        self.debounce = debounce if debounce is not None else getattr(settings, "FILE_WATCH_DEBOUNCE", 5.0)
+        # NAS（SMB/NFS）上では inotify 等が効かないためポーリングに切り替える
+        self.polling = polling if polling is not None else getattr(settings, "FILE_WATCH_POLLING", False)
+        self._lock = threading.Lock()
+        # abs_path -> (最終イベント時刻, 最後に確認したサイズ)
+        self._pending: dict[str, tuple[float, int | None]] = {}
+        # dest_abs_path -> src_abs_path
+        self._renames: dict[str, str] = {}
+        self._observer = None
+        self._stop = threading.Event()
+        self._flusher: threading.Thread | None = None
+
+    # ------------------------------------------------------------------
+    # イベント受付
+    # ------------------------------------------------------------------
+    def touch(self, abs_path: str) -> None:
+        with self._lock:
+            self._pending[abs_path] = (time.monotonic(), None)
+
+    def touch_tree(self, abs_dir: str) -> None:
+        for root, _, files in os.walk(abs_dir):
+            for name in files:
+                if _is_video(name):
+                    self.touch(os.path.join(root, name))
+
+    def rename(self, src_path: str, dest_path: str) -> None:
+        with self._lock:
+            # 連続リネーム（a -> b -> c）は最初の移動元を保つ
+            origin = self._renames.pop(src_path, src_path)
+            self._pending.pop(src_path, None)
+            self._renames[dest_path] = origin
+            self._pending[dest_path] = (time.monotonic(), None)
+
+    # ------------------------------------------------------------------
+    # 起動・停止
+    # ------------------------------------------------------------------
+    def start(self) -> bool:
+        if Observer is None:
+            logger.warning("watchdog is not installed; file watcher disabled.")
+            return False
+        os.makedirs(self.path, exist_ok=True)
+        observer_cls = PollingObserver if self.polling else Observer
+        self._observer = observer_cls()
+        self._observer.schedule(_VideoEventHandler(self), self.path, recursive=True)
+        self._observer.daemon = True
+        self._observer.start()
+        self._flusher = threading.Thread(target=self._flush_loop, daemon=True, name="videos.watcher.flush")
+        self._flusher.start()
+        logger.info("Watching %s for new videos (%s, debounce=%ss).",
+                    self.path, "polling" if self.polling else "native", self.debounce)
+        return True
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+        if self._flusher is not None:
+            self._flusher.join()
+
+    # ------------------------------------------------------------------
+    # デバウンスと取り込み
+    # ------------------------------------------------------------------
+    def _take_ready(self) -> tuple[list[str], list[tuple[str, str]]]:
+        """
+        最終イベントから debounce 秒経過し、かつサイズが前回確認時から変わっていない
+        パスを取り出す。サイズが変わっていれば（コピー中）待ち時間をリセットする。
+        """
+        now = time.monotonic()
+        ready: list[str] = []
+        renames: list[tuple[str, str]] = []
+        with self._lock:
+            for abs_path, (last_event, last_size) in list(self._pending.items()):
+                if now - last_event < self.debounce:
+                    continue
+                try:
+                    size = os.path.getsize(abs_path)
+                except OSError:
+                    # 処理前に消えた
+                    self._pending.pop(abs_path, None)
+                    self._renames.pop(abs_path, None)
+                    continue
+                if size != last_size:
+                    self._pending[abs_path] = (now, size)
+                    continue
+                self._pending.pop(abs_path)
+                origin = self._renames.pop(abs_path, None)
+                if origin is not None:
+                    renames.append((_rel(origin), _rel(abs_path)))
+                else:
+                    ready.append(_rel(abs_path))
+        return ready, renames
+
+    def _flush_loop(self) -> None:
+        from django.db import connection
+        from .utils import ingest_paths, check_and_mark_duplicates
+
+        interval = max(0.5, min(self.debounce, 2.0))
+        while not self._stop.wait(interval):
+            ready, renames = self._take_ready()
+            if not ready and not renames:
+                continue
+            try:
+                result = ingest_paths(ready, renames)
+                if result.touched_sizes:
+                    check_and_mark_duplicates(sizes=result.touched_sizes)
+                logger.info(
+                    f"Watcher ingested {len(ready) + len(renames)} paths: "
+                    f"{result.added} added, {result.updated} updated, {len(result.errors)} errors"
+                )
+            except Exception:
+                logger.exception("Watcher ingest failed.")
+            finally:
+                connection.close()
+
+
+def start_watcher() -> VideoWatcher | None:
+    """FILE_WATCH_ENABLED が有効なら監視を開始して VideoWatcher を返す"""
+    if not getattr(settings, "FILE_WATCH_ENABLED", True):
+        return None
+    watcher = VideoWatcher()
+    try:
+        if watcher.start():
+            return watcher
+    except Exception:
+        logger.exception("Failed to start file watcher.")
+    return None
@@ -361,6 +361,70 @@ function SettingsDialog({ open, onClose }) {
                                 </FormControl>
                             </ListItemSecondaryAction>
                         </ListItem>
+                        <ListItem>
+                            <ListItemText
+                                primary="配信方式"
+                                secondary="HLS は回線に合わせて画質を自動で切り替えます"
+                            />
+                            <ListItemSecondaryAction>
+                                <FormControl
+                                    variant="outlined"
+                                    size="small"
+                                    sx={{ minWidth: 120 }}
+                                >
+                                    <Select
+                                        value={
+                                            playerSettings.streamingMode ||
+                                            "direct"
+                                        }
+                                        onChange={(e) =>
+                                            handlePlayerSettingChange(
+                                                "streamingMode",
+                                                e.target.value
+                                            )
+                                        }
+                                    >
+                                        <MenuItem value="direct">
+                                            元ファイル
+                                        </MenuItem>
+                                        <MenuItem value="hls">HLS</MenuItem>
+                                    </Select>
+                                </FormControl>
+                            </ListItemSecondaryAction>
+                        </ListItem>
+                        <ListItem>
+                            <ListItemText
+                                primary="マルチビューの画質"
+                                secondary="軽量版は 360p のプロキシを再生します（未生成なら元ファイル）"
+                            />
+                            <ListItemSecondaryAction>
+                                <FormControl
+                                    variant="outlined"
+                                    size="small"
+                                    sx={{ minWidth: 120 }}
+                                >
+                                    <Select
+                                        value={
+                                            playerSettings.multiPlayerQuality ||
+                                            "proxy"
+                                        }
+                                        onChange={(e) =>
+                                            handlePlayerSettingChange(
+                                                "multiPlayerQuality",
+                                                e.target.value
+                                            )
+                                        }
+                                    >
+                                        <MenuItem value="proxy">
+                                            軽量版
+                                        </MenuItem>
+                                        <MenuItem value="original">
+                                            元ファイル
+                                        </MenuItem>
+                                    </Select>
+                                </FormControl>
+                            </ListItemSecondaryAction>
+                        </ListItem>
                     </List>
                 </TabPanel>
 
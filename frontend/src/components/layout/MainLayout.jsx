@@ -1,4 +1,4 @@
-import React, { useState } from "react";
+import React, { useCallback, useEffect, useState } from "react";
 import { useNavigate, useLocation } from "react-router-dom";
 import { useAtom } from "jotai";
 import {
@@ -44,6 +44,7 @@ const drawerWidth = 240;
 const menuItems = [
     {
         id: "all-files",
+        summaryKey: "file_count",
         path: "/all-files",
         label: "全ファイル",
         icon: <VideoLibraryIcon />,
@@ -51,6 +52,7 @@ const menuItems = [
     },
     {
         id: "no-folder",
+        summaryKey: "no_folder_count",
         path: "/no-folder",
         label: "フォルダに存在しない",
         icon: <FolderOffIcon />,
@@ -65,6 +67,7 @@ const menuItems = [
     },
     {
         id: "deleted",
+        summaryKey: "deleted_count",
         path: "/deleted",
         label: "削除ファイル一覧",
         icon: <DeleteIcon />,
@@ -72,6 +75,7 @@ const menuItems = [
     },
     {
         id: "duplicates",
+        summaryKey: "duplicate_count",
         path: "/duplicates",
         label: "重複ファイル一覧",
         icon: <FileCopyIcon />,
@@ -88,6 +92,20 @@ function MainLayout({ children }) {
     const [drawerOpen, setDrawerOpen] = useState(false);
     const [settingsOpen, setSettingsOpen] = useState(false);
     const [searchOpen, setSearchOpen] = useState(false);
+    const [summary, setSummary] = useState(null);
+
+    // サイドバーの件数（集計済みの値を 1 リクエストで取得）
+    const loadSummary = useCallback(async () => {
+        try {
+            setSummary(await systemAPI.getSummary());
+        } catch (error) {
+            setSummary(null);
+        }
+    }, []);
+
+    useEffect(() => {
+        loadSummary();
+    }, [loadSummary, location.pathname]);
 
     const handleDrawerToggle = () => {
         setDrawerOpen(!drawerOpen);
@@ -107,6 +125,7 @@ function MainLayout({ children }) {
                 message: `スキャン完了: ${result.files_added}個のファイルを追加、${result.files_updated}個を更新`,
                 severity: "success",
             });
+            loadSummary();
         } catch (error) {
             setNotification({
                 open: true,
@@ -155,7 +174,13 @@ function MainLayout({ children }) {
                                     )}
                                 </ListItemIcon>
                                 <ListItemText
-                                    primary={item.label}
+                                    primary={
+                                        item.summaryKey && summary
+                                            ? `${item.label} (${summary[
+                                                  item.summaryKey
+                                              ].toLocaleString()})`
+                                            : item.label
+                                    }
                                     secondary={item.description}
                                 />
                             </ListItemButton>
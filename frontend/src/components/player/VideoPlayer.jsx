@@ -42,7 +42,7 @@ import {
     openPlayersAtom,
     notificationAtom,
 } from "@store/atoms";
-import { fileAPI, getVideoUrl } from "@services/api";
+import { fileAPI, getVideoUrl, getHlsUrl } from "@services/api";
 import { formatTime } from "@utils/format";
 
 function VideoPlayer({
@@ -52,7 +52,8 @@ function VideoPlayer({
     onPrev,
     isMultiPlayer = false,
     aspectRatioFit: propsAspectRatioFit,
-    onAspectRatioFitChange
+    onAspectRatioFitChange,
+    streamingMode: propsStreamingMode,
 }) {
     const videoRef = useRef(null);
     const containerRef = useRef(null);
@@ -112,8 +113,98 @@ function VideoPlayer({
         }
     );
 
-    // 動画URL取得
-    const videoUrl = getVideoUrl(file);
+    // 動画URL取得（HLS モードではマスタープレイリストを hls.js / ネイティブ再生に渡す）
+    // マルチビューでは既定で軽量プロキシを再生する（同時再生の負荷を抑える）
+    const useProxy =
+        isMultiPlayer &&
+        (playerSettings.multiPlayerQuality || "proxy") === "proxy";
+    const streamingMode = useProxy
+        ? "direct"
+        : propsStreamingMode || playerSettings.streamingMode || "direct";
+    const hlsUrl = streamingMode === "hls" ? getHlsUrl(file) : null;
+    const videoUrl = getVideoUrl(file, useProxy ? { quality: "proxy" } : {});
+
+    useEffect(() => {
+        const video = videoRef.current;
+        if (!video || !hlsUrl) return;
+
+        // Safari はネイティブで HLS を再生できる
+        if (video.canPlayType("application/vnd.apple.mpegurl")) {
+            video.src = hlsUrl;
+            return;
+        }
+
+        let hls = null;
+        let cancelled = false;
+        import("hls.js").then(({ default: Hls }) => {
+            if (cancelled) return;
+            if (!Hls.isSupported()) {
+                video.src = videoUrl;
+                return;
+            }
+            hls = new Hls();
+            hls.loadSource(hlsUrl);
+            hls.attachMedia(video);
+            hls.on(Hls.Events.MANIFEST_PARSED, () => {
+                if (playerSettings.autoPlay) {
+                    video.play().catch(() => {});
+                }
+            });
+        });
+        return () => {
+            cancelled = true;
+            if (hls) {
+                hls.destroy();
+            }
+        };
+    }, [hlsUrl]);
+
+    // シークプレビュー（取り込み時に生成したストーリーボードのスプライトを使う）
+    const [storyboard, setStoryboard] = useState(null);
+    const [seekPreview, setSeekPreview] = useState(null);
+    // 複製したプレイヤーの id は "<id>_<timestamp>" 形式
+    const storyboardFileId = file?.id ? String(file.id).split("_")[0] : null;
+
+    useEffect(() => {
+        setStoryboard(null);
+        if (!storyboardFileId) return;
+
+        let cancelled = false;
+        fileAPI
+            .getStoryboard(storyboardFileId)
+            .then((data) => {
+                if (cancelled) return;
+                setStoryboard(data);
+                // シート画像は先読みしておき、ホバー時はキャッシュから表示する
+                data.sheets.forEach((url) => {
+                    const img = new Image();
+                    img.src = url;
+                });
+            })
+            .catch(() => {
+                // 未生成の場合はプレビューなし
+            });
+        return () => {
+            cancelled = true;
+        };
+    }, [storyboardFileId]);
+
+    const handleSeekHover = (e) => {
+        if (!storyboard?.cues?.length || !duration) return;
+        const rect = e.currentTarget.getBoundingClientRect();
+        const ratio = Math.min(Math.max((e.clientX - rect.left) / rect.width, 0), 1);
+        const time = ratio * duration;
+        const index = Math.min(
+            Math.floor(time / storyboard.interval),
+            storyboard.cues.length - 1
+        );
+        setSeekPreview({
+            time,
+            left: ratio * rect.width,
+            width: rect.width,
+            cue: storyboard.cues[index],
+        });
+    };
 
     // 初期化
     useEffect(() => {
@@ -472,7 +563,7 @@ function VideoPlayer({
             {/* ビデオ要素 */}
             <video
                 ref={videoRef}
-                src={videoUrl}
+                src={hlsUrl ? undefined : videoUrl}
                 style={{
                     width: "100%",
                     height: "100%",
@@ -515,19 +606,58 @@ function VideoPlayer({
                 >
                     {/* シークバー */}
                     <Box sx={{ px: 2, mb: 1 }}>
-                        <Slider
-                            value={currentTime}
-                            max={duration}
-                            onChange={(e, value) => handleSeek(value)}
-                            sx={{
-                                "& .MuiSlider-rail": {
-                                    opacity: 0.28,
-                                },
-                                "& .MuiSlider-track": {
-                                    border: "none",
-                                },
-                            }}
-                        />
+                        <Box
+                            sx={{ position: "relative" }}
+                            onMouseMove={handleSeekHover}
+                            onMouseLeave={() => setSeekPreview(null)}
+                        >
+                            {seekPreview && storyboard && (
+                                <Box
+                                    sx={{
+                                        position: "absolute",
+                                        bottom: "100%",
+                                        left: Math.min(
+                                            Math.max(
+                                                seekPreview.left - seekPreview.cue.w / 2,
+                                                0
+                                            ),
+                                            Math.max(seekPreview.width - seekPreview.cue.w, 0)
+                                        ),
+                                        mb: 1,
+                                        pointerEvents: "none",
+                                        textAlign: "center",
+                                    }}
+                                >
+                                    <Box
+                                        sx={{
+                                            width: seekPreview.cue.w,
+                                            height: seekPreview.cue.h,
+                                            backgroundImage: `url("${storyboard.sheets[seekPreview.cue.sheet]}")`,
+                                            backgroundPosition: `-${seekPreview.cue.x}px -${seekPreview.cue.y}px`,
+                                            backgroundRepeat: "no-repeat",
+                                            border: "1px solid rgba(255,255,255,0.6)",
+                                            borderRadius: 1,
+                                        }}
+                                    />
+                                    <Typography variant="caption">
+                                        {formatTime(seekPreview.time)}
+                                    </Typography>
+                                </Box>
+                            )}
+                            <Slider
+                                value={currentTime}
+                                max={duration}
+                                onChange={(e, value) => handleSeek(value)}
+                                sx={{
+                                    "& .MuiSlider-rail": {
+                                        opacity: 0.28,
+                                    },
+                                    "& .MuiSlider-track": {
+                                        border: "none",
+                                    },
+                                }}
+                            />
+                        </Box>
                         <Box
                             sx={{
                                 display: "flex",
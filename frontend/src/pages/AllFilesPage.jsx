@@ -34,7 +34,8 @@ function AllFilesPage() {
     const [playerMode] = useAtom(playerModeAtom);
 
     const [files, setFiles] = useState([]);
-    const [page, setPage] = useState(1);
+    // 次ページのカーソル（レスポンスの next に含まれる）
+    const [cursor, setCursor] = useState(null);
     const [hasMore, setHasMore] = useState(true);
     const [totalCount, setTotalCount] = useState(0);
 
@@ -50,8 +51,10 @@ function AllFilesPage() {
             setLoading(true);
             try {
                 const params = {
-                    page: reset ? 1 : page,
+                    cursor: reset ? undefined : cursor,
                     page_size: 100,
+                    // 総件数は先頭ページでだけ数える
+                    count: reset ? true : undefined,
                     search: searchQuery,
                     sort_by: `${sortSettings.order === "desc" ? "-" : ""}${
                         sortSettings.field
@@ -62,17 +65,27 @@ function AllFilesPage() {
 
                 if (reset) {
                     setFiles(response.results || response);
-                    setPage(2);
                 } else {
                     setFiles((prev) => [
                         ...prev,
                         ...(response.results || response),
                     ]);
-                    setPage((prev) => prev + 1);
                 }
 
-                setHasMore(response.next !== null);
-                setTotalCount(response.count || response.length);
+                setCursor(
+                    response.next
+                        ? new URL(
+                              response.next,
+                              window.location.origin
+                          ).searchParams.get("cursor")
+                        : null
+                );
+                setHasMore(Boolean(response.next));
+                if (response.count !== undefined) {
+                    setTotalCount(response.count);
+                } else if (!response.results) {
+                    setTotalCount(response.length);
+                }
             } catch (error) {
                 console.error("Failed to fetch files:", error);
                 setNotification({
@@ -84,7 +97,7 @@ function AllFilesPage() {
                 setLoading(false);
             }
         },
-        [page, searchQuery, sortSettings, loading, setLoading, setNotification]
+        [cursor, searchQuery, sortSettings, loading, setLoading, setNotification]
     );
 
     // 初回読み込み & 検索・ソート変更時
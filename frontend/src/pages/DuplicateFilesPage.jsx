@@ -1,4 +1,4 @@
-import React, { useState, useEffect, useCallback } from "react";
+import React, { useState, useEffect, useCallback, useMemo } from "react";
 import { useAtom } from "jotai";
 import { Box, Typography, Chip } from "@mui/material";
 
@@ -10,7 +10,6 @@ import {
     multiSelectModeAtom,
     selectedFilesAtom,
     searchQueryAtom,
-    sortSettingsAtom,
     loadingAtom,
     notificationAtom,
 } from "@store/atoms";
@@ -22,53 +21,76 @@ function DuplicateFilesPage() {
     const [multiSelectMode] = useAtom(multiSelectModeAtom);
     const [selectedFiles, setSelectedFiles] = useAtom(selectedFilesAtom);
     const [searchQuery] = useAtom(searchQueryAtom);
-    const [sortSettings] = useAtom(sortSettingsAtom);
     const [loading, setLoading] = useAtom(loadingAtom);
     const [, setNotification] = useAtom(notificationAtom);
 
     const [files, setFiles] = useState([]);
-    const [duplicateGroups, setDuplicateGroups] = useState([]);
+    // 次ページのカーソル（レスポンスの next に含まれる）
+    const [cursor, setCursor] = useState(null);
+    const [hasMore, setHasMore] = useState(true);
 
-    const fetchFiles = useCallback(async () => {
-        setLoading(true);
-        try {
-            const response = await fileAPI.getDuplicateFiles({
-                search: searchQuery,
-                sort_by: `${sortSettings.order === "desc" ? "-" : ""}${
-                    sortSettings.field
-                }`,
-            });
+    // sort_by は送らない（サーバー側の既定 duplicate_group 順で、同じグループが連続して届く）
+    const fetchFiles = useCallback(
+        async (reset = false) => {
+            if (loading) return;
 
-            const allFiles = response.results || response;
-            setFiles(allFiles);
-
-            // 重複グループを作成（MD5ハッシュでグループ化）
-            const groups = {};
-            allFiles.forEach((file) => {
-                const key = `${file.md5_hash}_${file.file_size}`;
-                if (!groups[key]) {
-                    groups[key] = [];
-                }
-                groups[key].push(file);
-            });
+            setLoading(true);
+            try {
+                const response = await fileAPI.getDuplicateFiles({
+                    cursor: reset ? undefined : cursor,
+                    page_size: 100,
+                    search: searchQuery,
+                });
 
-            setDuplicateGroups(
-                Object.values(groups).filter((group) => group.length > 1)
-            );
-        } catch (error) {
-            setNotification({
-                open: true,
-                message: "ファイルの取得に失敗しました",
-                severity: "error",
-            });
-        } finally {
-            setLoading(false);
-        }
-    }, [searchQuery, sortSettings, setLoading, setNotification]);
+                const results = response.results || response;
+                setFiles((prev) => (reset ? results : [...prev, ...results]));
+                setCursor(
+                    response.next
+                        ? new URL(
+                              response.next,
+                              window.location.origin
+                          ).searchParams.get("cursor")
+                        : null
+                );
+                setHasMore(Boolean(response.next));
+            } catch (error) {
+                setNotification({
+                    open: true,
+                    message: "ファイルの取得に失敗しました",
+                    severity: "error",
+                });
+            } finally {
+                setLoading(false);
+            }
+        },
+        [cursor, searchQuery, loading, setLoading, setNotification]
+    );
 
+    // 初回読み込み & 検索変更時
     useEffect(() => {
-        fetchFiles();
-    }, [fetchFiles]);
+        fetchFiles(true);
+    }, [searchQuery]);
+
+    // 重複グループを作成（サーバー側で確定した duplicate_group でグループ化）
+    // 読み込み済みの全ページでまとめるので、ページ境界で分かれたグループも次のページで揃う
+    const duplicateGroups = useMemo(() => {
+        const groups = {};
+        files.forEach((file) => {
+            const key =
+                file.duplicate_group || `${file.md5_hash}_${file.file_size}`;
+            if (!groups[key]) {
+                groups[key] = [];
+            }
+            groups[key].push(file);
+        });
+        return Object.values(groups).filter((group) => group.length > 1);
+    }, [files]);
+
+    const handleLoadMore = useCallback(() => {
+        if (hasMore && !loading) {
+            fetchFiles(false);
+        }
+    }, [hasMore, loading, fetchFiles]);
 
     const handleFileSelect = useCallback(
         (file) => {
@@ -91,7 +113,7 @@ function DuplicateFilesPage() {
                     重複ファイル ({files.length}件)
                 </Typography>
                 <Typography variant="body2" color="text.secondary">
-                    同じMD5ハッシュとファイルサイズを持つファイルです
+                    ファイルサイズと内容が完全に一致するファイルです
                 </Typography>
                 {duplicateGroups.length > 0 && (
                     <Chip
@@ -116,8 +138,8 @@ function DuplicateFilesPage() {
                         selectedFiles={selectedFiles}
                         onFileSelect={handleFileSelect}
                         onContextMenu={() => {}}
-                        onLoadMore={() => {}}
-                        hasMore={false}
+                        onLoadMore={handleLoadMore}
+                        hasMore={hasMore}
                         loading={loading}
                     />
                 ) : (
@@ -126,8 +148,8 @@ function DuplicateFilesPage() {
                         selectedFiles={selectedFiles}
                         onFileSelect={handleFileSelect}
                         onContextMenu={() => {}}
-                        onLoadMore={() => {}}
-                        hasMore={false}
+                        onLoadMore={handleLoadMore}
+                        hasMore={hasMore}
                         loading={loading}
                     />
                 )}
@@ -67,6 +67,11 @@ export const fileAPI = {
         return api.get(`/files/${id}/`);
     },
 
+    // ストーリーボード（シークプレビュー用スプライトの索引）取得
+    getStoryboard: (id) => {
+        return api.get(`/files/${id}/storyboard/`);
+    },
+
     // ファイル更新
     updateFile: (id, data) => {
         return api.patch(`/files/${id}/`, data);
@@ -212,6 +217,11 @@ export const systemAPI = {
         return api.get("/force_refresh/");
     },
 
+    // ライブラリの件数・合計サイズ・合計時間
+    getSummary: () => {
+        return api.get("/summary/");
+    },
+
     // スキャン履歴取得
     getScanHistory: () => {
         return api.get("/scan-history/");
@@ -241,15 +251,36 @@ export const getThumbnailUrl = (file) => {
     return null;
 };
 
-// 動画URL生成ヘルパー
-export const getVideoUrl = (file) => {
+// ブラウザが直接再生できないコンテナ（サーバー側で fragmented MP4 に詰め替える）
+const REMUX_EXTS = [".mkv", ".avi", ".wmv", ".flv"];
+
+// 動画URL生成ヘルパー（Range 対応の配信エンドポイントを使う）
+// quality: "proxy" を指定するとマルチビュー用の軽量プロキシ（未生成なら元ファイル）
+export const getVideoUrl = (file, { quality } = {}) => {
     if (file.video_url) {
         return file.video_url;
     }
+    if (file.id) {
+        // 複製したプレイヤーの id は "<id>_<timestamp>" 形式
+        const id = String(file.id).split("_")[0];
+        const path = (file.file_path || file.file_name || "").toLowerCase();
+        const endpoint = REMUX_EXTS.some((ext) => path.endsWith(ext))
+            ? "remux"
+            : "stream";
+        const query = quality ? `?quality=${quality}` : "";
+        return `${API_BASE_URL}/files/${id}/${endpoint}/${query}`;
+    }
     if (file.file_path) {
         return getMediaUrl(file.file_path);
     }
     return null;
 };
 
+// HLS マスタープレイリストURL生成ヘルパー
+export const getHlsUrl = (file) => {
+    if (!file?.id) return null;
+    const id = String(file.id).split("_")[0];
+    return `${API_BASE_URL}/files/${id}/hls/master.m3u8`;
+};
+
 export default api;
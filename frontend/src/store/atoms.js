@@ -43,6 +43,8 @@ export const playerSettingsAtom = atomWithStorage("playerSettings", {
     skipSeconds: 5, // ダブルタップでスキップする秒数
     longPressSpeed: 2.0, // 長押し時の倍速
     aspectRatioFit: "contain", // 'contain' or 'cover'
+    streamingMode: "direct", // 'direct'（元ファイル）or 'hls'（画質自動切替）
+    multiPlayerQuality: "proxy", // マルチビューの画質 'proxy'（軽量版）or 'original'
     abLoop: {
         enabled: false,
         start: null,